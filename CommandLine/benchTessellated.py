@@ -0,0 +1,102 @@
+import sys
+import time
+import argparse
+
+# Compare per face construction of tessellated solids with the bulk
+# construction used by GDMLTessellated & GDMLSampledTessellated
+#
+# Usage: python benchTessellated.py [--sizes 10000 100000 1000000]
+#                                   [--per-face-limit N]
+#                                   [--freecad-lib path]
+#
+# FreeCAD is located like gdmlBatch.py does, from --freecad-lib, the
+# FREECAD_LIB environment variable or the usual install paths
+
+from gdmlBatch import freecadPaths
+
+parser = argparse.ArgumentParser(description="Tessellated solid benchmark")
+parser.add_argument(
+    "--sizes", type=int, nargs="+", default=[10000, 100000, 1000000]
+)
+parser.add_argument(
+    "--per-face-limit",
+    type=int,
+    default=1000000,
+    help="skip the per face construction above this many facets",
+)
+parser.add_argument(
+    "--freecad-lib",
+    action="append",
+    default=[],
+    help="folder containing FreeCAD.so / FreeCAD.pyd",
+)
+args = parser.parse_args()
+sys.path.extend(freecadPaths(args.freecad_lib))
+
+try:
+    import FreeCAD
+except ImportError:
+    print("FreeCAD module not found - use --freecad-lib or FREECAD_LIB")
+    sys.exit(1)
+import Part
+import numpy as np
+
+from freecad.gdml import GDMLShared
+
+
+def torus(nFacets, R=100.0, r=30.0):
+    # closed triangulated torus with about nFacets facets
+    nu = max(3, int(np.sqrt(nFacets / 2)))
+    nv = max(3, int(nFacets / (2 * nu)))
+    u = np.linspace(0, 2 * np.pi, nu, endpoint=False)
+    v = np.linspace(0, 2 * np.pi, nv, endpoint=False)
+    uu, vv = np.meshgrid(u, v, indexing="ij")
+    x = (R + r * np.cos(vv)) * np.cos(uu)
+    y = (R + r * np.cos(vv)) * np.sin(uu)
+    z = r * np.sin(vv)
+    coords = np.stack([x, y, z], axis=-1).reshape(-1, 3)
+    i = np.arange(nu).reshape(-1, 1)
+    j = np.arange(nv).reshape(1, -1)
+    a = (i * nv + j).ravel()
+    b = (((i + 1) % nu) * nv + j).ravel()
+    c = (((i + 1) % nu) * nv + (j + 1) % nv).ravel()
+    d = (i * nv + (j + 1) % nv).ravel()
+    tris = np.concatenate(
+        [np.stack([a, b, c], axis=1), np.stack([a, c, d], axis=1)]
+    )
+    vertex = [FreeCAD.Vector(*p) for p in coords.tolist()]
+    return vertex, tris.tolist()
+
+
+def perFace(vertex, facets):
+    faces = [
+        GDMLShared.triangle(vertex[f[0]], vertex[f[1]], vertex[f[2]])
+        for f in facets
+    ]
+    return Part.Solid(Part.makeShell(faces))
+
+
+def bulk(vertex, facets):
+    return GDMLShared.bulkSolid(vertex, facets)
+
+
+def timeIt(func, vertex, facets):
+    start = time.perf_counter()
+    shape = func(vertex, facets)
+    return time.perf_counter() - start, shape
+
+
+print(f"{'facets':>10} {'per face (s)':>14} {'bulk (s)':>10} {'speedup':>8}")
+for size in args.sizes:
+    vertex, facets = torus(size)
+    tBulk, shape = timeIt(bulk, vertex, facets)
+    if not shape.isValid():
+        print(f"bulk shape for {len(facets)} facets is not valid")
+    if len(facets) <= args.per_face_limit:
+        tFace, shape = timeIt(perFace, vertex, facets)
+        print(
+            f"{len(facets):>10} {tFace:>14.3f} {tBulk:>10.3f} "
+            f"{tFace / tBulk:>8.1f}"
+        )
+    else:
+        print(f"{len(facets):>10} {'skipped':>14} {tBulk:>10.3f} {'-':>8}")
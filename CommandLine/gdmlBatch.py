@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+#
+# Batch import of GDML files with headless FreeCAD
+#
+# Each GDML file is imported through importGDML.processGDML in its own
+# FreeCAD worker process, so a crash or hang only fails that file, and
+# written as FCStd / STEP / BREP. Per file timings, the console log of
+# each worker and a summary (batch_summary.json) go to the output folder.
+# Files found in an input folder keep their sub folders in the output
+# folder, clashing names get a _2, _3 ... suffix.
+#
+# Usage: gdmlBatch.py [-o outdir] [-f fcstd,step,brep] [-j workers]
+#                     [--freecad-lib path] [--timeout secs]
+#                     [--region xmin,ymin,zmin,xmax,ymax,zmax]
+#                     [--volumes vol1,vol2] files/dirs ...
+#
+# --region / --volumes only import the physvols in a box (mm) or the
+# subtrees of the named volumes, see importRegion.py
+#
+# FreeCAD's lib folder is found from --freecad-lib, the FREECAD_LIB
+# environment variable (os.pathsep separated) or the usual install paths
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+resultTag = "GDMLBATCH "
+
+defaultLibs = [
+    "/usr/lib/freecad/lib",
+    "/usr/lib/freecad-daily/lib",
+    "/usr/local/lib/freecad/lib",
+    "/Applications/FreeCAD.app/Contents/Resources/lib",
+    "C:/Program Files/FreeCAD/bin",
+]
+
+
+def freecadPaths(libs):
+    paths = list(libs)
+    env = os.environ.get("FREECAD_LIB", "")
+    paths.extend(p for p in env.split(os.pathsep) if p)
+    paths.extend(p for p in defaultLibs if os.path.isdir(p))
+    # workbench source tree when not installed via setup.py
+    paths.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return paths
+
+
+def findGDMLFiles(inputs):
+    # (file, output name) pairs, the output name (no extension, relative
+    # to the output folder) keeps the folder structure below an input
+    # folder and is made unique so outputs & logs never overwrite
+    files = []
+    for name in inputs:
+        if os.path.isdir(name):
+            for dirPath, dirs, fileNames in os.walk(name):
+                dirs.sort()
+                for f in sorted(fileNames):
+                    if f.lower().endswith(".gdml"):
+                        path = os.path.join(dirPath, f)
+                        files.append((path, os.path.relpath(path, name)))
+        else:
+            files.append((name, os.path.basename(name)))
+    ret = []
+    used = set()
+    for path, rel in files:
+        outName = os.path.splitext(os.path.normpath(rel))[0]
+        unique = outName
+        n = 1
+        while unique.lower() in used:
+            n += 1
+            unique = f"{outName}_{n}"
+        if unique != outName:
+            print(f"{path} written as {unique} to avoid overwriting")
+        used.add(unique.lower())
+        ret.append((path, unique))
+    return ret
+
+
+def convertFile(
+    filename, outDir, formats, box=None, volumes=None, outName=None
+):
+    # Runs in the worker process, returns result dictionary
+    result = {"file": filename, "status": "ok", "times": {}, "outputs": []}
+    start = time.perf_counter()
+    import FreeCAD
+    import Part
+    from freecad.gdml import importGDML
+
+    result["times"]["startup"] = time.perf_counter() - start
+    baseName = os.path.splitext(os.path.basename(filename))[0]
+    if outName is None:
+        outName = baseName
+    doc = FreeCAD.newDocument(baseName)
+    region = None
+    if box or volumes:
+        from freecad.gdml.importRegion import ImportRegion
+
+        region = ImportRegion(box, volumes)
+    t = time.perf_counter()
+    importGDML.processGDML(
+        doc, True, os.path.abspath(filename), False, 1, False, region
+    )
+    result["times"]["import"] = time.perf_counter() - t
+    world = None
+    for obj in doc.Objects:
+        if obj.TypeId == "App::Part":
+            world = obj
+            break
+    if world is None:
+        raise RuntimeError("No world volume found")
+    outBase = os.path.join(outDir, outName)
+    if "step" in formats or "brep" in formats:
+        from freecad.gdml.GDMLObjects import deferredShapes
+
+        # real shapes of solids deferred by lazyShapes
+        deferredShapes.materialiseAll(doc)
+    if "fcstd" in formats:
+        t = time.perf_counter()
+        doc.saveAs(outBase + ".FCStd")
+        result["outputs"].append(outBase + ".FCStd")
+        result["times"]["fcstd"] = time.perf_counter() - t
+    if "step" in formats:
+        import Import
+
+        t = time.perf_counter()
+        Import.export([world], outBase + ".step")
+        result["outputs"].append(outBase + ".step")
+        result["times"]["step"] = time.perf_counter() - t
+    if "brep" in formats:
+        t = time.perf_counter()
+        Part.getShape(world).exportBrep(outBase + ".brep")
+        result["outputs"].append(outBase + ".brep")
+        result["times"]["brep"] = time.perf_counter() - t
+    FreeCAD.closeDocument(doc.Name)
+    result["times"]["total"] = time.perf_counter() - start
+    return result
+
+
+def worker(args):
+    # --worker mode : convert one file & print tagged result line
+    sys.path.extend(freecadPaths(args.freecad_lib))
+    try:
+        result = convertFile(
+            args.inputs[0], args.output, args.formats, args.region,
+            args.volumes, args.out_name
+        )
+    except Exception as e:
+        result = {"file": args.inputs[0], "status": "failed", "error": repr(e)}
+    sys.stdout.flush()
+    print(resultTag + json.dumps(result))
+    return 0 if result["status"] == "ok" else 1
+
+
+def runFile(filename, outName, args):
+    # Runs a worker process for one file, its console output to a log
+    logName = os.path.join(args.output, outName + ".log")
+    os.makedirs(os.path.dirname(logName), exist_ok=True)
+    cmd = [
+        sys.executable,
+        os.path.abspath(__file__),
+        "--worker",
+        "-o", args.output,
+        "-f", ",".join(args.formats),
+        "--out-name", outName,
+    ]
+    for lib in args.freecad_lib:
+        cmd.extend(["--freecad-lib", lib])
+    if args.region:
+        cmd.extend(["--region", ",".join(str(v) for v in args.region)])
+    if args.volumes:
+        cmd.extend(["--volumes", ",".join(args.volumes)])
+    cmd.append(filename)
+    start = time.perf_counter()
+    result = None
+    try:
+        proc = subprocess.run(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            timeout=args.timeout,
+            universal_newlines=True,
+        )
+        output = proc.stdout
+        for line in output.splitlines():
+            if line.startswith(resultTag):
+                result = json.loads(line[len(resultTag):])
+        if result is None:
+            result = {
+                "file": filename,
+                "status": "crashed",
+                "error": f"exit code {proc.returncode}",
+            }
+    except subprocess.TimeoutExpired as e:
+        output = e.stdout or ""
+        if isinstance(output, bytes):
+            output = output.decode(errors="replace")
+        result = {
+            "file": filename,
+            "status": "timeout",
+            "error": f"no result after {args.timeout} seconds",
+        }
+    with open(logName, "w") as log:
+        log.write(output)
+    result["wall"] = time.perf_counter() - start
+    result["log"] = logName
+    print(
+        f"{result['status']:>8} {result['wall']:>9.2f}s {filename}",
+        flush=True,
+    )
+    return result
+
+
+def summary(results, wall, outDir):
+    ok = [r for r in results if r["status"] == "ok"]
+    failed = [r for r in results if r["status"] != "ok"]
+    print("\nSummary")
+    print("=======")
+    print(f"files     : {len(results)}")
+    print(f"converted : {len(ok)}")
+    print(f"failed    : {len(failed)}")
+    print(f"wall time : {wall:.2f} seconds")
+    if ok:
+        slowest = sorted(ok, key=lambda r: r["wall"], reverse=True)[:10]
+        print("\nSlowest files")
+        for r in slowest:
+            imp = r["times"].get("import", 0.0)
+            print(f"{r['wall']:>9.2f}s  import {imp:>9.2f}s  {r['file']}")
+    if failed:
+        print("\nFailures")
+        for r in failed:
+            print(f"{r['status']:>8} {r['file']} : {r.get('error')}")
+            print(f"         log : {r['log']}")
+    summaryName = os.path.join(outDir, "batch_summary.json")
+    with open(summaryName, "w") as f:
+        json.dump({"wall": wall, "results": results}, f, indent=2)
+    print(f"\nSummary written to {summaryName}")
+    return len(failed)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Import GDML files with FreeCAD & convert them"
+    )
+    parser.add_argument("inputs", nargs="+", help="GDML files or folders")
+    parser.add_argument("-o", "--output", default=".", help="output folder")
+    parser.add_argument(
+        "-f",
+        "--formats",
+        default="fcstd",
+        type=lambda s: [f.strip().lower() for f in s.split(",") if f.strip()],
+        help="comma separated list of fcstd, step, brep",
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="number of FreeCAD worker processes",
+    )
+    parser.add_argument(
+        "--freecad-lib",
+        action="append",
+        default=[],
+        help="folder containing FreeCAD.so / FreeCAD.pyd",
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=None, help="seconds per file"
+    )
+    parser.add_argument(
+        "--region",
+        type=lambda s: [float(v) for v in s.split(",")],
+        default=None,
+        help="only import physvols in box xmin,ymin,zmin,xmax,ymax,zmax (mm)",
+    )
+    parser.add_argument(
+        "--volumes",
+        type=lambda s: [v.strip() for v in s.split(",") if v.strip()],
+        default=None,
+        help="only import these volumes, with their contents & parents",
+    )
+    parser.add_argument(
+        "--worker", action="store_true", help=argparse.SUPPRESS
+    )
+    parser.add_argument("--out-name", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.region is not None and len(args.region) != 6:
+        parser.error("--region needs xmin,ymin,zmin,xmax,ymax,zmax")
+
+    for f in args.formats:
+        if f not in ("fcstd", "step", "brep"):
+            parser.error(f"unknown output format {f}")
+    args.output = os.path.abspath(args.output)
+    if args.worker:
+        return worker(args)
+
+    os.makedirs(args.output, exist_ok=True)
+    files = findGDMLFiles(args.inputs)
+    if len(files) == 0:
+        print("No GDML files found")
+        return 1
+    print(f"Converting {len(files)} files with {args.workers} workers")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        results = list(pool.map(lambda f: runFile(f[0], f[1], args), files))
+    failed = summary(results, time.perf_counter() - start, args.output)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -221,6 +221,8 @@ class GDMLColourMap(QtGui.QDialog):
         print(doc)
         if doc is None:
             return
+        from .GDMLObjects import MaterialsList, setMaterial
+        MaterialsList.extend(self.matList)
         # print(dir(doc))
         if hasattr(doc, 'Objects'):
             # print(doc.Objects)
@@ -255,13 +257,12 @@ class GDMLColourMap(QtGui.QDialog):
                                         m = self.mapList.getMaterial(mapIdx)
                                         # Only add
                                         if not hasattr(obj, 'material'):
-                                            obj.addProperty("App::PropertyEnumeration",
+                                            obj.addProperty("App::PropertyString",
                                                             "material", "GDML", "Material")
-                                            obj.material = self.matList
+                                            setMaterial(obj, None)
                                         # Ignore GDML objects which will have Proxy
                                         if not hasattr(obj, 'Proxy'):
-                                            obj.material = self.matList.index(
-                                                m)
+                                            setMaterial(obj, m)
 
     def addColour2Map(self, c, hex, material):
         self.mapList.addEntry(QtGui.QColor(c[0]*255, c[1]*255,
@@ -413,7 +413,8 @@ class noCommonFacePrompt(QtGui.QDialog):
 class SetBorderSurfaceFeature:
     def Activated(self):
         from PySide import QtGui, QtCore
-        from .exportGDML import getSubVols, checkFaces
+        from .exportGDML import getSubVols
+        from .borderSurfaces import hasCommonFace
 
         print("Add SetBorderSurface")
         sel = FreeCADGui.Selection.getSelectionEx()
@@ -454,19 +455,7 @@ class SetBorderSurfaceFeature:
             #            commonFaceFlag, commonFaces = self.checkCommonFace(partList)
             dict1 = getSubVols(partList[0], FreeCAD.Placement())
             dict2 = getSubVols(partList[1], FreeCAD.Placement())
-            commonFaceFlag = False
-            for assem1, list1 in dict1.items():
-                for assem2, list2 in dict2.items():
-                    for pair1 in list1:
-                        for pair2 in list2:
-                            obj1 = pair1[0]
-                            obj2 = pair2[0]
-                            if hasattr(obj1, "Shape") and hasattr(
-                                obj2, "Shape"
-                            ):
-                                commonFaceFlag = checkFaces(pair1, pair2)
-                                if commonFaceFlag is True:
-                                    break
+            commonFaceFlag = hasCommonFace(dict1, dict2)
             if commonFaceFlag is True:
                 self.SetBorderSurface(
                     doc, surfaceObj, partList, commonFaceFlag
@@ -671,24 +660,16 @@ class GDMLSetMaterial(QtGui.QDialog):
             return
 
         print(f"Set Material {mat}")
+        from .GDMLObjects import MaterialsList, setMaterial
+
+        MaterialsList.append(mat)
         for sel in self.SelList:
             obj = sel.Object
-            if hasattr(obj, "material"):
-                #  May have an invalid enumeration from previous versions
-                try:
-                    obj.material = self.matList
-                    obj.material = mat
-
-                except ValueError:
-                    print(f"Value Error {mat}")
-                    pass
-
-            else:
+            if not hasattr(obj, "material"):
                 obj.addProperty(
-                    "App::PropertyEnumeration", "material", "GDML", "Material"
+                    "App::PropertyString", "material", "GDML", "Material"
                 )
-                obj.material = self.matList
-                obj.material = self.matList.index(mat)
+            setMaterial(obj, mat)
 
 
 class GDMLScale(QtGui.QDialog):
@@ -3189,6 +3170,66 @@ class ResetWorldFeature:
         }
 
 
+class UpdateFromGDMLFeature:
+    def Activated(self):
+        from . import updateGDML
+
+        doc = FreeCAD.ActiveDocument
+        world = None
+        for obj in doc.Objects:
+            if obj.TypeId == "App::Part" and hasattr(obj, "GDMLSource"):
+                world = obj
+                break
+        if world is None:
+            print("Document has no volumes imported from GDML")
+            return
+        filename, _ = QtGui.QFileDialog.getOpenFileName(
+            None, "Update from GDML", world.GDMLSource, "GDML (*.gdml)"
+        )
+        if filename:
+            updateGDML.updateFromGDML(doc, filename, world)
+
+    def IsActive(self):
+        if FreeCAD.ActiveDocument is None:
+            return False
+        else:
+            return True
+
+    def GetResources(self):
+        return {
+            "MenuText": QtCore.QT_TRANSLATE_NOOP(
+                "GDML_UpdateFromGDML", "Update from GDML"
+            ),
+            "ToolTip": QtCore.QT_TRANSLATE_NOOP(
+                "GDML_UpdateFromGDML",
+                "Rebuild only the volumes, solids & materials changed "
+                "in a regenerated GDML file",
+            ),
+        }
+
+
+class PurgeImportCacheFeature:
+    def Activated(self):
+        from . import importCache
+
+        num = importCache.purge()
+        print(f"Removed {num} entries from {importCache.cacheDir()}")
+
+    def IsActive(self):
+        return True
+
+    def GetResources(self):
+        return {
+            "MenuText": QtCore.QT_TRANSLATE_NOOP(
+                "GDML_PurgeImportCache", "Purge Import Cache"
+            ),
+            "ToolTip": QtCore.QT_TRANSLATE_NOOP(
+                "GDML_PurgeImportCache",
+                "Remove all cached GDML imports from disk",
+            ),
+        }
+
+
 class CompoundFeature:
     def Activated(self):
 
@@ -3319,3 +3360,5 @@ FreeCADGui.addCommand("Mesh2TessCommand", Mesh2TessFeature())
 FreeCADGui.addCommand("Tess2MeshCommand", Tess2MeshFeature())
 FreeCADGui.addCommand("TetrahedronCommand", TetrahedronFeature())
 FreeCADGui.addCommand("SetScaleCommand", SetScaleFeature())
+FreeCADGui.addCommand("UpdateFromGDMLCommand", UpdateFromGDMLFeature())
+FreeCADGui.addCommand("PurgeImportCacheCommand", PurgeImportCacheFeature())
@@ -71,68 +71,66 @@ def getMaterialsList():
     except:
         pass
 
-    try:
-        if g4Mats is not None:
-            for m in g4Mats.OutList:
-                matList.append(m.Label)
-            # print(matList)
-    except:
-        pass
+    if g4Mats is not None:
+        from . import g4Materials
+
+        matList.extend(g4Materials.getIndex().materialNames())
 
     return matList
 
 
 def refreshG4Materials(doc):
-    from .importGDML import joinDir, setupEtree, processMaterialsG4, newGroupPython, processNewG4
+    from .importGDML import newGroupPython, processNewG4
+    from . import g4Materials
     print('Get latest G4 Materials')
-    etree, root = setupEtree(joinDir('Resources/Geant4Materials.xml'))
-    mats_xml = root.find('materials')
+    index = g4Materials.getIndex(recheck=True)
+    if g4Materials.lazyMaterials():
+        mats_xml = index.materialsXML([])
+    else:
+        mats_xml = index.materialsXML()
+    names = []
     for m in doc.G4Materials.Group:
-        for n in m.Group:
-            doc.removeObject(n.Name)
-        doc.removeObject(m.Name)
-    doc.removeObject(doc.G4Materials.Name)
+        names.extend(n.Name for n in m.Group)
+        names.append(m.Name)
+    names.append(doc.G4Materials.Name)
+    for name in names:
+        doc.removeObject(name)
     G4matGrp = newGroupPython(doc.Geant4, 'G4Materials')
-    doc.recompute()
     processNewG4(G4matGrp, mats_xml)
+    g4Materials.forget(doc)
     doc.recompute()
 
 
+def setG4Groups(GroupedMaterials):
+    # Geant4 material groups from the compiled index
+    from . import g4Materials
+    for group, names in g4Materials.getIndex().groups.items():
+        GroupedMaterials[group] = list(names)
+
+
 def newGetGroupedMaterials():
     from .importGDML import joinDir, processGEANT4
     from .GDMLObjects import GroupedMaterials
     print(f'New getGroupedMaterials len GroupMaterials {len(GroupedMaterials)}')
-    # if len(GroupedMaterials) == 0:
-    mlen = len(GroupedMaterials)
-    if mlen >= 0:
-        doc = FreeCAD.activeDocument()
-        if not hasattr(doc, 'Materials') or not hasattr(doc, 'G4Materials'):
-            processGEANT4(doc, joinDir("Resources/Geant4Materials.xml"))
-            docG4Materials = doc.G4Materials
-            if not hasattr(docG4Materials, 'version'):
-                refreshG4Materials(doc)
+    doc = FreeCAD.activeDocument()
+    if not hasattr(doc, 'Materials') or not hasattr(doc, 'G4Materials'):
+        processGEANT4(doc, joinDir("Resources/Geant4Materials.xml"))
         docG4Materials = doc.G4Materials
-        print(f'doc.G4Materials {docG4Materials}')
-        for g in docG4Materials.Group:
-            # print(f'g : {g.Label}')
-            for s in g.Group:
-                # print(f's : {s.Label}')
-                if g.Name in GroupedMaterials:
-                    GroupedMaterials[g.Label].append(s.Label)
-                else:
-                    GroupedMaterials[g.Label] = [s.Label]
-        matList = []
-        docMaterials = doc.Materials
-        print(f'doc.Materials {docMaterials}')
-        if docMaterials is not None:
-            for m in docMaterials.OutList:
-                print(m.Label)
-                if m.Label != "Geant4":
-                    if m.Label not in matList:
-                        matList.append(m.Label)
+        if not hasattr(docG4Materials, 'version'):
+            refreshG4Materials(doc)
+    setG4Groups(GroupedMaterials)
+    matList = []
+    docMaterials = doc.Materials
+    print(f'doc.Materials {docMaterials}')
+    if docMaterials is not None:
+        for m in docMaterials.OutList:
+            print(m.Label)
+            if m.Label != "Geant4":
+                if m.Label not in matList:
+                    matList.append(m.Label)
 
-        if len(matList) > 0:
-            GroupedMaterials['Normal'] = matList
+    if len(matList) > 0:
+        GroupedMaterials['Normal'] = matList
 
     return GroupedMaterials
 
@@ -140,27 +138,9 @@ def newGetGroupedMaterials():
 def getGroupedMaterials():
     print('getGroupedMaterials')
     from .GDMLObjects import GroupedMaterials
-    from .importGDML import setupEtree
-    from .init_gui import joinDir
 
     if len(GroupedMaterials) == 0:
-        etree, root = setupEtree(joinDir("Resources/Geant4Materials.xml"))
-        materials = root.find('materials')
-
-        for material in materials.findall('material'):
-            name = material.get('name')
-            print(name)
-            if name is None:
-                print("Missing Name")
-            else:
-                for auxiliary in material.findall('auxiliary'):
-                    auxtype = auxiliary.get('auxtype')
-                    if auxtype == 'Material-type':
-                        auxvalue = auxiliary.get('auxvalue')
-                        if auxvalue in GroupedMaterials:
-                            GroupedMaterials[auxvalue].append(name)
-                        else:
-                            GroupedMaterials[auxvalue] = [name]
+        setG4Groups(GroupedMaterials)
 
     doc = FreeCAD.activeDocument()
     docMaterials = doc.Materials
@@ -34,13 +34,53 @@ import FreeCAD, FreeCADGui, Part
 from pivy import coin
 import math
 from . import GDMLShared
+from .importProfiler import profiler
 
 # Global Material List
+class MaterialRegistry:
+    # Material names in the order they were added with O(1) name -> id,
+    # used like a list. Objects hold the name of their material in a
+    # string property, the Set Material command offers the list
+    def __init__(self):
+        self.names = []
+        self.ids = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __contains__(self, name):
+        return name in self.ids
+
+    def __getitem__(self, i):
+        return self.names[i]
+
+    def __repr__(self):
+        return repr(self.names)
+
+    def append(self, name):
+        if name not in self.ids:
+            self.ids[name] = len(self.names)
+            self.names.append(name)
+
+    def extend(self, names):
+        for name in names:
+            self.append(name)
+
+    def index(self, name):
+        try:
+            return self.ids[name]
+        except KeyError:
+            raise ValueError(f"{name} is not a known material")
+
+
 # Used for setting material enum in GDMLObjects
 # Will be lost by file save & load
 # So need to be able to rebuild from Objects
 global MaterialsList
-MaterialsList = []
+MaterialsList = MaterialRegistry()
 global GroupedMaterials
 GroupedMaterials = {}  # dictionary of material lists by type
 
@@ -108,21 +148,22 @@ def rebuildMaterialsList():
         for g in G4Materials.Group:
             # print(g.Label)
             addMaterialsFromGroup(doc, MaterialsList, g.Label)
+        # Geant4 materials not yet created in the document
+        from .g4Materials import addNames
+
+        addNames(MaterialsList)
     # print('MaterialsList')
     # print(MaterialsList)
 
 
 def checkMaterial(material):
-    global MaterialsList
-    try:
-        i = MaterialsList.index(material)
-    except ValueError:
-        return False
-    return True
+    return material in MaterialsList
 
 
 def setMaterial(obj, m):
     # print(f'setMaterial {obj} {m}')
+    # material is the name as a string property, the choice of materials
+    # is offered by the Set Material command, not held by every object
     if FreeCAD.GuiUp:
         if m in ['G4_AIR', 'AIR']:
             print(f"Material {m}")
@@ -130,21 +171,60 @@ def setMaterial(obj, m):
                 print("Set transparency")
                 obj.ViewObject.Transparency = 98
 
-    if MaterialsList is not None:
-        if len(MaterialsList) > 0:
-            obj.material = MaterialsList
-            obj.material = 0
-            if not (m == 0 or m is None):
-                try:
-                    obj.material = MaterialsList.index(m)
-                except:
-                    print("Not in List")
-                    print(MaterialsList)
-                    obj.material = 0
-                return
+    if len(MaterialsList) == 0:
+        rebuildMaterialsList()
+        if len(MaterialsList) == 0:
             return
-    rebuildMaterialsList()
-    setMaterial(obj, m)
+    if m == 0 or m is None:
+        m = MaterialsList[0]
+    elif m not in MaterialsList:
+        print(f"Material {m} not in List")
+        m = MaterialsList[0]
+    from .g4Materials import ensureMaterial
+
+    ensureMaterial(obj.Document, m)
+    if isMaterialEnum(obj):
+        migrateMaterial(obj)
+    obj.material = m
+
+
+def isMaterialEnum(obj):
+    return (
+        hasattr(obj, "material")
+        and obj.getTypeIdOfProperty("material") == "App::PropertyEnumeration"
+    )
+
+
+def migrateMaterial(obj):
+    # documents saved before MaterialRegistry have a material enumeration
+    # with every material name, replaced by a string property
+    m = obj.material
+    group = obj.getGroupOfProperty("material")
+    mode = obj.getEditorMode("material")
+    obj.removeProperty("material")
+    obj.addProperty("App::PropertyString", "material", group, "Material")
+    obj.setEditorMode("material", mode)
+    obj.material = m
+
+
+def migrateMaterials(doc):
+    # Once, when an old document is opened. Only the storage changes so
+    # the document is left unmodified & nothing is recomputed
+    objs = [obj for obj in doc.Objects if isMaterialEnum(obj)]
+    if len(objs) == 0:
+        return
+    guiDoc = None
+    modified = True
+    if FreeCAD.GuiUp:
+        guiDoc = FreeCADGui.getDocument(doc.Name)
+        if guiDoc is not None:
+            modified = guiDoc.Modified
+    for obj in objs:
+        migrateMaterial(obj)
+    doc.purgeTouched()
+    if guiDoc is not None and not modified:
+        guiDoc.Modified = False
+    print(f"{len(objs)} material properties of {doc.Label} migrated")
 
 
 def checkFullCircle(aunit, angle):
@@ -364,7 +444,7 @@ class GDMLColourMapEntry:
             "App::PropertyColor", "colour", "GDMLColourMapEntry", "colour"
         ).colour = colour
         obj.addProperty(
-            "App::PropertyEnumeration",
+            "App::PropertyString",
             "material",
             "GDMLColourMapEntry",
             "Material",
@@ -384,6 +464,245 @@ def indexBoolean(list, ln):
     return -1
 
 
+# Solids whose createGeometry only uses their own properties,
+# their shapes can be shared & built away from the document
+ownPropertySolids = [
+    "GDMLArb8",
+    "GDMLBox",
+    "GDMLCone",
+    "GDMLElCone",
+    "GDMLEllipsoid",
+    "GDMLElTube",
+    "GDMLOrb",
+    "GDMLPara",
+    "GDMLHype",
+    "GDMLParaboloid",
+    "GDMLTorus",
+    "GDMLTwistedbox",
+    "GDMLTwistedtrap",
+    "GDMLTwistedtrd",
+    "GDMLTwistedtubs",
+    "GDMLSphere",
+    "GDMLTrap",
+    "GDMLTrd",
+    "GDMLTube",
+    "GDMLcutTube",
+    "GDMLTetra",
+]
+
+# Properties that do not change the shape of a solid
+nonShapeProperties = [
+    "Label",
+    "Label2",
+    "Placement",
+    "Shape",
+    "ExpressionEngine",
+    "Visibility",
+    "Proxy",
+    "material",
+    # bookkeeping of updateGDML
+    "GDMLHash",
+    "GDMLSolidHash",
+    "GDMLVolumeHash",
+    "GDMLVolName",
+    "GDMLSource",
+    "GDMLMaterialHashes",
+]
+
+
+class ShapeCache:
+    # Solids with the same type, parameters & units share one shape
+    # Only active during an import (start / stop), so shapes of edited,
+    # deleted objects or closed documents are not kept
+    def __init__(self):
+        self.shapes = {}
+        self.hits = 0
+        self.misses = 0
+        self.enabled = False
+
+    def reset(self):
+        self.shapes.clear()
+        self.hits = self.misses = 0
+
+    def start(self):
+        self.reset()
+        self.enabled = True
+
+    def stop(self):
+        # counts are kept for report
+        self.enabled = False
+        self.shapes.clear()
+
+    def key(self, fp):
+        if not self.enabled:
+            return None
+        if getattr(fp.Proxy, "Type", None) not in ownPropertySolids:
+            return None
+        params = []
+        for name in fp.PropertiesList:
+            if name in nonShapeProperties:
+                continue
+            value = getattr(fp, name)
+            if isinstance(value, float):
+                value = round(value, 9)
+            elif isinstance(value, FreeCAD.Vector):
+                value = tuple(round(v, 9) for v in value)
+            elif isinstance(value, list):
+                value = tuple(value)
+            elif not isinstance(value, (str, int, bool, tuple)):
+                return None
+            params.append((name, value))
+        return (fp.Proxy.Type, tuple(params))
+
+    def get(self, key):
+        shape = self.shapes.get(key)
+        if shape is not None:
+            self.hits += 1
+        return shape
+
+    def add(self, key, shape):
+        self.misses += 1
+        self.shapes[key] = shape
+
+    def report(self):
+        total = self.hits + self.misses
+        if self.misses > 0:
+            print(
+                f"Solid shapes : {self.misses} built {self.hits} shared "
+                f"dedup ratio {total / self.misses:.2f}"
+            )
+
+
+shapeCache = ShapeCache()
+
+
+# Half extents x, y, z (in lunit) of solids that can be deferred
+shapeExtents = {
+    "GDMLBox": lambda fp: (fp.x / 2, fp.y / 2, fp.z / 2),
+    "GDMLTube": lambda fp: (fp.rmax, fp.rmax, fp.z / 2),
+    "GDMLcutTube": lambda fp: (fp.rmax, fp.rmax, fp.z / 2),
+    "GDMLCone": lambda fp: (
+        max(fp.rmax1, fp.rmax2), max(fp.rmax1, fp.rmax2), fp.z / 2
+    ),
+    "GDMLSphere": lambda fp: (fp.rmax, fp.rmax, fp.rmax),
+    "GDMLOrb": lambda fp: (fp.r, fp.r, fp.r),
+    "GDMLTorus": lambda fp: (
+        fp.rtor + fp.rmax, fp.rtor + fp.rmax, fp.rmax
+    ),
+    "GDMLTrd": lambda fp: (
+        max(fp.x1, fp.x2) / 2, max(fp.y1, fp.y2) / 2, fp.z / 2
+    ),
+    "GDMLEllipsoid": lambda fp: (fp.ax, fp.by, fp.cz),
+    "GDMLElTube": lambda fp: (fp.dx, fp.dy, fp.dz),
+}
+
+
+class DeferredShapes:
+    # Import mode (preference lazyShapes) where solids only get a hidden,
+    # marked bounding box placeholder. The real shape is built when the
+    # object is shown, it or a volume holding it is selected, a feature
+    # using it (boolean, array ...) is recomputed, on export or when
+    # asked for with materialise
+    note = "Deferred shape : built when shown, selected or used"
+
+    def __init__(self):
+        self.enabled = False
+        self.deferred = 0
+        self.observing = False
+
+    def canDefer(self, fp):
+        if getattr(fp.Proxy, "Type", None) not in shapeExtents:
+            return False
+        # booleans, multiunions etc. need the real shape
+        for user in fp.InList:
+            if user.TypeId != "App::Part":
+                return False
+        return True
+
+    def placeholder(self, fp):
+        mul = GDMLShared.getMult(fp)
+        hx, hy, hz = [
+            max(mul * h, 1e-6) for h in shapeExtents[fp.Proxy.Type](fp)
+        ]
+        box = Part.makeBox(
+            2 * hx, 2 * hy, 2 * hz, FreeCAD.Vector(-hx, -hy, -hz)
+        )
+        currPlacement = fp.Placement
+        fp.Shape = Part.Compound(box.Edges)
+        fp.Placement = currPlacement
+        fp.Proxy.deferred = True
+        self.deferred += 1
+
+    def markPlaceholders(self, objects):
+        # after the import recompute, placeholders are never shown as if
+        # they were the solid, showing one builds its shape
+        for obj in objects:
+            if getattr(getattr(obj, "Proxy", None), "deferred", False):
+                obj.Label2 = self.note
+                if FreeCAD.GuiUp:
+                    obj.ViewObject.Visibility = False
+
+    def materialise(self, obj):
+        # build the real shape of obj if deferred, returns True if built
+        proxy = getattr(obj, "Proxy", None)
+        if not getattr(proxy, "deferred", False):
+            return False
+        enabled = self.enabled
+        self.enabled = False
+        try:
+            proxy.execute(obj)
+        finally:
+            self.enabled = enabled
+        if obj.Label2 == self.note:
+            obj.Label2 = ""
+        return True
+
+    def materialiseTree(self, obj):
+        # obj & the solids of the volumes it holds
+        built = 0
+        for o in [obj] + obj.OutListRecursive:
+            if self.materialise(o):
+                built += 1
+        if built > 1:
+            print(f"Built {built} deferred solid shapes of {obj.Label}")
+        return built
+
+    def materialiseAll(self, doc):
+        built = 0
+        for obj in doc.Objects:
+            if self.materialise(obj):
+                built += 1
+        if built > 0:
+            print(f"Built {built} deferred solid shapes")
+        return built
+
+    def observe(self):
+        if not self.observing:
+            FreeCAD.addDocumentObserver(self)
+            if FreeCAD.GuiUp:
+                FreeCADGui.Selection.addObserver(self)
+            self.observing = True
+
+    def slotBeforeRecomputeDocument(self, doc):
+        # features using a deferred solid read its Shape when recomputed
+        for obj in doc.Objects:
+            proxy = getattr(obj, "Proxy", None)
+            if getattr(proxy, "deferred", False) and not self.canDefer(obj):
+                self.materialise(obj)
+
+    def addSelection(self, docName, objName, sub, pnt):
+        obj = FreeCAD.getDocument(docName).getObject(objName)
+        if obj is not None:
+            self.materialiseTree(obj)
+
+    def setSelection(self, docName):
+        for obj in FreeCADGui.Selection.getSelection(docName):
+            self.materialiseTree(obj)
+
+
+deferredShapes = DeferredShapes()
+
+
 class GDMLsolid:
     def __init__(self, obj):
         """Init"""
@@ -402,6 +721,16 @@ class GDMLsolid:
     def getMaterial(self):
         return self.obj.material
 
+    def takeCachedShape(self, obj, solidType):
+        # shape of this solid from the import cache entry being applied,
+        # sets fromCache so applyShapes does not hand out another
+        from .importCache import cachedShapes
+
+        shape = cachedShapes.take(solidType, obj)
+        if shape is not None:
+            self.fromCache = True
+        return shape
+
     def scale(self, fp):
         print(f"Rescale : {fp.scale}")
         mat = FreeCAD.Matrix()
@@ -409,7 +738,30 @@ class GDMLsolid:
         fp.Shape = fp.Shape.transformGeometry(mat)
 
     def execute(self, fp):
-        self.createGeometry(fp)
+        if getattr(self, "preShape", None) is not None:
+            # shape already built by parallelShapes during import
+            currPlacement = fp.Placement
+            fp.Shape = self.preShape
+            fp.Placement = currPlacement
+            del self.preShape
+            return
+        key = shapeCache.key(fp)
+        if key is not None:
+            shape = shapeCache.get(key)
+            if shape is not None:
+                currPlacement = fp.Placement
+                fp.Shape = shape
+                fp.Placement = currPlacement
+                self.deferred = False
+                return
+        if deferredShapes.enabled and deferredShapes.canDefer(fp):
+            deferredShapes.placeholder(fp)
+            return
+        self.deferred = False
+        with profiler.shape(getattr(self, "Type", "unknown"), fp.Label):
+            self.createGeometry(fp)
+        if key is not None:
+            shapeCache.add(key, fp.Shape)
 
     def __getstate__(self):
         """When saving the document this object gets stored using Python's json
@@ -418,7 +770,13 @@ class GDMLsolid:
         we must define this method\
         to return a tuple of all serializable objects or None."""
         if hasattr(self, "Type"):
-            return {"type": self.Type}
+            state = {"type": self.Type}
+            if getattr(self, "deferred", False):
+                state["deferred"] = True
+            if getattr(self, "sourceHash", None) is not None:
+                # tessellation source, see exportCache.solidKey
+                state["sourceHash"] = self.sourceHash
+            return state
         else:
             pass
 
@@ -427,6 +785,14 @@ class GDMLsolid:
         chance to set some internals here. Since no data were serialized
         nothing needs to be done here."""
         self.Type = arg["type"]
+        # placeholder shape saved by a lazy import
+        self.deferred = arg.get("deferred", False)
+        self.sourceHash = arg.get("sourceHash")
+
+    def onDocumentRestored(self, fp):
+        if getattr(self, "deferred", False):
+            # placeholder saved by a lazy import, build it when needed
+            deferredShapes.observe()
 
 
 class GDMLcommon:
@@ -534,7 +900,7 @@ class GDMLArb8(GDMLsolid):  # Thanks to Dam Lamb
         )
         setLengthQuantity(obj, lunit)
         obj.addProperty(
-            "App::PropertyEnumeration", "material", "GDMLArb8", "Material"
+            "App::PropertyString", "material", "GDMLArb8", "Material"
         )
         setMaterial(obj, material)
         if FreeCAD.GuiUp:
@@ -665,7 +1031,7 @@ class GDMLBox(GDMLsolid):
         setLengthQuantity(obj, lunit)
         obj.lunit = LengthQuantityList.index(lunit)
         obj.addProperty(
-            "App::PropertyEnumeration", "material", "GDMLBox", "Material"
+            "App::PropertyString", "material", "GDMLBox", "Material"
         )
         setMaterial(obj, material)
         if FreeCAD.GuiUp:
@@ -773,7 +1139,7 @@ class GDMLCone(GDMLsolid):
         setLengthQuantity(obj, lunit)
 
         obj.addProperty(
-            "App::PropertyEnumeration", "material", "GDMLCone", "Material"
+            "App::PropertyString", "material", "GDMLCone", "Material"
         )
         setMaterial(obj, material)
         if FreeCAD.GuiUp:
@@ -894,7 +1260,7 @@ class GDMLElCone(GDMLsolid):
         )
         setLengthQuantity(obj, lunit)
         obj.addProperty(
-            "App::PropertyEnumeration", "material", "GDMLElCone", "Material"
+            "App::PropertyString", "material", "GDMLElCone", "Material"
         )
         setMaterial(obj, material)
         if FreeCAD.GuiUp:
@@ -1005,7 +1371,7 @@ class GDMLEllipsoid(GDMLsolid):
         )
         setLengthQuantity(obj, lunit)
         obj.addProperty(
-            "App::PropertyEnumeration", "material", "GDMLEllipsoid", "Material"
+            "App::PropertyString", "material", "GDMLEllipsoid", "Material"
         )
         setMaterial(obj, material)
         if FreeCAD.GuiUp:
@@ -1109,7 +1475,7 @@ class GDMLElTube(GDMLsolid):
         )
         setLengthQuantity(obj, lunit)
         obj.addProperty(
-            "App::PropertyEnumeration", "material", "GDMLElTube", "Material"
+            "App::PropertyString", "material", "GDMLElTube", "Material"
         )
         setMaterial(obj, material)
         if FreeCAD.GuiUp:
@@ -1172,7 +1538,7 @@ class GDMLOrb(GDMLsolid):
         )
         setLengthQuantity(obj, lunit)
         obj.addProperty(
-            "App::PropertyEnumeration", "material", "GDMLOrb", "Material"
+            "App::PropertyString", "material", "GDMLOrb", "Material"
         )
         setMaterial(obj, material)
         if FreeCAD.GuiUp:
@@ -1265,7 +1631,7 @@ class GDMLPara(GDMLsolid):
         )
         setLengthQuantity(obj, lunit)
         obj.addProperty(
-            "App::PropertyEnumeration", "material", "GDMLParapiped", "Material"
+            "App::PropertyString", "material", "GDMLParapiped", "Material"
         )
         setMaterial(obj, material)
         if FreeCAD.GuiUp:
@@ -1411,7 +1777,7 @@ class GDMLHype(GDMLsolid):
         )
         setLengthQuantity(obj, lunit)
         obj.addProperty(
-            "App::PropertyEnumeration", "material", "GDMLHype", "Material"
+            "App::PropertyString", "material", "GDMLHype", "Material"
         )
         setMaterial(obj, material)
         if FreeCAD.GuiUp:
@@ -1537,7 +1903,7 @@ class GDMLParaboloid(GDMLsolid):
         )
         setLengthQuantity(obj, lunit)
         obj.addProperty(
-            "App::PropertyEnumeration",
+            "App::PropertyString",
             "material",
             "GDMLParaboloid",
             "Material",
@@ -1649,7 +2015,7 @@ class GDMLPolyhedra(GDMLsolid):
         )
         setLengthQuantity(obj, lunit)
         obj.addProperty(
-            "App::PropertyEnumeration", "material", "GDMLPolyhedra", "Material"
+            "App::PropertyString", "material", "GDMLPolyhedra", "Material"
         )
         setMaterial(obj, material)
         if FreeCAD.GuiUp:
@@ -1846,7 +2212,7 @@ class GDMLGenericPolyhedra(GDMLsolid):
         )
         setLengthQuantity(obj, lunit)
         obj.addProperty(
-            "App::PropertyEnumeration",
+            "App::PropertyString",
             "material",
             "GDMLGenericPolyhedra",
             "Material",
@@ -2000,7 +2366,7 @@ class GDMLTorus(GDMLsolid):
         )
         setLengthQuantity(obj, lunit)
         obj.addProperty(
-            "App::PropertyEnumeration", "material", "GDMLTorus", "Material"
+            "App::PropertyString", "material", "GDMLTorus", "Material"
         )
         setMaterial(obj, material)
         if FreeCAD.GuiUp:
@@ -2120,7 +2486,7 @@ class GDMLTwistedbox(GDMLsolid):
         )
         setLengthQuantity(obj, lunit)
         obj.addProperty(
-            "App::PropertyEnumeration",
+            "App::PropertyString",
             "material",
             "GDMLTwistedbox",
             "Material",
@@ -2283,7 +2649,7 @@ class GDMLTwistedtrap(GDMLsolid):
         )
         setLengthQuantity(obj, lunit)
         obj.addProperty(
-            "App::PropertyEnumeration",
+            "App::PropertyString",
             "material",
             "GDMLTwistedtrap",
             "Material",
@@ -2461,7 +2827,7 @@ class GDMLTwistedtrd(GDMLsolid):
         obj.aunit = ["rad", "deg"].index(aunit[0:3])
         setLengthQuantity(obj, lunit)
         obj.addProperty(
-            "App::PropertyEnumeration",
+            "App::PropertyString",
             "material",
             "GDMLTwistedtrd",
             "Material",
@@ -2607,7 +2973,7 @@ class GDMLTwistedtubs(GDMLsolid):
         obj.aunit = ["rad", "deg"].index(aunit[0:3])
         setLengthQuantity(obj, lunit)
         obj.addProperty(
-            "App::PropertyEnumeration",
+            "App::PropertyString",
             "material",
             "GDMLTwistedtubs",
             "Material",
@@ -2727,7 +3093,7 @@ class GDMLXtru(GDMLsolid):
         )
         setLengthQuantity(obj, lunit)
         obj.addProperty(
-            "App::PropertyEnumeration", "material", "GDMLXtru", "Material"
+            "App::PropertyString", "material", "GDMLXtru", "Material"
         )
         setMaterial(obj, material)
         if FreeCAD.GuiUp:
@@ -2981,7 +3347,7 @@ class GDMLPolycone(GDMLsolid):  # Thanks to Dam Lamb
         )
         setLengthQuantity(obj, lunit)
         obj.addProperty(
-            "App::PropertyEnumeration", "material", "GDMLPolycone", "Material"
+            "App::PropertyString", "material", "GDMLPolycone", "Material"
         )
         setMaterial(obj, material)
         # For debugging
@@ -3105,7 +3471,7 @@ class GDMLGenericPolycone(GDMLsolid):  # Thanks to Dam Lamb
         )
         setLengthQuantity(obj, lunit)
         obj.addProperty(
-            "App::PropertyEnumeration", "material", "GDMLPolycone", "Material"
+            "App::PropertyString", "material", "GDMLPolycone", "Material"
         )
         setMaterial(obj, material)
         # For debugging
@@ -3217,7 +3583,7 @@ class GDMLSphere(GDMLsolid):
         )
         setLengthQuantity(obj, lunit)
         obj.addProperty(
-            "App::PropertyEnumeration", "material", "GDMLSphere", "Material"
+            "App::PropertyString", "material", "GDMLSphere", "Material"
         )
         setMaterial(obj, material)
         if FreeCAD.GuiUp:
@@ -3435,7 +3801,7 @@ class GDMLTrap(GDMLsolid):
         )
         setLengthQuantity(obj, lunit)
         obj.addProperty(
-            "App::PropertyEnumeration", "material", "GDMLTrap", "Material"
+            "App::PropertyString", "material", "GDMLTrap", "Material"
         )
         setMaterial(obj, material)
         if FreeCAD.GuiUp:
@@ -3578,7 +3944,7 @@ class GDMLTrd(GDMLsolid):
         )
         setLengthQuantity(obj, lunit)
         obj.addProperty(
-            "App::PropertyEnumeration", "material", "GDMLTrd", "Material"
+            "App::PropertyString", "material", "GDMLTrd", "Material"
         )
         setMaterial(obj, material)
         if FreeCAD.GuiUp:
@@ -3689,7 +4055,7 @@ class GDMLTube(GDMLsolid):
         )
         setLengthQuantity(obj, lunit)
         obj.addProperty(
-            "App::PropertyEnumeration", "material", "GDMLTube", "Material"
+            "App::PropertyString", "material", "GDMLTube", "Material"
         )
         setMaterial(obj, material)
         if FreeCAD.GuiUp:
@@ -3824,7 +4190,7 @@ class GDMLcutTube(GDMLsolid):
         )
         setLengthQuantity(obj, lunit)
         obj.addProperty(
-            "App::PropertyEnumeration", "material", "GDMLcutTube", "Material"
+            "App::PropertyString", "material", "GDMLcutTube", "Material"
         )
         # print('Add material')
         # print(material)
@@ -4110,7 +4476,7 @@ class GDMLGmshTessellated(GDMLsolid):
         )
         setLengthQuantity(obj, lunit)
         obj.addProperty(
-            "App::PropertyEnumeration",
+            "App::PropertyString",
             "material",
             "GDMLTessellated",
             "Material",
@@ -4181,6 +4547,9 @@ class GDMLGmshTessellated(GDMLsolid):
     # def execute(self, fp): in GDMLsolid
 
     def createGeometry(self, fp):
+        self.sourceHash = GDMLShared.tessellationHash(
+            self.Vertex, self.Facets
+        )
         currPlacement = fp.Placement
         mul = GDMLShared.getMult(fp)
         FCfaces = []
@@ -4270,13 +4639,20 @@ class GDMLTessellated(GDMLsolid):
         )
         setLengthQuantity(obj, lunit)
         obj.addProperty(
-            "App::PropertyEnumeration",
+            "App::PropertyString",
             "material",
             "GDMLTessellated",
             "Material",
         )
         setMaterial(obj, material)
-        self.updateParams(vertex, facets, flag)
+        shape = self.takeCachedShape(obj, "GDMLTessellated")
+        if shape is not None:
+            self.pshape = shape
+            self.sourceHash = GDMLShared.tessellationHash(vertex, facets)
+            self.facets = len(facets)
+            self.vertex = len(vertex)
+        else:
+            self.updateParams(vertex, facets, flag)
         if FreeCAD.GuiUp:
             updateColour(obj, colour, material)
             self.Type = "GDMLTessellated"
@@ -4286,6 +4662,7 @@ class GDMLTessellated(GDMLsolid):
     def updateParams(self, vertex, facets, flag):
         # print('Update Params & Shape')
         self.pshape = self.createShape(vertex, facets, flag)
+        self.sourceHash = GDMLShared.tessellationHash(vertex, facets)
         # print(f"Pshape vertex {len(self.pshape.Vertexes)}")
         self.facets = len(facets)
         self.vertex = len(vertex)
@@ -4335,6 +4712,8 @@ class GDMLTessellated(GDMLsolid):
         # if flag == False - factes is Faces i.e. from import GDMLTessellated
         # mul = GDMLShared.getMult(fp)
         mul = GDMLShared.getMult(self)
+        if flag is False and GDMLShared.useBulkTessellation():
+            return GDMLShared.bulkSolid(vertex, facets, mul)
         # print('Create Shape')
         FCfaces = []
         for f in facets:
@@ -4402,6 +4781,7 @@ class GDMLSampledTessellated(GDMLsolid):
         sampledFraction,
         colour=None,
         flag=True,
+        vertsPerFacet=None,
     ):
         super().__init__(obj)
         from random import random
@@ -4409,13 +4789,19 @@ class GDMLSampledTessellated(GDMLsolid):
         # ########################################
         # if flag == True  - facets is Mesh.Facets - with Normals
         # if flag == False - facets is Faces i.e. from import GDMLTessellated
+        # if vertsPerFacet is given - vertex is a numpy (n, 3) array and
+        #    facets a flat index array, vertexes already deduplicated
         # ########################################
+        if vertsPerFacet is not None:
+            nFacets = len(vertsPerFacet)
+        else:
+            nFacets = len(facets)
         obj.addProperty(
             "App::PropertyInteger",
             "facets",
             "GDMLSampledTessellated",
             "Facets",
-        ).facets = len(facets)
+        ).facets = nFacets
         obj.setEditorMode("facets", 1)
         obj.addProperty(
             "App::PropertyInteger",
@@ -4432,13 +4818,15 @@ class GDMLSampledTessellated(GDMLsolid):
         )
         setLengthQuantity(obj, lunit)
         obj.addProperty(
-            "App::PropertyEnumeration",
+            "App::PropertyString",
             "material",
             "GDMLSampledTessellated",
             "Material",
         )
 
-        if flag is True:
+        if vertsPerFacet is not None:
+            nList = list(vertsPerFacet)
+        elif flag is True:
             nList = [len(f.Points) for f in facets]
         else:
             nList = [len(f) for f in facets]
@@ -4467,20 +4855,46 @@ class GDMLSampledTessellated(GDMLsolid):
         ).sampledFraction = percentageList
         obj.sampledFraction = str(sampledFraction)
 
-        # we use a set first to get rid of duplicate points
-        vertsSet = set()
-        for f in facets:
-            if flag is True:
-                for p in f.Points:
-                    vertsSet.add(p)
-            else:
-                vertsSet.add(vertex[f[0]])
-                vertsSet.add(vertex[f[1]])
-                vertsSet.add(vertex[f[2]])
-                if len(f) == 4:
-                    vertsSet.add(vertex[f[3]])
+        if vertsPerFacet is not None:
+            vertsList = [tuple(v) for v in vertex.tolist()]
+            indexList = facets.tolist()
+        else:
+            # we use a set first to get rid of duplicate points
+            vertsSet = set()
+            for f in facets:
+                if flag is True:
+                    for p in f.Points:
+                        vertsSet.add(p)
+                else:
+                    vertsSet.add(vertex[f[0]])
+                    vertsSet.add(vertex[f[1]])
+                    vertsSet.add(vertex[f[2]])
+                    if len(f) == 4:
+                        vertsSet.add(vertex[f[3]])
+
+            vertsList = list(vertsSet)
+
+            # create list of indexes for each face
+            Dict = {}
+            for i, v in enumerate(vertsList):
+                Dict[v] = i
+
+            # now create a list of vert number references for each face
+            # there is probably a way to have lists of lists as a property;
+            # I just don't know about it, so we list the indexs in order
+            # and rely on the nList to get the number of points
+            indexList = []
+            for f in facets:
+                if flag is True:
+                    for v in f.Points:
+                        indexList.append(Dict[v])
+                else:
+                    indexList.append(Dict[vertex[f[0]]])
+                    indexList.append(Dict[vertex[f[1]]])
+                    indexList.append(Dict[vertex[f[2]]])
+                    if len(f) == 4:
+                        indexList.append(Dict[vertex[f[3]]])
 
-        vertsList = list(vertsSet)
         obj.addProperty(
             "App::PropertyVectorList",
             "vertsList",
@@ -4489,27 +4903,6 @@ class GDMLSampledTessellated(GDMLsolid):
         ).vertsList = vertsList
         obj.setEditorMode("vertsList", 2)
 
-        # create list of indexes for each face
-        Dict = {}
-        for i, v in enumerate(vertsList):
-            Dict[v] = i
-
-        # now create a list of vert number references for each face
-        # there is probably a way to have lists of lists as a property;
-        # I just don't know about it, so we list the indexs in order
-        # and rely on the nList to get the number of points
-        indexList = []
-        for f in facets:
-            if flag is True:
-                for v in f.Points:
-                    indexList.append(Dict[v])
-            else:
-                indexList.append(Dict[vertex[f[0]]])
-                indexList.append(Dict[vertex[f[1]]])
-                indexList.append(Dict[vertex[f[2]]])
-                if len(f) == 4:
-                    indexList.append(Dict[vertex[f[3]]])
-
         obj.addProperty(
             "App::PropertyIntegerList",
             "indexList",
@@ -4519,7 +4912,19 @@ class GDMLSampledTessellated(GDMLsolid):
         obj.setEditorMode("indexList", 2)
 
         setMaterial(obj, material)
-        self.updateParams(vertex, facets, solidFlag, sampledFraction, flag)
+        shape = self.takeCachedShape(obj, "GDMLSampledTessellated")
+        if shape is not None:
+            self.pshape = shape
+            self.facets = nFacets
+            self.vertex = len(vertex)
+        elif vertsPerFacet is not None:
+            self.updateArrays(
+                vertex, facets, vertsPerFacet, solidFlag, sampledFraction
+            )
+        else:
+            self.updateParams(
+                vertex, facets, solidFlag, sampledFraction, flag
+            )
         if FreeCAD.GuiUp:
             updateColour(obj, colour, material)
             if sampledFraction == 0 and solidFlag is False:
@@ -4533,6 +4938,34 @@ class GDMLSampledTessellated(GDMLsolid):
         obj.Proxy = self
         obj.Proxy.Type = "GDMLSampledTessellated"
 
+    def updateArrays(
+        self, vertex, index, vertsPerFacet, solidFlag, sampledFraction
+    ):
+        # numpy arrays from import, full solids go straight to the bulk
+        # builder, sampled & point cloud views need the facet lists
+        if solidFlag is True and GDMLShared.useBulkTessellation():
+            mul = GDMLShared.getMult(self)
+            self.pshape = GDMLShared.arraySolid(
+                vertex, index, vertsPerFacet, mul
+            )
+            self.facets = len(vertsPerFacet)
+            self.vertex = len(vertex)
+            return
+        vertex, facets = self.facetsFromArrays(
+            vertex, index.tolist(), vertsPerFacet
+        )
+        self.updateParams(vertex, facets, solidFlag, sampledFraction, False)
+
+    def facetsFromArrays(self, vertex, indexList, vertsPerFacet):
+        # vertex list & per facet index lists for createShape
+        verts = [FreeCAD.Vector(*v) for v in vertex.tolist()]
+        facets = []
+        i = 0
+        for n in vertsPerFacet:
+            facets.append(indexList[i : i + n])
+            i += n
+        return verts, facets
+
     def updateParams(self, vertex, facets, solidFlag, sampledFraction, flag):
         # print('Update Params & Shape')
         self.pshape = self.createShape(
@@ -4590,6 +5023,9 @@ class GDMLSampledTessellated(GDMLsolid):
         if sampledFraction == 0 and solidFlag is False:
             shape = self.cloud(vertex, facets, flag)
             return shape
+        if solidFlag is True and flag is False:
+            if GDMLShared.useBulkTessellation():
+                return GDMLShared.bulkSolid(vertex, facets, mul)
         # print('Create Shape')
         if solidFlag is False:
             NMax = sampledFraction * len(facets) / 100
@@ -4835,7 +5271,7 @@ class GDMLTetra(GDMLsolid):  # 4 point Tetrahedron
         )
         setLengthQuantity(obj, lunit)
         obj.addProperty(
-            "App::PropertyEnumeration", "material", "GDMLTra", "Material"
+            "App::PropertyString", "material", "GDMLTra", "Material"
         )
         setMaterial(obj, material)
         if FreeCAD.GuiUp:
@@ -4903,7 +5339,7 @@ class GDMLTetrahedron(GDMLsolid):
         )
         setLengthQuantity(obj, lunit)
         obj.addProperty(
-            "App::PropertyEnumeration",
+            "App::PropertyString",
             "material",
             "GDMLTetrahedron",
             "Material",
@@ -5513,6 +5949,10 @@ class ViewProvider(GDMLcommon):
 
     def onChanged(self, vp, prop):
         """Here we can do something when a single property got changed"""
+        if prop == "Visibility" and vp.Visibility:
+            obj = getattr(vp, "Object", None)
+            if obj is not None and "Restore" not in obj.State:
+                deferredShapes.materialise(obj)
         # if hasattr(vp,'Name') :
         #   print("View Provider : "+vp.Name+" State : "+str(vp.State)+" prop : "+prop)
         # else :
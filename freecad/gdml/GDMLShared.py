@@ -28,6 +28,9 @@
 # *                                                                        *
 # **************************************************************************
 
+import ast
+import math
+from array import array
 from math import *
 import FreeCAD, Part
 from PySide import QtCore, QtGui
@@ -36,6 +39,7 @@ from PySide import QtCore, QtGui
 
 global define
 global tracefp
+global defineIndex
 
 global printverbose
 printverbose = False
@@ -82,24 +86,567 @@ def errorDialog(msg, title="Warning", type=2):
     diag.exec_()
 
 
+# CLHEP units as used by Geant4, internal units mm, ns, MeV, rad
+_joule = 1.0e-6 / 1.602176634e-19
+_kilogram = _joule * 1.0e18 / 1.0e6
+unitsSymbols = {
+    "nm": 1.0e-6, "nanometer": 1.0e-6,
+    "um": 1.0e-3, "micrometer": 1.0e-3,
+    "mm": 1.0, "millimeter": 1.0,
+    "cm": 10.0, "centimeter": 10.0,
+    "dm": 100.0,
+    "m": 1000.0, "meter": 1000.0,
+    "km": 1.0e6, "kilometer": 1.0e6,
+    "mm2": 1.0, "cm2": 100.0, "m2": 1.0e6,
+    "mm3": 1.0, "cm3": 1000.0, "m3": 1.0e9,
+    "rad": 1.0, "radian": 1.0, "mrad": 1.0e-3, "milliradian": 1.0e-3,
+    "deg": math.pi / 180, "degree": math.pi / 180,
+    "sr": 1.0, "steradian": 1.0,
+    "ns": 1.0, "nanosecond": 1.0,
+    "us": 1.0e3, "microsecond": 1.0e3,
+    "ms": 1.0e6, "millisecond": 1.0e6,
+    "s": 1.0e9, "second": 1.0e9,
+    "eV": 1.0e-6, "electronvolt": 1.0e-6,
+    "keV": 1.0e-3, "kiloelectronvolt": 1.0e-3,
+    "MeV": 1.0, "megaelectronvolt": 1.0,
+    "GeV": 1.0e3, "gigaelectronvolt": 1.0e3,
+    "TeV": 1.0e6, "teraelectronvolt": 1.0e6,
+    "PeV": 1.0e9, "petaelectronvolt": 1.0e9,
+    "joule": _joule,
+    "kg": _kilogram, "kilogram": _kilogram,
+    "g": _kilogram / 1000, "gram": _kilogram / 1000,
+    "mg": _kilogram / 1.0e6, "milligram": _kilogram / 1.0e6,
+    "kelvin": 1.0, "K": 1.0,
+    "perCent": 0.01, "perThousand": 0.001, "perMillion": 1.0e-6,
+    "twopi": 2 * math.pi, "halfpi": math.pi / 2, "pi2": math.pi ** 2,
+}
+
+mathSymbols = {
+    k: getattr(math, k) for k in dir(math) if not k.startswith("_")
+}
+mathSymbols.update({"abs": abs, "min": min, "max": max})
+
+
+class _ExprChecker(ast.NodeTransformer):
+    # Only arithmetic on names & numbers, calls of named functions
+    # '^' is power as in the CLHEP evaluator used by Geant4
+    allowed = (
+        ast.Expression, ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.Compare,
+        ast.IfExp, ast.Call, ast.Name, ast.Load, ast.Constant,
+        ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Mod, ast.Pow,
+        ast.FloorDiv, ast.UAdd, ast.USub, ast.Not, ast.And, ast.Or,
+        ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE,
+    )
+
+    def visit_BinOp(self, node):
+        if isinstance(node.op, ast.BitXor):
+            node.op = ast.Pow()
+        return self.generic_visit(node)
+
+    def visit_Call(self, node):
+        if not isinstance(node.func, ast.Name) or node.keywords:
+            raise ValueError("Illegal function call")
+        return self.generic_visit(node)
+
+    def generic_visit(self, node):
+        if not isinstance(node, self.allowed):
+            raise ValueError("Illegal expression : " + type(node).__name__)
+        return super().generic_visit(node)
+
+
+class ExprEvaluator:
+    """Evaluates GDML attribute expressions against a symbol table
+
+    Plain numbers take a float() fast path, any other expression is
+    parsed & checked once then kept as a code object, names are only
+    looked up in the symbol table (units, math, defines)
+    """
+
+    def __init__(self):
+        self.symbols = {}
+        self.codeCache = {}
+        self.numeric = self.hits = self.misses = self.lookups = 0
+        self.reset()
+
+    def reset(self):
+        self.symbols.clear()
+        self.symbols.update(mathSymbols)
+        self.symbols.update(unitsSymbols)
+        self.symbols["true"] = True
+        self.symbols["false"] = False
+
+    def define(self, name, value):
+        self.symbols[name] = value
+
+    def compile(self, expr):
+        if expr in self.codeCache:
+            self.hits += 1
+            code = self.codeCache[expr]
+        else:
+            self.misses += 1
+            try:
+                tree = _ExprChecker().visit(ast.parse(expr.strip(), mode="eval"))
+                code = compile(ast.fix_missing_locations(tree), "<gdml>", "eval")
+            except (SyntaxError, ValueError, TypeError):
+                code = None
+            self.codeCache[expr] = code
+        if code is None:
+            raise ValueError("Illegal expression : " + str(expr))
+        return code
+
+    def evaluate(self, expr):
+        try:
+            ret = float(expr)
+        except (TypeError, ValueError):
+            if expr in self.symbols:
+                # plain reference to an evaluated define
+                self.lookups += 1
+                return self.symbols[expr]
+            return eval(self.compile(expr), {"__builtins__": {}}, self.symbols)
+        self.numeric += 1
+        return ret
+
+    def stats(self):
+        return {
+            "numeric": self.numeric,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "misses": self.misses,
+            "cached": len(self.codeCache),
+        }
+
+
+evaluator = ExprEvaluator()
+
+
+def evaluate(expr):
+    # raises on undefined names or illegal expressions
+    return evaluator.evaluate(expr)
+
+
+def defineSymbol(name, value):
+    evaluator.define(name, value)
+
+
+def getEvalStats():
+    return evaluator.stats()
+
+
 def getFloatVal(expr):
     try:
-        ret = float(eval(expr))
+        ret = float(evaluate(expr))
     except:
-        # eval might fail on constants with leading zeros in python3
-        # so we try direct conversion
-        try:
-            ret = float(expr)
-        except:
-            ret = 0.0
-            print("Illegal float value: {}".format(expr))
+        ret = 0.0
+        print("Illegal float value: {}".format(expr))
     return ret
 
 
-def setDefine(val):
+class SectionIndex:
+    """Name -> element index of one or more GDML sections
+
+    Replaces the find("*[@name='...']") scans, which are O(N) per lookup.
+    As with find() the first definition of a duplicated name wins.
+    """
+
+    def __init__(self, sections=None):
+        self.byName = {}
+        self.byTag = {}
+        # name -> [(tag, build)] of elements of unexpanded loops
+        self.lazy = {}
+        if sections is not None:
+            for section in sections:
+                self.add(section)
+
+    def add(self, section):
+        if section is None:
+            return
+        seen = set()
+        for elem in section:
+            name = elem.get("name")
+            if elem.tag == "loop":
+                self.addLoop(elem, seen)
+                continue
+            # skip comments & processing instructions
+            if name is None or not isinstance(elem.tag, str):
+                continue
+            self.byTag.setdefault(elem.tag, {}).setdefault(name, elem)
+            if name not in seen:
+                seen.add(name)
+                self.byName.setdefault(name, []).append(elem)
+
+    def addLoop(self, loop, seen):
+        # loop left for lazy expansion, its elements are built on lookup
+        from .preProcessLoops import loopInstances
+
+        for tag, name, build in loopInstances(loop):
+            if name not in seen:
+                seen.add(name)
+                self.lazy.setdefault(name, []).append((tag, build))
+
+    def materialise(self, name):
+        for tag, build in self.lazy.pop(name, []):
+            elem = build()
+            self.byTag.setdefault(tag, {}).setdefault(name, elem)
+            self.byName.setdefault(name, []).append(elem)
+
+    def find(self, name, tag=None):
+        if name in self.lazy:
+            self.materialise(name)
+        if tag is None:
+            elems = self.byName.get(name)
+            if elems is None:
+                return None
+            return elems[0]
+        return self.byTag.get(tag, {}).get(name)
+
+    def findAll(self, name):
+        # first match in each indexed section i.e. find() on each section
+        if name in self.lazy:
+            self.materialise(name)
+        return self.byName.get(name, [])
+
+
+defineIndex = SectionIndex()
+
+
+def setDefine(val, merge=False):
     # print("Set Define")
-    global define
+    # merge : define section of a sub file, added to the index
+    global define, defineIndex
     define = val
+    if merge:
+        defineIndex.add(val)
+    else:
+        defineIndex = SectionIndex([val])
+
+
+class PositionTable:
+    """Evaluated positions, name -> row of flat coordinate & unit arrays
+
+    Tessellated files define one position per vertex, a dict per position
+    takes several times the memory of its coordinates. Looked up as a
+    dict, positions[name] gives {"unit", "x", "y", "z"}
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.rows = {}
+        self.coords = array("d")
+        self.units = array("B")
+        self.unitNames = []
+        self.unitCodes = {}
+
+    def unitCode(self, unit):
+        code = self.unitCodes.get(unit)
+        if code is None:
+            code = len(self.unitNames)
+            self.unitNames.append(unit)
+            self.unitCodes[unit] = code
+        return code
+
+    def __setitem__(self, name, value):
+        code = self.unitCode(value["unit"])
+        xyz = (value["x"], value["y"], value["z"])
+        row = self.rows.get(name)
+        if row is None:
+            self.rows[name] = len(self.units)
+            self.coords.extend(xyz)
+            self.units.append(code)
+        else:
+            self.coords[3 * row:3 * row + 3] = array("d", xyz)
+            self.units[row] = code
+
+    def __getitem__(self, name):
+        row = self.rows[name]
+        x, y, z = self.coords[3 * row:3 * row + 3]
+        return {"unit": self.unitNames[self.units[row]], "x": x, "y": y, "z": z}
+
+    def get(self, name, default=None):
+        if name in self.rows:
+            return self[name]
+        return default
+
+    def __contains__(self, name):
+        return name in self.rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def scaled(self, names):
+        # (n, 3) numpy array in mm, identity & center are the origin
+        import numpy as np
+
+        rows = np.array(
+            [-1 if n in ("identity", "center") else self.rows[n]
+             for n in names],
+            dtype=np.int64,
+        )
+        muls = np.array(
+            [positionUnits.get(u, 1) for u in self.unitNames] or [1],
+            dtype=float,
+        )
+        coords = np.frombuffer(self.coords, dtype=float).reshape(-1, 3)
+        units = np.frombuffer(self.units, dtype=np.uint8)
+        ret = np.zeros((len(rows), 3), dtype=float)
+        found = rows >= 0
+        ret[found] = coords[rows[found]] * muls[units[rows[found]]][:, None]
+        # release the buffers, the arrays can grow again
+        del coords, units
+        return ret
+
+
+# Defines are evaluated once, in dependency order, by evaluateDefines
+# scalar defines : value in the evaluator symbol table
+# positions : PositionTable of the evaluated values
+# rotations : {"unit", "x", "y", "z"} evaluated values
+scalarDefines = ["constant", "variable", "quantity", "expression"]
+vectorDefines = ["position", "rotation"]
+defineTypes = {}
+positions = PositionTable()
+rotations = {}
+# name -> undefined names (or cycle) of defines that failed to evaluate
+unresolvedDefines = {}
+
+
+def defineExprs(elem):
+    # expressions of a define element
+    if elem.tag == "expression":
+        return [elem.text or ""]
+    if elem.tag in vectorDefines:
+        return [elem.get(a) for a in ("x", "y", "z") if a in elem.attrib]
+    return [elem.get("value", "")]
+
+
+# expression -> names it uses, plain numbers are never parsed
+exprNamesCache = {}
+noNames = frozenset()
+
+
+def exprNames(expr):
+    names = exprNamesCache.get(expr)
+    if names is not None:
+        return names
+    try:
+        float(expr)
+        return noNames
+    except (TypeError, ValueError):
+        pass
+    try:
+        tree = ast.parse(expr.strip(), mode="eval")
+        names = frozenset(
+            n.id for n in ast.walk(tree) if isinstance(n, ast.Name)
+        )
+    except SyntaxError:
+        names = noNames
+    exprNamesCache[expr] = names
+    return names
+
+
+def defineGraph(defines):
+    # name -> (element, names of scalar defines it depends on) of the
+    # scalars, and the positions & rotations in document order
+    # nothing depends on positions & rotations, they are evaluated after
+    # all scalars so their expressions are not parsed for names
+    nodes = {}
+    vectors = []
+    for elem in defines:
+        name = elem.get("name")
+        if name in nodes:
+            print(f"Duplicate define {name} ignored")
+            continue
+        nodes[name] = elem
+        if elem.tag in vectorDefines:
+            vectors.append(elem)
+    graph = {}
+    for name, elem in nodes.items():
+        if elem.tag in vectorDefines:
+            continue
+        deps = set()
+        for expr in defineExprs(elem):
+            deps.update(exprNames(expr))
+        graph[name] = (
+            elem,
+            [d for d in deps if d != name and d in nodes
+             and nodes[d].tag in scalarDefines],
+        )
+    return graph, vectors
+
+
+def topologicalOrder(graph):
+    # Kahn's algorithm keeping document order, returns (order, cyclic)
+    users = {name: [] for name in graph}
+    pending = {}
+    for name, (elem, deps) in graph.items():
+        pending[name] = len(deps)
+        for d in deps:
+            users[d].append(name)
+    ready = [name for name in graph if pending[name] == 0]
+    ready.reverse()
+    order = []
+    while ready:
+        name = ready.pop()
+        order.append(name)
+        for user in reversed(users[name]):
+            pending[user] -= 1
+            if pending[user] == 0:
+                ready.append(user)
+    cyclic = [name for name in graph if pending[name] > 0]
+    return order, cyclic
+
+
+def evaluateDefine(elem):
+    # returns False if (an axis of) the define could not be evaluated
+    if elem.tag in scalarDefines:
+        try:
+            defineSymbol(elem.get("name"), evaluate(defineExprs(elem)[0]))
+        except Exception:
+            return False
+        return True
+    unit = elem.get("unit")
+    if unit is None:
+        unit = "mm" if elem.tag == "position" else "rad"
+    value = {"unit": unit, "x": 0, "y": 0, "z": 0}
+    ok = True
+    for a in ("x", "y", "z"):
+        if a in elem.attrib:
+            # as before an axis that does not evaluate is zero
+            try:
+                value[a] = float(evaluate(elem.get(a)))
+            except Exception:
+                ok = False
+    if elem.tag == "position":
+        positions[elem.get("name")] = value
+    else:
+        rotations[elem.get("name")] = value
+    return ok
+
+
+def evaluateDefines(merge=False):
+    # Evaluate constants, variables, quantities, expressions, positions &
+    # rotations of the define section in dependency order
+    # merge : define section of a sub file (physvol <file>, xml include)
+    #         added to the tables of the main document, which are kept
+    if not merge:
+        evaluator.reset()
+        exprNamesCache.clear()
+        defineTypes.clear()
+        positions.clear()
+        rotations.clear()
+        unresolvedDefines.clear()
+        buildRotations()
+    if define is None:
+        return
+    defines = [
+        elem
+        for elem in define
+        if elem.tag in scalarDefines or elem.tag in vectorDefines
+    ]
+    graph, vectors = defineGraph(defines)
+    order, cyclic = topologicalOrder(graph)
+    for name in cyclic:
+        unresolvedDefines[name] = ["cycle"]
+    # scalars in dependency order, then positions & rotations
+    for elem in [graph[name][0] for name in order] + vectors:
+        name = elem.get("name")
+        if elem.tag in scalarDefines:
+            failed = [d for d in graph[name][1] if d in unresolvedDefines]
+            if len(failed) > 0:
+                unresolvedDefines[name] = failed
+                continue
+        if evaluateDefine(elem):
+            defineTypes[name] = elem.tag
+            continue
+        missing = set()
+        for expr in defineExprs(elem):
+            missing.update(exprNames(expr))
+        unresolvedDefines[name] = sorted(
+            n for n in missing if n not in evaluator.symbols
+        ) or ["illegal expression"]
+    buildRotations(
+        elem.get("name") for elem in vectors if elem.tag == "rotation"
+    )
+    reportDefines()
+
+
+def streamDefine(elem):
+    # Streaming import : evaluate a define as soon as it is parsed
+    # False if it uses names not defined yet, left for evaluateDefines
+    name = elem.get("name")
+    if name in defineTypes:
+        print(f"Duplicate define {name} ignored")
+        return True
+    for expr in defineExprs(elem):
+        for n in exprNames(expr):
+            if n not in evaluator.symbols:
+                return False
+    if not evaluateDefine(elem):
+        return False
+    defineTypes[name] = elem.tag
+    if elem.tag == "rotation":
+        buildRotations([name])
+    return True
+
+
+# Streaming import : name -> (vertex, faces, vertsPerFacet) of the
+# tessellated solids whose facet elements have been dropped
+streamedTessellated = {}
+
+
+def tessellatedArrays(solid):
+    # vertex (n, 3) array in mm, facet vertex indexes & vertexes per facet
+    # of a <tessellated>, vertexes deduplicated by name
+    import numpy as np
+
+    ret = streamedTessellated.get(solid.get("name"))
+    if ret is not None:
+        return ret
+    nameIndex = {}
+    indexList = []
+    vertsPerFacet = []
+    for elem in solid:
+        if elem.tag == "triangular":
+            vNames = ("vertex1", "vertex2", "vertex3")
+        elif elem.tag == "quadrangular":
+            vNames = ("vertex1", "vertex2", "vertex3", "vertex4")
+        else:
+            continue
+        for v in vNames:
+            indexList.append(nameIndex.setdefault(elem.get(v), len(nameIndex)))
+        vertsPerFacet.append(len(vNames))
+    vertex = getPositionArray(list(nameIndex))
+    faces = np.array(indexList, dtype=np.int32)
+    return vertex, faces, vertsPerFacet
+
+
+def compactTessellated(solid):
+    # Streaming import : keep the arrays of a parsed <tessellated>, drop
+    # its facet elements, the element stays for the solids index
+    name = solid.get("name")
+    if name in streamedTessellated:
+        return
+    streamedTessellated[name] = tessellatedArrays(solid)
+    attrib = dict(solid.attrib)
+    solid.clear()
+    for key, value in attrib.items():
+        solid.set(key, value)
+
+
+def reportDefines():
+    print(
+        f"Defines evaluated : {len(defineTypes)} "
+        f"unresolved : {len(unresolvedDefines)}"
+    )
+    for name, missing in unresolvedDefines.items():
+        if missing == ["cycle"]:
+            print(f"  {name} : circular definition or depends on one")
+        else:
+            print(f"  {name} : {', '.join(missing)}")
+
+
+def getUnresolvedDefines():
+    return dict(unresolvedDefines)
 
 
 def processConstants(doc):
@@ -122,10 +669,6 @@ def processConstants(doc):
         # constDict[name] = value
         # trace(name)
         # print(dir(name))
-        try:
-            globals()[name] = eval(value)
-        except:  # eg 5*cm
-            globals()[name] = value
         constObj = constantGrp.newObject(
             "App::DocumentObjectGroupPython", name
         )
@@ -146,9 +689,6 @@ def processVariables(doc):
     from .GDMLObjects import GDMLconstant
     from .GDMLObjects import GDMLvariable
 
-    globals()["false"] = False
-    globals()["true"] = True
-
     for cdefine in define.findall("variable"):
         # print cdefine.attrib
         name = str(cdefine.attrib.get("name"))
@@ -159,12 +699,6 @@ def processVariables(doc):
         trace(name)
         # print(dir(name))
         # print('Name  : '+name)
-        try:
-            globals()[name] = eval(value)
-            # print('Value : '+value)
-        except:
-            globals()[name] = value
-            # print('Value String : '+value)
         variableObj = variablesGrp.newObject(
             "App::DocumentObjectGroupPython", name
         )
@@ -197,12 +731,6 @@ def processQuantities(doc):
         trace(name)
         # print(dir(name))
         # print('Name  : '+name)
-        try:
-            globals()[name] = eval(value)
-            # print('Value : '+value)
-        except:
-            globals()[name] = value
-            # print('Value String : '+value)
         quantityObj = quantityGrp.newObject(
             "App::DocumentObjectGroupPython", name
         )
@@ -212,37 +740,14 @@ def processQuantities(doc):
 
 
 def processPositions(doc):
-    print("Process Positions")
-    # need to be done ?
-    global positions
-    positions = {}
-    for elem in define.findall("position"):
-        atts = elem.attrib
-        if "unit" in atts:
-            unit = atts["unit"]
-        else:
-            unit = "mm"
-        if "x" in atts:
-            x = getFloatVal(atts["x"])
-        else:
-            x = 0
-        if "y" in atts:
-            y = getFloatVal(atts["y"])
-        else:
-            y = 0
-        if "z" in atts:
-            z = getFloatVal(atts["z"])
-        else:
-            z = 0
-
-        positions[atts["name"]] = {"unit": unit, "x": x, "y": y, "z": z}
-
+    # evaluated with the other defines by evaluateDefines
+    print(f"Process Positions : {len(positions)}")
     trace("Positions processed")
 
 
 def processExpression(doc):
-    # need to be done ?
-    trace("Expressions Not processed & Displayed")
+    # evaluated by evaluateDefines, need to be displayed ?
+    trace("Expressions Not Displayed")
 
 
 def processRotation(doc):
@@ -264,13 +769,10 @@ def getVal(ptr, var, default=0):
             chkval = vval
         trace("chkval : " + str(chkval))
         try:
-            ret = float(eval(chkval))
+            ret = float(evaluate(chkval))
         except:
-            try:
-                ret = float(chkval)
-            except:
-                print("Illegal float: {}" % chkval)
-                ret = 0.0
+            print("Illegal float: {}".format(chkval))
+            ret = 0.0
 
         trace("return value : " + str(ret))
         return ret
@@ -341,71 +843,68 @@ def getRadians(flag, r):
         return r * math.pi / 180
 
 
+def makeRotation(unit, x, y, z):
+    # FreeCAD Rotation of GDML rotation angles x, y, z
+    radianFlg = unit[:3] != "deg"
+    x = getDegrees(radianFlg, x)
+    y = getDegrees(radianFlg, y)
+    z = getDegrees(radianFlg, z)
+    rotX = FreeCAD.Rotation(FreeCAD.Vector(1, 0, 0), -x)
+    rotY = FreeCAD.Rotation(FreeCAD.Vector(0, 1, 0), -y)
+    rotZ = FreeCAD.Rotation(FreeCAD.Vector(0, 0, 1), -z)
+    return FreeCAD.Rotation(rotX * rotY * rotZ)
+
+
+# name -> Rotation of the defined rotations, built by evaluateDefines
+definedRotations = {}
+# (unit, x, y, z) attribute strings -> Rotation of inline rotations
+inlineRotations = {}
+
+
+def buildRotations(names=None):
+    # names : rotations just evaluated, None clears the tables
+    if names is None:
+        definedRotations.clear()
+        inlineRotations.clear()
+        names = []
+    for name in names:
+        rot = rotations.get(name)
+        if rot is None:
+            continue
+        definedRotations[name] = makeRotation(
+            rot["unit"], rot["x"], rot["y"], rot["z"]
+        )
+
+
+def getElementRotation(rot):
+    # Rotation of an inline <rotation> element, cached by its attributes
+    atts = rot.attrib
+    key = (
+        atts.get("unit", "rad"), atts.get("x"), atts.get("y"), atts.get("z")
+    )
+    ret = inlineRotations.get(key)
+    if ret is None:
+        angles = [
+            0 if v is None else float(evaluate(v)) for v in key[1:]
+        ]
+        ret = makeRotation(key[0], *angles)
+        inlineRotations[key] = ret
+    return ret
+
+
 def processPlacement(base, rot):
-    # setTrace(True)
-    # trace('processPlacement')
     # Different Objects will have adjusted base GDML-FreeCAD
-    # rot is rotation or None if default
-    # set rotation matrix
-    # print('process Placement : '+str(base))
+    # rot is a Rotation (defined rotation), rotation element or None
     if rot is None:
         return FreeCAD.Placement(base, FreeCAD.Rotation(0, 0, 0, 1))
-
-    else:
-        trace("Rotation : ")
-        trace(rot.attrib)
-        x = y = z = 0
-
-        if "name" in rot.attrib:
-            if rot.attrib["name"] == "identity":
-                trace("identity")
-                return FreeCAD.Placement(base, FreeCAD.Rotation(0, 0, 0, 1))
-
-            if rot.attrib["name"] == "center":
-                trace("center")
-                return FreeCAD.Placement(base, FreeCAD.Rotation(0, 0, 0, 1))
-
-        radianFlg = True
-        if "unit" in rot.attrib:
-            # print(rot.attrib['unit'][:3])
-            if rot.attrib["unit"][:3] == "deg":
-                radianFlg = False
-
-        if "x" in rot.attrib:
-            trace("x : " + rot.attrib["x"])
-            # print(eval('HALFPI'))
-            trace(eval(rot.attrib["x"]))
-            x = getDegrees(radianFlg, float(eval(rot.attrib["x"])))
-            trace("x deg : " + str(x))
-
-        if "y" in rot.attrib:
-            trace("y : " + rot.attrib["y"])
-            y = getDegrees(radianFlg, float(eval(rot.attrib["y"])))
-            trace("y deg : " + str(y))
-
-        if "z" in rot.attrib:
-            trace("z : " + rot.attrib["z"])
-            z = getDegrees(radianFlg, float(eval(rot.attrib["z"])))
-            trace("z deg : " + str(z))
-
-        rotX = FreeCAD.Rotation(FreeCAD.Vector(1, 0, 0), -x)
-        rotY = FreeCAD.Rotation(FreeCAD.Vector(0, 1, 0), -y)
-        rotZ = FreeCAD.Rotation(FreeCAD.Vector(0, 0, 1), -z)
-
-        rot = rotX * rotY * rotZ
-        # rot = rotX.multiply(rotY).multiply(rotZ)
-        # rot = rotX
-        # c_rot =  FreeCAD.Vector(0,0,0)  # Center of rotation
-        # print('base : '+str(base))
-        # print('rot  : '+str(rot))
-        # return FreeCAD.Placement(base, rot,  c_rot)
-
-        # placement = FreeCAD.Placement(base, FreeCAD.Rotation(-x,-y,-z))
-        # placement = FreeCAD.Placement(base, FreeCAD.Rotation(-z,-y,-x), \
-        #            base)
-        placement = FreeCAD.Placement(base, FreeCAD.Rotation(rot))
-        # print('placement : '+str(placement))
-        return placement
+    if isinstance(rot, FreeCAD.Rotation):
+        return FreeCAD.Placement(base, rot)
+    trace("Rotation : ")
+    trace(rot.attrib)
+    if rot.get("name") in ["identity", "center"]:
+        trace(rot.get("name"))
+        return FreeCAD.Placement(base, FreeCAD.Rotation(0, 0, 0, 1))
+    return FreeCAD.Placement(base, getElementRotation(rot))
 
 
 def getPositionFromAttrib(pos):
@@ -424,6 +923,17 @@ def getPositionFromAttrib(pos):
     return px, py, pz
 
 
+positionUnits = {
+    "mm": 1,
+    "cm": 10,
+    "m": 1000,
+    "um": 0.001,
+    "nm": 0.000001,
+    "dm": 100,
+    "km": 1000000,
+}
+
+
 def getPositionFromDict(pos):
     # print('getPositionFromAttrib')
     # print('pos : '+str(ET.tostring(pos)))
@@ -433,22 +943,7 @@ def getPositionFromDict(pos):
     #   name = pos.get('name')
     #   if name == 'center' :
     #      return(0,0,0)
-    unit = pos["unit"]
-    mul = 1
-
-    unitsDict = {
-        "mm": 1,
-        "cm": 10,
-        "m": 1000,
-        "um": 0.001,
-        "nm": 0.000001,
-        "dm": 100,
-        "m": 1000,
-        "km": 1000000,
-    }
-
-    if unit in unitsDict:
-        mul = unitsDict[unit]
+    mul = positionUnits.get(pos["unit"], 1)
 
     try:
         px = mul * float(pos["x"])
@@ -493,6 +988,17 @@ def getDefinedPosition(name):
             return 0, 0, 0
 
 
+def getPositionArray(names):
+    # Scaled positions for a list of names as a numpy (n, 3) array
+    return positions.scaled(names)
+
+
+def getPositionVector(name):
+    # Unscaled Vector from positions dict built by evaluateDefines
+    pos = positions[name]
+    return FreeCAD.Vector(pos["x"], pos["y"], pos["z"])
+
+
 def getPosition(xmlEntity):
     # Get position via reference
     # setTrace(True)
@@ -519,8 +1025,12 @@ def testPosition(xmlEntity, px, py, pz):
 
 
 def getDefinedRotation(name):
-    # Just get definition - used by parseMultiUnion passed to create solids
-    return define.find("rotation[@name='%s']" % name)
+    # Rotation from the table built by evaluateDefines, passed to
+    # processPlacement. Rotation element if not in the table
+    rot = definedRotations.get(name)
+    if rot is not None:
+        return rot
+    return defineIndex.find(name, "rotation")
 
 
 def getRotation(xmlEntity):
@@ -528,33 +1038,23 @@ def getRotation(xmlEntity):
     rotref = getRef(xmlEntity, "rotationref")
     trace("rotref : " + str(rotref))
     if rotref is not None:
-        rot = define.find("rotation[@name='%s']" % rotref)
+        rot = getDefinedRotation(rotref)
     else:
         rot = xmlEntity.find("rotation")
-    if rot is not None:
-        trace(rot.attrib)
+    trace(rot)
     return rot
 
 
 def getRotFromRefs(ptr):
-    printverbose = True
     trace("getRotFromRef")
-    rot = define.find("rotation[@name='%s']" % getRef(ptr, "rotationref"))
-    if rot is not None:
-        trace(rot.attrib)
+    rot = getDefinedRotation(getRef(ptr, "rotationref"))
+    trace(rot)
     return rot
 
 
 def getDefinedVector(solid, v):
-    global define
     # print('get Defined Vector : '+v)
-    name = solid.get(v)
-    pos = define.find("position[@name='%s']" % name)
-    # print(pos.attrib)
-    x = getVal(pos, "x")
-    y = getVal(pos, "y")
-    z = getVal(pos, "z")
-    return FreeCAD.Vector(x, y, z)
+    return getPositionVector(solid.get(v))
 
 
 def getPlacement(pvXML):
@@ -577,19 +1077,8 @@ def getScale(pvXML):
 
 
 def getVertex(v):
-    global define
     trace("Vertex")
-    # print(dir(v))
-    pos = define.find("position[@name='%s']" % v)
-    # print("Position")
-    # print(dir(pos))
-    x = getVal(pos, "x")
-    trace("x : " + str(x))
-    y = getVal(pos, "y")
-    trace("y : " + str(y))
-    z = getVal(pos, "z")
-    trace("z : " + str(z))
-    return FreeCAD.Vector(x, y, z)
+    return getPositionVector(v)
 
 
 def facet(f):
@@ -630,3 +1119,117 @@ def quad(v1, v2, v3, v4):
     except:
         print(f"Failed to create Face {v1} {v2} {v3} {v4}")
         return None
+
+
+def tessellationHash(vertex, facets):
+    # content hash of the source vertexes & facets of a tessellated
+    # solid, lets exportCache key it without serialising its shape
+    import hashlib
+
+    h = hashlib.sha256()
+    if hasattr(vertex, "tobytes"):
+        h.update(vertex.tobytes())
+    else:
+        h.update(repr([tuple(v) for v in vertex]).encode())
+    if hasattr(facets, "tobytes"):
+        h.update(facets.tobytes())
+    else:
+        h.update(
+            repr(
+                [
+                    tuple(f.Points) if hasattr(f, "Points") else tuple(f)
+                    for f in facets
+                ]
+            ).encode()
+        )
+    return h.hexdigest()
+
+
+def useBulkTessellation():
+    params = FreeCAD.ParamGet("User parameter:BaseApp/Preferences/Mod/GDML")
+    return params.GetBool("bulkTessellation", True)
+
+
+def meshFaces(points, triangles, quads, isQuad=None, tolerance=1e-6):
+    # faces of a tessellated solid, the triangles are built & sewn by OCC
+    # in a single call, quadrangular facets are kept as 4 vertex faces as
+    # the per facet path (triangle / quad) builds them.
+    # isQuad : per facet flags in file order, to keep the facet order
+    triFaces = []
+    if len(triangles) > 0:
+        shape = Part.Shape()
+        shape.makeShapeFromMesh((points, triangles), tolerance)
+        triFaces = shape.Faces
+    if len(quads) == 0:
+        return triFaces
+    quadFaces = []
+    for q in quads:
+        v = [FreeCAD.Vector(points[i]) for i in q]
+        face = quad(*v)
+        if face is not None:
+            quadFaces.append([face])
+            continue
+        # non planar, as two triangles
+        quadFaces.append([
+            t
+            for t in (triangle(v[0], v[1], v[2]), triangle(v[0], v[2], v[3]))
+            if t is not None
+        ])
+    if isQuad is None or len(triFaces) != len(triangles):
+        # degenerate triangles dropped, order can not be kept
+        return triFaces + [f for fs in quadFaces for f in fs]
+    faces = []
+    tris = iter(triFaces)
+    quadIter = iter(quadFaces)
+    for q in isQuad:
+        if q:
+            faces.extend(next(quadIter))
+        else:
+            faces.append(next(tris))
+    return faces
+
+
+def bulkFacets(vertex, facets, mul=1, tolerance=1e-6):
+    # passed vertex list & facet index lists return list of faces
+    points = [mul * FreeCAD.Vector(v) for v in vertex]
+    triangles = [tuple(f) for f in facets if len(f) == 3]
+    quads = [f for f in facets if len(f) == 4]
+    isQuad = [len(f) == 4 for f in facets]
+    return meshFaces(points, triangles, quads, isQuad, tolerance)
+
+
+def arrayFacets(vertex, index, vertsPerFacet, mul=1, tolerance=1e-6):
+    # numpy vertex (n, 3), flat facet index & vertsPerFacet arrays to
+    # faces, the index tuples are sliced out with numpy not per facet
+    import numpy as np
+
+    points = (np.asarray(vertex, dtype=float) * mul).tolist()
+    index = np.asarray(index)
+    counts = np.asarray(vertsPerFacet)
+    starts = np.cumsum(counts) - counts
+    triStarts = starts[counts == 3]
+    triangles = index[triStarts[:, None] + np.arange(3)].tolist()
+    quadStarts = starts[counts == 4]
+    quads = index[quadStarts[:, None] + np.arange(4)].tolist()
+    # makeShapeFromMesh wants tuples
+    triangles = list(map(tuple, triangles))
+    return meshFaces(
+        points, triangles, quads, (counts == 4).tolist(), tolerance
+    )
+
+
+def solidFromFaces(faces):
+    try:
+        return Part.Solid(Part.Shell(faces))
+    except:
+        # make compound rather than just barf
+        FreeCAD.Console.PrintWarning("Problem making Solid\n")
+        return Part.makeCompound(faces)
+
+
+def bulkSolid(vertex, facets, mul=1):
+    return solidFromFaces(bulkFacets(vertex, facets, mul))
+
+
+def arraySolid(vertex, index, vertsPerFacet, mul=1):
+    return solidFromFaces(arrayFacets(vertex, index, vertsPerFacet, mul))
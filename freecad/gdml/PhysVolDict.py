@@ -15,7 +15,8 @@ class physVolDict:
         self.volDict[pvName] = vol
 
     def lookUp(self, pvName):
-        return self.volDict[pvName]
+        # None if physvol not imported e.g. outside import region
+        return self.volDict.get(pvName)
 
     def reBuild(self):
         # Rebuild volDict from current document
@@ -0,0 +1,259 @@
+# **************************************************************************
+# *                                                                        *
+# *   Copyright (c) 2024 Keith Sloan <keith@sloan-home.co.uk>              *
+# *                                                                        *
+# *   This program is free software; you can redistribute it and/or modify*
+# *   it under the terms of the GNU Lesser General Public License (LGPL)   *
+# *   as published by the Free Software Foundation; either version 2 of    *
+# *   the License, or (at your option) any later version.                  *
+# *   for detail see the LICENCE text file.                                *
+# *                                                                        *
+# *   This program is distributed in the hope that it will be useful,      *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of       *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the        *
+# *   GNU Library General Public License for more details.                 *
+# *                                                                        *
+# *   You should have received a copy of the GNU Library General Public    *
+# *   License along with this program; if not, write to the Free Software  *
+# *   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307 *
+# *   USA                                                                  *
+# *                                                                        *
+# *                                                                        *
+# **************************************************************************
+#
+#
+# Common face detection for border surfaces on export
+#
+# Every solid of the two physvols of a border surface used to be tested
+# against every solid of the other with OCC booleans. The candidates'
+# placed bounding boxes now go in a bounding volume hierarchy (BoxTree)
+# so only overlapping pairs get the exact test, which itself only calls
+# common on faces whose bounding boxes overlap. The exact tests run in a
+# pool of worker processes (preference exportWorkers), results are merged
+# in the original pair order so surface names do not change.
+
+import FreeCAD
+
+# box overlap tolerance in mm
+boxTolerance = 1e-6
+# common face tolerance, as checkFaces
+faceTolerance = 1e-7
+
+
+def overlaps(b1, b2, tol):
+    return (
+        b1[0] <= b2[3] + tol
+        and b2[0] <= b1[3] + tol
+        and b1[1] <= b2[4] + tol
+        and b2[1] <= b1[4] + tol
+        and b1[2] <= b2[5] + tol
+        and b2[2] <= b1[5] + tol
+    )
+
+
+class BoxTree:
+    # bounding volume hierarchy of boxes (xmin, ymin, zmin, xmax, ymax, zmax)
+    # node : (box, leaf items or None, left, right)
+    leafSize = 8
+
+    def __init__(self, boxes, payloads):
+        items = list(zip(boxes, payloads))
+        self.root = self.build(items) if len(items) > 0 else None
+
+    def build(self, items):
+        box = (
+            min(b[0] for b, p in items),
+            min(b[1] for b, p in items),
+            min(b[2] for b, p in items),
+            max(b[3] for b, p in items),
+            max(b[4] for b, p in items),
+            max(b[5] for b, p in items),
+        )
+        if len(items) <= self.leafSize:
+            return (box, items, None, None)
+        # split at the median of the longest axis
+        axis = max(range(3), key=lambda a: box[a + 3] - box[a])
+        items.sort(key=lambda i: i[0][axis] + i[0][axis + 3])
+        mid = len(items) // 2
+        return (box, None, self.build(items[:mid]), self.build(items[mid:]))
+
+    def query(self, box, tol=boxTolerance):
+        ret = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            nodeBox, items, left, right = stack.pop()
+            if not overlaps(nodeBox, box, tol):
+                continue
+            if items is not None:
+                ret.extend(p for b, p in items if overlaps(b, box, tol))
+            else:
+                stack.append(left)
+                stack.append(right)
+        return ret
+
+
+def boxTuple(bb):
+    return (bb.XMin, bb.YMin, bb.ZMin, bb.XMax, bb.YMax, bb.ZMax)
+
+
+def placedBox(obj, placement):
+    # box of obj.Shape moved by placement, from its 8 corners
+    bb = obj.Shape.BoundBox
+    matrix = placement.Matrix
+    placed = FreeCAD.BoundBox()
+    for x in (bb.XMin, bb.XMax):
+        for y in (bb.YMin, bb.YMax):
+            for z in (bb.ZMin, bb.ZMax):
+                placed.add(matrix.multVec(FreeCAD.Vector(x, y, z)))
+    return boxTuple(placed)
+
+
+def exactTest(shape1, matrix1, shape2, matrix2):
+    # True if the placed shapes have a common face
+    shape1 = shape1.transformGeometry(matrix1)
+    shape2 = shape2.transformGeometry(matrix2)
+    faces2 = shape2.Faces
+    tree = BoxTree([boxTuple(f.BoundBox) for f in faces2], faces2)
+    for f1 in shape1.Faces:
+        near = tree.query(boxTuple(f1.BoundBox))
+        if len(near) == 0:
+            continue
+        if len(f1.common(near, faceTolerance).Faces) > 0:
+            return True
+    return False
+
+
+# worker state, set by initWorker
+workerBreps = {}
+workerShapes = {}
+
+
+def initWorker(paths, breps):
+    from .parallelShapes import initWorker as initPaths
+
+    initPaths(paths)
+    workerBreps.update(breps)
+
+
+def workerShape(name):
+    import Part
+
+    shape = workerShapes.get(name)
+    if shape is None:
+        shape = Part.Shape()
+        shape.importBrepFromString(workerBreps[name])
+        workerShapes[name] = shape
+    return shape
+
+
+def workerTest(job):
+    # Runs in a worker, job is (name1, matrix1, name2, matrix2)
+    name1, m1, name2, m2 = job
+    try:
+        return exactTest(
+            workerShape(name1),
+            FreeCAD.Matrix(*m1),
+            workerShape(name2),
+            FreeCAD.Matrix(*m2),
+        )
+    except Exception as e:
+        print(f"Worker failed common face test {name1} {name2} : {e}")
+        return False
+
+
+def exactTests(pairs, workers):
+    # pairs of ((obj, placement), (obj, placement)), returns bools
+    if workers <= 1 or len(pairs) < 2:
+        return [
+            exactTest(o1.Shape, p1.Matrix, o2.Shape, p2.Matrix)
+            for (o1, p1), (o2, p2) in pairs
+        ]
+    from concurrent.futures import ProcessPoolExecutor
+    from .parallelShapes import getContext
+
+    breps = {}
+    jobs = []
+    for (o1, p1), (o2, p2) in pairs:
+        for obj in (o1, o2):
+            if obj.Name not in breps:
+                breps[obj.Name] = obj.Shape.exportBrepToString()
+        jobs.append((o1.Name, tuple(p1.Matrix.A), o2.Name, tuple(p2.Matrix.A)))
+    print(f"Testing {len(jobs)} border surface pairs with {workers} workers")
+    ctx, paths = getContext()
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=ctx,
+            initializer=initWorker,
+            initargs=(paths, breps),
+        ) as pool:
+            chunk = max(1, len(jobs) // (4 * workers))
+            return list(pool.map(workerTest, jobs, chunksize=chunk))
+    except Exception as e:
+        FreeCAD.Console.PrintWarning(
+            f"Parallel border surface test failed, testing serially : {e}\n"
+        )
+        return exactTests(pairs, 0)
+
+
+def overlappingPairs(dict1, dict2):
+    # ((assem1, idx1, items1), (assem2, idx2, items2)) of the getSubVols
+    # candidates whose placed boxes overlap, in the order processCandidates
+    # used to visit them
+    entries = []
+    for order2, (assem2, set2) in enumerate(dict2.items()):
+        for idx2, items2 in enumerate(set2):
+            if hasattr(items2[0], "Shape"):
+                entries.append((order2, assem2, idx2, items2))
+    tree = BoxTree([placedBox(*e[3]) for e in entries], entries)
+    candidates = []
+    for order1, (assem1, set1) in enumerate(dict1.items()):
+        for idx1, items1 in enumerate(set1):
+            if not hasattr(items1[0], "Shape"):
+                continue
+            for order2, assem2, idx2, items2 in tree.query(
+                placedBox(*items1)
+            ):
+                if items1 != items2:
+                    candidates.append(
+                        (
+                            (order1, order2, idx1, idx2),
+                            (assem1, idx1, items1),
+                            (assem2, idx2, items2),
+                        )
+                    )
+    candidates.sort(key=lambda c: c[0])
+    total = sum(len(s) for s in dict1.values())
+    total *= sum(len(s) for s in dict2.values())
+    print(f"{len(candidates)} of {total} pairs have overlapping boxes")
+    return [(c[1], c[2]) for c in candidates]
+
+
+def commonFacePairs(dict1, dict2, workers=0):
+    # (assem1, idx1, obj1, assem2, idx2, obj2) of the candidates with a
+    # common face
+    candidates = overlappingPairs(dict1, dict2)
+    pairs = [(c1[2], c2[2]) for c1, c2 in candidates]
+    results = exactTests(pairs, workers)
+    ret = []
+    for (c1, c2), common in zip(candidates, results):
+        assem1, idx1, items1 = c1
+        assem2, idx2, items2 = c2
+        pairStr = f"{items1[0].Label} : {items2[0].Label} "
+        if common:
+            print(f"<<< Common face : {pairStr} >>>")
+            ret.append((assem1, idx1, items1[0], assem2, idx2, items2[0]))
+        else:
+            print(f"<<< No common face : {pairStr} >>>")
+    return ret
+
+
+def hasCommonFace(dict1, dict2):
+    # True as soon as one candidate pair has a common face
+    for (assem1, idx1, items1), (assem2, idx2, items2) in overlappingPairs(
+        dict1, dict2
+    ):
+        (o1, p1), (o2, p2) = items1, items2
+        if exactTest(o1.Shape, p1.Matrix, o2.Shape, p2.Matrix):
+            return True
+    return False
@@ -0,0 +1,142 @@
+# **************************************************************************
+# *                                                                        *
+# *   Copyright (c) 2024 Keith Sloan <keith@sloan-home.co.uk>              *
+# *                                                                        *
+# *   This program is free software; you can redistribute it and/or modify*
+# *   it under the terms of the GNU Lesser General Public License (LGPL)   *
+# *   as published by the Free Software Foundation; either version 2 of    *
+# *   the License, or (at your option) any later version.                  *
+# *   for detail see the LICENCE text file.                                *
+# *                                                                        *
+# *   This program is distributed in the hope that it will be useful,      *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of       *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the        *
+# *   GNU Library General Public License for more details.                 *
+# *                                                                        *
+# *   You should have received a copy of the GNU Library General Public    *
+# *   License along with this program; if not, write to the Free Software  *
+# *   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307 *
+# *   USA                                                                  *
+# *                                                                        *
+# *                                                                        *
+# **************************************************************************
+#
+#
+# On disk cache of exported tessellated solids (preference exportCache)
+#
+# Entries hold the XML text of a solid's <position> defines and its
+# <tessellated> element, keyed by a hash of the solid type, exported name,
+# placement and the vertexes & facets the solid was built from: the
+# sourceHash of its proxy, the vertex & facet lists of sampled solids or
+# the BREP of solids made before sourceHash. So a re-export copies
+# unchanged solids verbatim and only serialises edited ones.
+# Least recently used entries are evicted above exportCacheSizeMB.
+
+import os
+import hashlib
+import pickle
+
+from . import importCache
+
+cacheFormat = 2
+# (obj.Name, exported name) -> key, for the current export
+keys = {}
+
+
+def useCache():
+    return importCache.getParams().GetBool("exportCache", False)
+
+
+def cacheDir():
+    base = os.path.dirname(importCache.cacheDir())
+    return os.path.join(base, "exportCache")
+
+
+def reset():
+    keys.clear()
+
+
+def solidKey(obj, name):
+    if (obj.Name, name) in keys:
+        return keys[(obj.Name, name)]
+    solidType = obj.Proxy.Type
+    h = hashlib.sha256()
+    h.update(b"format %d " % cacheFormat)
+    h.update(importCache.workbenchVersion())
+    h.update(solidType.encode())
+    h.update(name.encode())
+    if solidType == "GDMLSampledTessellated":
+        for prop in ["vertsList", "indexList", "vertsPerFacet"]:
+            h.update(repr(getattr(obj, prop)).encode())
+    else:
+        # vertices are exported relative to the placement
+        h.update(repr(obj.Placement.Base).encode())
+        h.update(repr(obj.Placement.Rotation.Q).encode())
+        sourceHash = getattr(obj.Proxy, "sourceHash", None)
+        if sourceHash is not None:
+            # hash of the vertexes & facets the shape was built from
+            h.update(sourceHash.encode())
+            for prop in ["lunit", "scale"]:
+                if hasattr(obj, prop):
+                    h.update(repr(getattr(obj, prop)).encode())
+        else:
+            # made before sourceHash, the shape itself
+            h.update(obj.Shape.exportBrepToString().encode())
+    key = h.hexdigest()
+    keys[(obj.Name, name)] = key
+    return key
+
+
+def entryPath(key):
+    return os.path.join(cacheDir(), key + ".pickle")
+
+
+def cached(obj, name):
+    return os.path.exists(entryPath(solidKey(obj, name)))
+
+
+def load(key):
+    path = entryPath(key)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            fragments = pickle.load(f)
+    except Exception as e:
+        print(f"Discarding unreadable export cache entry : {e}")
+        os.remove(path)
+        return None
+    # mark as recently used
+    os.utime(path)
+    return fragments
+
+
+def store(key, fragments):
+    # fragments : (define, solid) XML bytes
+    os.makedirs(cacheDir(), exist_ok=True)
+    path = entryPath(key)
+    tmpPath = path + ".tmp"
+    with open(tmpPath, "wb") as f:
+        pickle.dump(fragments, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmpPath, path)
+
+
+def evict():
+    limit = importCache.getParams().GetInt("exportCacheSizeMB", 1024)
+    limit *= 1024 * 1024
+    d = cacheDir()
+    if not os.path.isdir(d):
+        return
+    entries = []
+    for name in os.listdir(d):
+        if name.endswith(".pickle"):
+            path = os.path.join(d, name)
+            st = os.stat(path)
+            entries.append((st.st_mtime, st.st_size, path))
+    entries.sort()
+    total = sum(e[1] for e in entries)
+    for mtime, size, path in entries:
+        if total <= limit:
+            break
+        os.remove(path)
+        total -= size
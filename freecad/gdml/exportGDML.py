@@ -73,9 +73,11 @@ from .GDMLObjects import (
     GDMLvariable,
     GDMLquantity,
     GDMLbordersurface,
+    deferredShapes,
 )
 
 from . import GDMLShared
+from . import exportCache
 
 # ***************************************************************************
 # Tailor following to your requirements ( Should all be strings )          *
@@ -221,6 +223,109 @@ def indent(elem, level=0):
     return elem
 
 
+#########################################################
+# Streaming export (preference streamExport)            #
+#########################################################
+# Completed children of the define & solids sections are written to
+# temporary files and removed from the tree as the export goes, the
+# final file is assembled in GDML section order. Memory is then bounded
+# by the largest solid rather than the whole model.
+
+spillSize = 256
+# section tag -> SectionSpill, empty when not streaming
+spills = {}
+# obj.Name -> (define, solid) XML of tessellated solids, see parallelExport
+tessellatedFragments = {}
+
+
+def elementBytes(elem, level):
+    # pretty printed elem on its own lines at indent level
+    indent(elem, level)
+    elem.tail = None
+    return b"  " * level + ET.tostring(elem) + b"\n"
+
+
+class SectionSpill:
+    def __init__(self, section):
+        import tempfile
+
+        self.section = section
+        self.file = tempfile.TemporaryFile()
+        self.count = 0
+
+    def spill(self):
+        for elem in list(self.section):
+            self.file.write(elementBytes(elem, 2))
+            self.section.remove(elem)
+            self.count += 1
+
+    def write(self, xml, count):
+        # XML text of count elements, one per line
+        self.spill()
+        for line in xml.splitlines():
+            self.file.write(b"    " + line + b"\n")
+        self.count += count
+
+    def copyTo(self, out):
+        import shutil
+
+        self.spill()
+        self.file.seek(0)
+        shutil.copyfileobj(self.file, out)
+        self.file.close()
+
+
+def startStreaming():
+    global spills
+    spills = {"define": SectionSpill(define), "solids": SectionSpill(solids)}
+
+
+def spillSections():
+    # only called between solids, when no element is half built
+    for spill in spills.values():
+        if len(spill.section) >= spillSize:
+            spill.spill()
+
+
+def insertFragments(defineXML, solidXML):
+    # define & solids children built as XML text away from the tree
+    for section, xml in ((define, defineXML), (solids, solidXML)):
+        if len(xml) == 0:
+            continue
+        spill = spills.get(section.tag)
+        if spill is not None:
+            # defines are one per line, the solid is one element
+            count = xml.count(b"\n") + 1 if section is define else 1
+            spill.write(xml, count)
+            continue
+        parser = ET.XMLParser(remove_blank_text=True)
+        wrapper = ET.fromstring(b"<fragment>" + xml + b"</fragment>", parser)
+        section.extend(list(wrapper))
+
+
+def writeStreamed(filepath):
+    global spills
+    head = ET.Element(gdml.tag, attrib=dict(gdml.attrib))
+    head.text = "\n"
+    startTag = ET.tostring(head)
+    startTag = startTag[: startTag.rindex(b"</")]
+    with open(filepath, "wb") as out:
+        out.write(b"<?xml version='1.0' encoding='UTF-8'?>\n")
+        out.write(startTag)
+        for section in gdml:
+            spill = spills.get(section.tag)
+            if spill is None:
+                out.write(elementBytes(section, 1))
+                continue
+            tag = section.tag.encode()
+            out.write(b"  <" + tag + b">\n")
+            spill.copyTo(out)
+            out.write(b"  </" + tag + b">\n")
+            print(f"{spill.count} {section.tag} elements streamed")
+        out.write(b"</gdml>\n")
+    spills = {}
+
+
 #########################################
 
 
@@ -262,11 +367,22 @@ def GDMLstructure():
     global identityDefined
     global gxml
     global skinSurfaces
+    global spills
+    global positionDefines, rotationDefines, defineTolerance
+    global tessellatedFragments
 
     centerDefined = False
     identityDefined = False
     defineCnt = LVcount = PVcount = POScount = ROTcount = SCLcount = 1
     skinSurfaces = []
+    spills = {}
+    tessellatedFragments = {}
+    exportCache.reset()
+    positionDefines = {}
+    rotationDefines = {}
+    defineTolerance = FreeCAD.ParamGet(
+        "User parameter:BaseApp/Preferences/Mod/GDML"
+    ).GetFloat("exportDefineTolerance", 1e-6)
 
     gdml = initGDML()
     define = ET.SubElement(gdml, "define")
@@ -886,6 +1002,19 @@ def addPhysVolPlacement(obj, xmlVol, volName, placement, pvName=None, refName=No
         return pvol
 
 
+# Positions & rotations are defined once per value, quantised to
+# defineTolerance (mm / deg), and referenced by every placement using it
+positionDefines = {}
+rotationDefines = {}
+defineTolerance = 1e-6
+
+
+def quantise(values):
+    if defineTolerance <= 0:
+        return tuple(values)
+    return tuple(round(v / defineTolerance) for v in values)
+
+
 def exportPosition(name, xml, pos):
     global POScount
     global centerDefined
@@ -905,7 +1034,13 @@ def exportPosition(name, xml, pos):
         ET.SubElement(xml, "positionref", {"ref": "center"})
 
     else:
+        key = quantise((x, y, z))
+        posName = positionDefines.get(key)
+        if posName is not None:
+            ET.SubElement(xml, "positionref", {"ref": posName})
+            return
         posName = "P-" + name + str(POScount)
+        positionDefines[key] = posName
         POScount += 1
         posxml = ET.SubElement(
             define, "position", {"name": posName, "unit": "mm"}
@@ -923,7 +1058,12 @@ def exportRotation(name, xml, rot):
     print("Export Rotation")
     global ROTcount
     global identityDefined
-    if rot.Angle == 0:
+    angles = None
+    if rot.Angle != 0:
+        angles = quaternion2XYZ(rot)
+        if angles[0] == 0 and angles[1] == 0 and angles[2] == 0:
+            angles = None
+    if angles is None:
         if not identityDefined:
             identityDefined = True
             ET.SubElement(
@@ -935,12 +1075,14 @@ def exportRotation(name, xml, rot):
         rotName = "identity"
 
     else:
-        angles = quaternion2XYZ(rot)
         a0 = angles[0]
         a1 = angles[1]
         a2 = angles[2]
-        if a0 != 0 or a1 != 0 or a2 != 0:
+        key = quantise((a0, a1, a2))
+        rotName = rotationDefines.get(key)
+        if rotName is None:
             rotName = "R-" + name + str(ROTcount)
+            rotationDefines[key] = rotName
             ROTcount += 1
             rotxml = ET.SubElement(
                 define, "rotation", {"name": rotName, "unit": "deg"}
@@ -951,7 +1093,7 @@ def exportRotation(name, xml, rot):
                 rotxml.attrib["y"] = str(-a1)
             if abs(a2) != 0:
                 rotxml.attrib["z"] = str(-a2)
-            ET.SubElement(xml, "rotationref", {"ref": rotName})
+        ET.SubElement(xml, "rotationref", {"ref": rotName})
 
     return rotName
 
@@ -1232,48 +1374,14 @@ def exportSurfaceProperty(Name, Surface, ref1, ref2):
 
 
 def checkFaces(pair1, pair2):
-    def preCheck(shape1, shape2):
-        #
-        # Precheck common faces, by checking
-        # if bounding boxes separation is comparable
-        # to sum of half-lengths
-        #
-        b1 = shape1.BoundBox
-        b2 = shape2.BoundBox
-        vcc = b2.Center - b1.Center
-        if (
-            abs(vcc.x) > (b1.XLength + b2.XLength) * 1.01 / 2
-            or abs(vcc.y) > (b1.YLength + b2.YLength) * 1.01 / 2
-            or abs(vcc.z) > (b1.ZLength + b2.ZLength) * 1.01 / 2
-        ):
-            return False
-        else:
-            return True
-
-    tolerence = 1e-7
-    obj1 = pair1[0]
-    matrix1 = pair1[1].Matrix
-    obj2 = pair2[0]
-    matrix2 = pair2[1].Matrix
+    from .borderSurfaces import exactTest
 
+    obj1, placement1 = pair1
+    obj2, placement2 = pair2
     if hasattr(obj1, "Shape") and hasattr(obj2, "Shape"):
-        obj1t = obj1.Shape.transformGeometry(matrix1)
-        obj2t = obj2.Shape.transformGeometry(matrix2)
-        if not preCheck(obj1t, obj2t):
-            print("Fails precheck")
-            return False
-
-        faces1 = obj1t.Faces
-        faces2 = obj2t.Faces
-        #        faces1 = obj1.Shape.Faces
-        #        faces2 = obj2.Shape.Faces
-        for f1 in faces1:
-            comShape = f1.common(faces2, tolerence)
-            if len(comShape.Faces) > 0:
-                print("Common")
-                return True
-            else:
-                print("Not common")
+        return exactTest(
+            obj1.Shape, placement1.Matrix, obj2.Shape, placement2.Matrix
+        )
     return False
 
 
@@ -1290,6 +1398,22 @@ def processSurface(name, cnt, surface,
 
 def processCandidates(name, surface, check, Obj1, dict1, Obj2, dict2):
     cnt = 1
+    if check:
+        # only pairs with overlapping boxes get the common face test
+        from .borderSurfaces import commonFacePairs
+
+        params = FreeCAD.ParamGet(
+            "User parameter:BaseApp/Preferences/Mod/GDML"
+        )
+        workers = params.GetInt("exportWorkers", 0)
+        for assem1, idx1, obj1, assem2, idx2, obj2 in commonFacePairs(
+            dict1, dict2, workers
+        ):
+            cnt = processSurface(name, cnt, surface,
+                                 Obj1, obj1, idx1, assem1,
+                                 Obj2, obj2, idx2, assem2)
+            cnt += 1
+        return
     for assem1, set1 in dict1.items():
         print(f"process Candidates {assem1} {check} {len(set1)}")
         for assem2, set2 in dict2.items():
@@ -1299,22 +1423,11 @@ def processCandidates(name, surface, check, Obj1, dict1, Obj2, dict2):
                 for idx2, items2 in enumerate(set2):
                     obj2 = items2[0]
                     if items1 != items2:
-                        if check:
-                            pairStr = f"{obj1.Label} : {obj2.Label} "
-                            if checkFaces(items1, items2):
-                                cnt = processSurface(name, cnt, surface,
-                                                     Obj1, obj1, idx1, assem1,
-                                                     Obj2, obj2, idx2, assem2)
-                                print(f"<<< Common face : {pairStr} >>>")
-                                cnt += 1
-                            else:
-                                print(f"<<< No common face : {pairStr} >>>")
-                        else:
-                            cnt = processSurface(
-                                name, cnt, surface,
-                                Obj1, obj1, idx1, assem1,
-                                Obj2, obj2, idx2, assem2
-                            )
+                        cnt = processSurface(
+                            name, cnt, surface,
+                            Obj1, obj1, idx1, assem1,
+                            Obj2, obj2, idx2, assem2
+                        )
 
 
 def printListObj(name, listArg):
@@ -1831,6 +1944,9 @@ def getMaterial(obj):
 
     if material[0:3] == "G4_":
         print(f"Found Geant material {material}")
+        from .g4Materials import ensureMaterial
+
+        ensureMaterial(FreeCAD.ActiveDocument, material)
         usedGeant4Materials.add(material)
 
     return material
@@ -2172,6 +2288,7 @@ def processVolume(vol, xmlParent, psPlacement, isPhysVol=True, volName=None):
             return
         solidExporter.export()
         print(f"Process Volume - solids count {len(list(solids))}")
+        spillSections()
         # 1- adds a <volume element to <structure with name volName
         if volName == solidExporter.name():
             volName = "V-" + solidExporter.name()
@@ -2304,6 +2421,56 @@ def processVolAssem(vol, xmlParent, parentName, psPlacement=None, isPhysVol=True
         print("skipping " + vol.Label)
 
 
+def addExportedSolid(obj, found):
+    # obj and the solids its exporter exports first
+    exporter = SolidExporter.getExporter(obj)
+    if exporter is None:
+        return
+    found.append(obj)
+    for sub in exporter.subSolids():
+        if sub.TypeId != "App::Part":
+            addExportedSolid(sub, found)
+
+
+def exportedSolids(vol, found=None):
+    # solid objects processVolAssem(vol) exports, in export order, found
+    # without exporting anything (parallelExport)
+    if found is None:
+        found = []
+    if vol.TypeId == "App::Link" or vol.Label[:12] == "NOT_Expanded":
+        return found
+    arrays = False
+    if isContainer(vol):
+        heads = assemblyHeads(vol)
+        addExportedSolid(heads[0], found)
+        others = heads[1:]
+    elif isAssembly(vol):
+        others = assemblyHeads(vol)
+        arrays = True
+    else:
+        top = topObj(vol) if vol.TypeId == "App::Part" else vol
+        if top is None:
+            return found
+        if isMultiPlacement(top):
+            # first solid below the placers, as processMultiPlacement
+            for s in [top] + top.OutListRecursive:
+                if SolidExporter.isSolid(s):
+                    addExportedSolid(s, found)
+                    break
+        else:
+            addExportedSolid(top, found)
+        return found
+    for obj in others:
+        if obj.TypeId == "App::Link":
+            continue
+        if arrays and obj.TypeId != "App::Part" and isArrayType(obj):
+            # processAssembly -> processArrayPart
+            exportedSolids(obj.Base, found)
+        else:
+            exportedSolids(obj, found)
+    return found
+
+
 def printVolumeInfo(vol, xmlVol, xmlParent, parentName):
     if xmlVol is not None:
         xmlstr = ET.tostring(xmlVol)
@@ -2706,16 +2873,27 @@ def exportGDML(first, filepath, fileExt):
     print("File extension : " + fileExt)
 
     GDMLstructure()
-    zOrder = 1
-    processMaterials()
-    exportWorldVol(first, fileExt)
     params = FreeCAD.ParamGet(
         "User parameter:BaseApp/Preferences/Mod/GDML"
     )
+    streamExport = fileExt == ".gdml" and params.GetBool("streamExport", False)
+    if streamExport:
+        startStreaming()
+    workers = params.GetInt("exportWorkers", 0)
+    if workers > 0 and XML_IO_VERSION == "lxml":
+        from .parallelExport import buildTessellated
+
+        global tessellatedFragments
+        tessellatedFragments = buildTessellated(first, workers)
+    zOrder = 1
+    processMaterials()
+    exportWorldVol(first, fileExt)
     exportG4Materials = params.GetBool('exportG4Materials', False)
     if exportG4Materials:
         postCreateGeantMaterials()
     processOpticals()
+    if exportCache.useCache():
+        exportCache.evict()
     # format & write GDML file
     # xmlstr = ET.tostring(structure)
     # print('Structure : '+str(xmlstr))
@@ -2726,7 +2904,9 @@ def exportGDML(first, filepath, fileExt):
         # ET.ElementTree(gdml).write(filepath, 'utf-8', True)
         # ET.ElementTree(gdml).write(filepath, xml_declaration=True)
         # Problem with pretty Print on Windows ?
-        if platform == "win32":
+        if streamExport:
+            writeStreamed(filepath)
+        elif platform == "win32":
             indent(gdml)
             ET.ElementTree(gdml).write(filepath, xml_declaration=True)
         else:
@@ -2995,6 +3175,8 @@ def export(exportList, filepath):
 
     first = exportList[0]
     print(f"Export Volume: {first.Label}")
+    # solids imported with lazyShapes
+    deferredShapes.materialiseAll(first.Document)
 
     import os
 
@@ -3165,6 +3347,10 @@ class SolidExporter:
         print(prefix, self._name)
         return ret
 
+    def subSolids(self):
+        # objects export() exports before this solid, see exportedSolids
+        return []
+
     def position(self):
         return self.obj.Placement.Base
 
@@ -3219,6 +3405,9 @@ class CloneExporter(SolidExporter):
         self._position = self.obj.Placement.Base
         self._rotation = self.obj.Placement.Rotation
 
+    def subSolids(self):
+        return list(self.obj.Objects)
+
     def position(self):
         return self._position
 
@@ -3464,6 +3653,9 @@ class BooleanExporter(SolidExporter):
         super().__init__(obj)
         self._placement = self.obj.Placement * self.obj.Base.Placement
 
+    def subSolids(self):
+        return [self.obj.Base, self.obj.Tool]
+
     def isBoolean(self, obj):
         id = obj.TypeId
         return id == "Part::Cut" or id == "Part::Fuse" or id == "Part::Common"
@@ -3965,11 +4157,38 @@ class GDMLSphereExporter(GDMLSolidExporter):
         self._exportScaled()
 
 
+def tessellatedFragmentsOf(exporter, arrays):
+    # (define, solid) XML of a tessellated solid from the parallel export
+    # or the export cache, None to build it in the tree as usual
+    from .parallelExport import tessellatedXML
+
+    obj = exporter.obj
+    fragments = tessellatedFragments.pop(obj.Name, None)
+    if XML_IO_VERSION != "lxml" or not exportCache.useCache():
+        return fragments
+    key = exportCache.solidKey(obj, exporter.name())
+    if fragments is None:
+        fragments = exportCache.load(key)
+        if fragments is not None:
+            return fragments
+        points, facets = arrays(obj)
+        fragments = tessellatedXML((exporter.name(), points, facets))
+    exportCache.store(key, fragments)
+    return fragments
+
+
 class GDMLSampledTessellatedExporter(GDMLSolidExporter):
     def __init__(self, obj):
         super().__init__(obj)
 
     def export(self):
+        from .parallelExport import sampledArrays
+
+        fragments = tessellatedFragmentsOf(self, sampledArrays)
+        if fragments is not None:
+            insertFragments(*fragments)
+            self._exportScaled()
+            return
         tessName = self.name()
         print(f"tessname: {tessName}")
         # Use more readable version
@@ -4024,6 +4243,14 @@ class GDMLTessellatedExporter(GDMLSolidExporter):
         super().__init__(obj)
 
     def export(self):
+        from .parallelExport import tessellatedArrays
+
+        fragments = tessellatedFragmentsOf(self, tessellatedArrays)
+        if fragments is not None:
+            # serialised by parallelExport or from the export cache
+            insertFragments(*fragments)
+            self._exportScaled()
+            return
         tessName = self.name()
         # Use more readable version
         tessVname = tessName + "_"
@@ -4448,6 +4675,9 @@ class MultiFuseExporter(SolidExporter):
     def __init__(self, obj):
         super().__init__(obj)
 
+    def subSolids(self):
+        return list(self.obj.OutList)
+
     def name(self):
         solidName = "MultiFuse" + self.obj.Label
         return solidName
@@ -4486,6 +4716,9 @@ class OrthoArrayExporter(SolidExporter):
         super().__init__(obj)
         self._name = "MultiUnion-" + self.obj.Label
 
+    def subSolids(self):
+        return self.obj.OutList[:1]
+
     def export(self):
         from . import arrayUtils
         base = self.obj.OutList[0]
@@ -4538,6 +4771,9 @@ class PolarArrayExporter(SolidExporter):
     def __init__(self, obj):
         super().__init__(obj)
 
+    def subSolids(self):
+        return self.obj.OutList[:1]
+
     def name(self):
         solidName = "MultiUnion-" + self.obj.Label
         return solidName
@@ -4577,6 +4813,9 @@ class PathArrayExporter(SolidExporter):
     def __init__(self, obj):
         super().__init__(obj)
 
+    def subSolids(self):
+        return self.obj.OutList[:1]
+
     def name(self):
         solidName = "MultiUnion-" + self.obj.Label
         return solidName
@@ -4616,6 +4855,9 @@ class PointArrayExporter(SolidExporter):
     def __init__(self, obj):
         super().__init__(obj)
 
+    def subSolids(self):
+        return self.obj.OutList[:1]
+
     def name(self):
         solidName = "MultiUnion-" + self.obj.Label
         return solidName
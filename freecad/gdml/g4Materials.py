@@ -0,0 +1,260 @@
+# **************************************************************************
+# *                                                                        *
+# *   Copyright (c) 2024 Keith Sloan <keith@sloan-home.co.uk>              *
+# *                                                                        *
+# *   This program is free software; you can redistribute it and/or modify*
+# *   it under the terms of the GNU Lesser General Public License (LGPL)   *
+# *   as published by the Free Software Foundation; either version 2 of    *
+# *   the License, or (at your option) any later version.                  *
+# *   for detail see the LICENCE text file.                                *
+# *                                                                        *
+# *   This program is distributed in the hope that it will be useful,      *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of       *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the        *
+# *   GNU Library General Public License for more details.                 *
+# *                                                                        *
+# *   You should have received a copy of the GNU Library General Public    *
+# *   License along with this program; if not, write to the Free Software  *
+# *   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307 *
+# *   USA                                                                  *
+# *                                                                        *
+# *                                                                        *
+# **************************************************************************
+#
+#
+# Compiled index of Resources/Geant4Materials.xml
+#
+# The materials XML is parsed once into an index of isotopes, elements &
+# materials (each kept as its XML fragment), the material groups
+# (Material-type auxiliary) and what each entry references. The index is
+# pickled in the user cache and only rebuilt when the XML changes (size
+# & mtime, then content hash). Callers ask for the group lists or a
+# <materials> element holding just the entries they need.
+#
+# With lazyG4Materials (default) only the empty Geant4 groups are added to
+# a document, a material and what it references is created the first time
+# it is used (setMaterial, export). The rest stay entries of the index.
+
+import os
+import hashlib
+import pickle
+
+import FreeCAD
+
+indexFormat = 1
+# path -> G4MaterialsIndex
+loaded = {}
+# document Uid -> labels of Geant4 entries created in the document
+created = {}
+
+
+def defaultPath():
+    from .importGDML import joinDir
+
+    return joinDir("Resources/Geant4Materials.xml")
+
+
+def fileHash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class G4MaterialsIndex:
+    def __init__(self, path):
+        from lxml import etree
+
+        st = os.stat(path)
+        self.path = path
+        self.stat = (st.st_size, st.st_mtime)
+        self.hash = fileHash(path)
+        # kind -> {name : XML fragment} in document order
+        self.entries = {"isotope": {}, "element": {}, "material": {}}
+        self.kinds = {}
+        self.refs = {}
+        self.groups = {}
+        parser = etree.XMLParser(resolve_entities=True, remove_blank_text=True)
+        root = etree.parse(path, parser=parser).getroot()
+        mats = root.find("materials")
+        if mats is None:
+            return
+        for elem in mats:
+            name = elem.get("name")
+            if elem.tag not in self.entries or name is None:
+                continue
+            self.entries[elem.tag][name] = etree.tostring(elem)
+            self.kinds[name] = elem.tag
+            self.refs[name] = [
+                c.get("ref")
+                for c in elem
+                if c.tag in ("fraction", "composite")
+                and c.get("ref") is not None
+            ]
+            if elem.tag == "material":
+                group = None
+                for aux in elem.findall("auxiliary"):
+                    if aux.get("auxtype") == "Material-type":
+                        group = aux.get("auxvalue")
+                        break
+                if group is not None:
+                    self.groups.setdefault(group, []).append(name)
+
+    def materialNames(self):
+        return list(self.entries["material"])
+
+    def isMaterial(self, name):
+        return self.kinds.get(name) == "material"
+
+    def groupOf(self, name):
+        for group, names in self.groups.items():
+            if name in names:
+                return group
+        return None
+
+    def closure(self, names):
+        # names with every isotope, element & material they reference
+        ret = set()
+        todo = [n for n in names if n in self.kinds]
+        while todo:
+            name = todo.pop()
+            if name in ret:
+                continue
+            ret.add(name)
+            todo.extend(r for r in self.refs[name] if r in self.kinds)
+        return ret
+
+    def materialsXML(self, names=None, withRefs=True):
+        # <materials> element of names (all if None) & their references
+        from lxml import etree
+
+        wanted = None
+        if names is not None:
+            wanted = self.closure(names) if withRefs else set(names)
+        mats = etree.Element("materials")
+        for kind in ("isotope", "element", "material"):
+            for name, xml in self.entries[kind].items():
+                if wanted is None or name in wanted:
+                    mats.append(etree.fromstring(xml))
+        return mats
+
+
+def cachePath():
+    # own folder, kept out of the import cache purge & eviction
+    from .importCache import cacheDir
+
+    base = os.path.dirname(cacheDir())
+    return os.path.join(base, "g4Materials", "index.pickle")
+
+
+def readCache(path):
+    try:
+        with open(cachePath(), "rb") as f:
+            fmt, index = pickle.load(f)
+    except Exception:
+        return None
+    if fmt != indexFormat or index.path != path:
+        return None
+    st = os.stat(path)
+    if index.stat == (st.st_size, st.st_mtime):
+        return index
+    # touched but maybe not changed
+    if index.hash == fileHash(path):
+        index.stat = (st.st_size, st.st_mtime)
+        writeCache(index)
+        return index
+    return None
+
+
+def writeCache(index):
+    path = cachePath()
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump((indexFormat, index), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+    except OSError as e:
+        print(f"Unable to cache Geant4 materials index : {e}")
+
+
+def getIndex(path=None, recheck=False):
+    # the XML is checked once per session, or again with recheck
+    if path is None:
+        path = defaultPath()
+    path = os.path.abspath(path)
+    index = loaded.get(path)
+    if index is not None:
+        if not recheck:
+            return index
+        st = os.stat(path)
+        if index.stat == (st.st_size, st.st_mtime):
+            return index
+    index = readCache(path)
+    if index is None:
+        print(f"Index Geant4 materials : {path}")
+        index = G4MaterialsIndex(path)
+        writeCache(index)
+    loaded[path] = index
+    return index
+
+
+def lazyMaterials():
+    return FreeCAD.ParamGet(
+        "User parameter:BaseApp/Preferences/Mod/GDML"
+    ).GetBool("lazyG4Materials", True)
+
+
+def addNames(registry):
+    # GDMLObjects.MaterialRegistry, skips names already added
+    registry.extend(getIndex().materialNames())
+
+
+def documentEntries(doc):
+    # labels of the Geant4 isotopes, elements & materials in doc
+    names = created.get(doc.Uid)
+    if names is None:
+        names = set()
+        for grpName in ("G4Isotopes", "G4Elements"):
+            grp = doc.getObject(grpName)
+            if grp is not None:
+                names.update(o.Label for o in grp.Group)
+        g4Mats = doc.getObject("G4Materials")
+        if g4Mats is not None:
+            for sub in g4Mats.Group:
+                names.update(o.Label for o in sub.Group)
+        created[doc.Uid] = names
+    return names
+
+
+def forget(doc):
+    created.pop(doc.Uid, None)
+
+
+def ensureMaterial(doc, name):
+    # create Geant4 material name & what it references on first use
+    if doc is None or name is None:
+        return
+    names = documentEntries(doc)
+    if name in names:
+        return
+    index = getIndex()
+    if not index.isMaterial(name):
+        return
+    g4Mats = doc.getObject("G4Materials")
+    if g4Mats is None:
+        return
+    from .importGDML import (
+        G4MaterialTypes,
+        processIsotopes,
+        processElements,
+        processMaterials,
+    )
+
+    wanted = [n for n in index.closure([name]) if n not in names]
+    print(f"Create Geant4 material {name} ({len(wanted)} entries)")
+    mats = index.materialsXML(wanted, withRefs=False)
+    processIsotopes(doc.getObject("G4Isotopes"), mats)
+    processElements(doc.getObject("G4Elements"), mats)
+    processMaterials(g4Mats, mats, G4MaterialTypes)
+    names.update(wanted)
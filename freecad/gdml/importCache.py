@@ -0,0 +1,265 @@
+# **************************************************************************
+# *                                                                        *
+# *   Copyright (c) 2024 Keith Sloan <keith@sloan-home.co.uk>              *
+# *                                                                        *
+# *   This program is free software; you can redistribute it and/or modify*
+# *   it under the terms of the GNU Lesser General Public License (LGPL)   *
+# *   as published by the Free Software Foundation; either version 2 of    *
+# *   the License, or (at your option) any later version.                  *
+# *   for detail see the LICENCE text file.                                *
+# *                                                                        *
+# *   This program is distributed in the hope that it will be useful,      *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of       *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the        *
+# *   GNU Library General Public License for more details.                 *
+# *                                                                        *
+# *   You should have received a copy of the GNU Library General Public    *
+# *   License along with this program; if not, write to the Free Software  *
+# *   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307 *
+# *   USA                                                                  *
+# *                                                                        *
+# *                                                                        *
+# **************************************************************************
+#
+# On disk cache of GDML imports
+#
+# Entries are keyed by a hash of the main file, every entity / <file>
+# include, the workbench version and the preferences that change the
+# result (lazyLoops, bulkTessellation). An entry holds the entity resolved,
+# loop expanded GDML and the BREP of each solid built by the import, so a
+# warm open skips the parse, loop expansion & shape construction and only
+# rebuilds the document tree.
+# Least recently used entries are evicted above importCacheSizeMB.
+
+import os
+import re
+import hashlib
+import pickle
+
+import FreeCAD
+
+cacheFormat = 2
+
+includePattern = re.compile(
+    rb'<!ENTITY\s+\S+\s+SYSTEM\s+"([^"]+)"|<file\s+name\s*=\s*"([^"]+)"'
+)
+
+
+def getParams():
+    return FreeCAD.ParamGet("User parameter:BaseApp/Preferences/Mod/GDML")
+
+
+def useCache():
+    return getParams().GetBool("importCache", False)
+
+
+def cacheDir():
+    if hasattr(FreeCAD, "getUserCachePath"):
+        base = FreeCAD.getUserCachePath()
+    else:
+        base = FreeCAD.getUserAppDataDir()
+    return os.path.join(base, "GDML", "importCache")
+
+
+def workbenchVersion():
+    from .importGDML import joinDir
+
+    try:
+        with open(joinDir("../../package.xml"), "rb") as f:
+            m = re.search(rb"<version>([^<]*)</version>", f.read())
+            return m.group(1) if m else b"unknown"
+    except OSError:
+        return b"unknown"
+
+
+def settingsKey(processType):
+    # import settings that change the document or shapes built
+    from .GDMLShared import useBulkTessellation
+
+    params = getParams()
+    return (
+        f"processType {processType} "
+        f"lazyLoops {params.GetBool('lazyLoops', False)} "
+        f"bulkTessellation {useBulkTessellation()}"
+    )
+
+
+def contentKey(filename, extra=""):
+    # hash of filename and all its includes, None if an include is missing
+    h = hashlib.sha256()
+    h.update(b"format %d " % cacheFormat)
+    h.update(workbenchVersion())
+    h.update(extra.encode())
+    done = set()
+    todo = [os.path.abspath(filename)]
+    while todo:
+        path = todo.pop(0)
+        if path in done:
+            continue
+        done.add(path)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        h.update(path.encode())
+        h.update(data)
+        dirName = os.path.dirname(path)
+        for m in includePattern.finditer(data):
+            ref = (m.group(1) or m.group(2)).decode()
+            todo.append(os.path.normpath(os.path.join(dirName, ref)))
+    return h.hexdigest()
+
+
+def entryPath(key):
+    return os.path.join(cacheDir(), key + ".pickle")
+
+
+def load(key):
+    path = entryPath(key)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            entry = pickle.load(f)
+    except Exception as e:
+        print(f"Discarding unreadable import cache entry : {e}")
+        os.remove(path)
+        return None
+    # mark as recently used
+    os.utime(path)
+    return entry
+
+
+def store(key, tree, shapes):
+    # tree : bytes of expanded GDML, shapes : see collectShapes
+    os.makedirs(cacheDir(), exist_ok=True)
+    path = entryPath(key)
+    tmpPath = path + ".tmp"
+    with open(tmpPath, "wb") as f:
+        pickle.dump(
+            {"tree": tree, "shapes": shapes}, f, pickle.HIGHEST_PROTOCOL
+        )
+    os.replace(tmpPath, path)
+    evict()
+
+
+def entries():
+    # (mtime, size, path) of cache entries, least recently used first
+    ret = []
+    d = cacheDir()
+    if os.path.isdir(d):
+        for name in os.listdir(d):
+            if name.endswith(".pickle"):
+                path = os.path.join(d, name)
+                st = os.stat(path)
+                ret.append((st.st_mtime, st.st_size, path))
+    ret.sort()
+    return ret
+
+
+def evict():
+    limit = getParams().GetInt("importCacheSizeMB", 1024) * 1024 * 1024
+    cached = entries()
+    total = sum(e[1] for e in cached)
+    for mtime, size, path in cached:
+        if total <= limit:
+            break
+        print(f"Import cache evict {os.path.basename(path)}")
+        os.remove(path)
+        total -= size
+
+
+def purge():
+    cached = entries()
+    for mtime, size, path in cached:
+        os.remove(path)
+    return len(cached)
+
+
+def isSolid(obj):
+    from .GDMLObjects import GDMLsolid
+
+    proxy = getattr(obj, "Proxy", None)
+    return isinstance(proxy, GDMLsolid) and hasattr(proxy, "Type")
+
+
+def shapeVariant(obj):
+    # choices made during the import that change the shape, the
+    # tessellation dialog full solid / sampled / point cloud
+    if hasattr(obj, "solidFlag") and hasattr(obj, "sampledFraction"):
+        return (obj.solidFlag, obj.sampledFraction)
+    return None
+
+
+def baseLabel(label):
+    # without the 001 ... FreeCAD adds to a label already in use
+    return re.sub(r"\d{3}$", "", label)
+
+
+class CachedShapes:
+    # BREP of the solids of a cache entry by (Type, Label, variant), in
+    # creation order. Tessellated solids take theirs when created so they
+    # skip building the shape, applyShapes hands out the rest
+    def __init__(self):
+        self.entries = {}
+
+    def start(self, shapes):
+        self.entries = {}
+        for solidType, label, variant, brep in shapes:
+            key = (solidType, baseLabel(label), variant)
+            self.entries.setdefault(key, []).append(brep)
+
+    def stop(self):
+        self.entries = {}
+
+    def take(self, solidType, obj):
+        import Part
+
+        breps = self.entries.get(
+            (solidType, baseLabel(obj.Label), shapeVariant(obj))
+        )
+        if not breps:
+            return None
+        shape = Part.Shape()
+        shape.importBrepFromString(breps.pop(0))
+        return shape
+
+
+cachedShapes = CachedShapes()
+
+
+def collectShapes(objects):
+    # (Type, Label, variant, BREP) of each solid
+    shapes = []
+    for obj in objects:
+        if isSolid(obj):
+            shapes.append((
+                obj.Proxy.Type,
+                obj.Label,
+                shapeVariant(obj),
+                obj.Shape.exportBrepToString(),
+            ))
+    return shapes
+
+
+def applyShapes(objects):
+    # solids that did not take their cached shape when created, solids
+    # that do not match an entry are rebuilt
+    num = 0
+    for obj in objects:
+        if not isSolid(obj):
+            continue
+        proxy = obj.Proxy
+        if getattr(proxy, "fromCache", False):
+            # already given its shape when created
+            del proxy.fromCache
+            num += 1
+            continue
+        shape = cachedShapes.take(proxy.Type, obj)
+        if shape is None:
+            print(f"Import cache does not match {obj.Label}, rebuilt")
+            continue
+        proxy.preShape = shape
+        num += 1
+    return num
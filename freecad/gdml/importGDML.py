@@ -51,6 +51,8 @@ from math import *
 from . import GDMLShared
 
 from .PhysVolDict import physVolDict
+from .importProfiler import profiler
+from . import updateGDML
 ##########################
 # Globals Dictionaries    #
 ##########################
@@ -58,6 +60,17 @@ from .PhysVolDict import physVolDict
 # global setup, define, mats_xml, solids, structure, extension
 # globals constDict, filesDict
 
+# name -> element indexes of the sections, see indexSections
+solidsIndex = GDMLShared.SectionIndex()
+structureIndex = GDMLShared.SectionIndex()
+extensionIndex = GDMLShared.SectionIndex()
+# content hashes for update from GDML
+gdmlHasher = None
+# importRegion.ImportRegion of a region of interest import or None
+importRegion = None
+# subgroups of G4Materials, by Material-type auxiliary
+G4MaterialTypes = ["NIST", "Element", "HEP", "Space", "BioChemical"]
+
 if FreeCAD.GuiUp:
     import PartGui, FreeCADGui
 
@@ -783,9 +796,8 @@ def createScaledSolid(
     part, solid, material, colour, px, py, pz, rot, displayMode
 ):
     print("ScaledSolid")
-    global solids
     solidref = GDMLShared.getRef(solid, "solidref")
-    newSolid = solids.find("*[@name='%s']" % solidref)
+    newSolid = solidsIndex.find(solidref)
     scaledObj = createSolid(
         part, newSolid, material, colour, px, py, pz, rot, displayMode
     )
@@ -1542,62 +1554,23 @@ def createTessellated(
     # GDMLShared.setTrace(True)
     GDMLShared.trace("CreateTessellated : ")
     GDMLShared.trace(solid.attrib)
-    vertex = []
-    faces = []
+
     lunit = getText(solid, "lunit", "mm")
 
-    # form a set of vertexes. a set has no duplicates,
-    # so we don't need to perform the time-costly list.index method
-    vertsSet = set()
-    for elem in solid.getchildren():
-        v1name = elem.get("vertex1")
-        v1 = GDMLShared.getDefinedPosition(v1name)
-        vertsSet.add(v1)
-        v2name = elem.get("vertex2")
-        v2 = GDMLShared.getDefinedPosition(v2name)
-        vertsSet.add(v2)
-        v3name = elem.get("vertex3")
-        v3 = GDMLShared.getDefinedPosition(v3name)
-        vertsSet.add(v3)
-        if elem.tag == "quadrangular":
-            v4name = elem.get("vertex4")
-            v4 = GDMLShared.getDefinedPosition(v4name)
-            vertsSet.add(v3)
-    # make a list out of the set
-    vertsList = list(vertsSet)
-
-    # create list of indexes for each face
-    Dict = {}
-    for i, v in enumerate(vertsList):
-        vertex.append(v)
-        Dict[v] = i
-
-    for elem in solid.getchildren():
-        v1name = elem.get("vertex1")
-        v1 = GDMLShared.getDefinedPosition(v1name)
-        v1pos = Dict[v1]
-        v2name = elem.get("vertex2")
-        v2 = GDMLShared.getDefinedPosition(v2name)
-        v2pos = Dict[v2]
-        v3name = elem.get("vertex3")
-        v3 = GDMLShared.getDefinedPosition(v3name)
-        v3pos = Dict[v3]
-        if elem.tag == "triangular":
-            faces.append([v1pos, v2pos, v3pos])
-        if elem.tag == "quadrangular":
-            v4name = elem.get("vertex4")
-            v4 = GDMLShared.getDefinedPosition(v4name)
-            v4pos = Dict[v4]
-            faces.append([v1pos, v2pos, v3pos, v4pos])
+    # single pass over the facets; vertexes are deduplicated by name
+    # and resolved in one batch at the end
+    vertex, faces, vertsPerFacet = GDMLShared.tessellatedArrays(solid)
 
     # print(vertNames)
     solidName = getName(solid)
     myTess = newPartFeature(part, "GDMLSampledTessellated_" + solidName)
     print(f"processing tessellation {solidName}")
     if FreeCAD.GuiUp:
-        if len(faces) > TessSampleDialog.maxFaces:
+        if len(vertsPerFacet) > TessSampleDialog.maxFaces:
             if TessSampleDialog.applyToAll is False:
-                dialog = TessSampleDialog(solidName, len(vertex), len(faces))
+                dialog = TessSampleDialog(
+                    solidName, len(vertex), len(vertsPerFacet)
+                )
                 dialog.exec_()
             solidFlag = TessSampleDialog.fullSolid
             sampledFraction = TessSampleDialog.samplingFraction
@@ -1618,6 +1591,7 @@ def createTessellated(
         sampledFraction,
         colour,
         flag=False,
+        vertsPerFacet=vertsPerFacet,
     )
 
     # GDMLTessellated(myTess, vertex, faces, False, lunit, material,
@@ -1636,7 +1610,6 @@ def createTessellated(
 def parseMultiUnion(
     part, solid, material, colour, px, py, pz, rot, displayMode
 ):
-    global solids
     # GDMLShared.setTrace(True)
     GDMLShared.trace("Multi Union - MultiFuse")
     muName = solid.attrib.get("name")
@@ -1658,7 +1631,7 @@ def parseMultiUnion(
                 if t.tag == "solid":
                     sname = t.get("ref")
                     GDMLShared.trace("solid : " + sname)
-                    ssolid = solids.find("*[@name='%s']" % sname)
+                    ssolid = solidsIndex.find(sname)
                 if t.tag == "positionref":
                     pname = t.get("ref")
                     nx, ny, nz = GDMLShared.getDefinedPosition(pname)
@@ -1702,7 +1675,6 @@ def parseBoolean(
     # parent,  solid,  boolean Type,
     from .GDMLObjects import ViewProvider
 
-    global solids
     # GDMLShared.setTrace(True)
     GDMLShared.trace("Parse Boolean : " + str(solid.tag))
     GDMLShared.trace(solid.tag)
@@ -1710,11 +1682,11 @@ def parseBoolean(
     if solid.tag in ["subtraction", "union", "intersection"]:
         GDMLShared.trace("Boolean : " + solid.tag)
         name1st = GDMLShared.getRef(solid, "first")
-        base = solids.find("*[@name='%s']" % name1st)
+        base = solidsIndex.find(name1st)
         GDMLShared.trace("first : " + name1st)
         # parseObject(root, base)
         name2nd = GDMLShared.getRef(solid, "second")
-        tool = solids.find("*[@name='%s']" % name2nd)
+        tool = solidsIndex.find(name2nd)
         GDMLShared.trace("second : " + name2nd)
         x, y, z = GDMLShared.getPosition(solid)
         # rot = GDMLShared.getRotFromRefs(solid)
@@ -1752,6 +1724,13 @@ def parseBoolean(
 def createSolid(part, solid, material, colour, px, py, pz, rot, displayMode):
     # parent, solid,  material
     # returns created Object
+    with profiler.solid(solid.tag, solid.get("name")):
+        return dispatchSolid(
+            part, solid, material, colour, px, py, pz, rot, displayMode
+        )
+
+
+def dispatchSolid(part, solid, material, colour, px, py, pz, rot, displayMode):
     GDMLShared.trace("createSolid " + solid.tag)
     GDMLShared.trace("px : " + str(px))
     while switch(solid.tag):
@@ -1999,7 +1978,13 @@ def parsePhysVol(
         GDMLShared.trace("Copynumber : " + str(copyNum))
         # lhcbvelo has duplicate with no copynumber
         # Test if exists
+        if importRegion is not None and not importRegion.keep(
+            physVol, volRef
+        ):
+            return
         namedObj = FreeCAD.ActiveDocument.getObject(volRef)
+        if importRegion is not None and not importRegion.canLink(volRef):
+            namedObj = None
         PVName = physVol.get("name")
         if namedObj is None:
             part = parent.newObject("App::Part", volRef)
@@ -2007,7 +1992,11 @@ def parsePhysVol(
             #volDict[PVName] = part
             volDict.addEntry(PVName, part)
             addSurfList(doc, part)
+            if importRegion is not None:
+                importRegion.enter(physVol, volRef)
             expandVolume(importFlag, doc, volDict, part, volRef, phylvl, displayMode)
+            if importRegion is not None:
+                importRegion.leave(volRef)
 
         else:  # Object exists create a Linked Object
             GDMLShared.trace("====> Create Link to : " + volRef)
@@ -2057,7 +2046,7 @@ def getColour(colRef):
     # print(f'colRef : {colRef}')
     # print(str(extension))
     if extension is not None:
-        colxml = extension.find("*[@name='%s']" % colRef)
+        colxml = extensionIndex.find(colRef)
         # print(str(colxml))
         R = G = B = A = 0.0
         if colxml is not None:
@@ -2108,7 +2097,7 @@ def processParamvol(vol, parent, paramvol):
         return
     print(f"Number of copies={ncopies}")
     refName = GDMLShared.getRef(paramvol, "volumeref")
-    refvol = structure.find("volume[@name='%s']" % refName)
+    refvol = structureIndex.find(refName, "volume")
     material = GDMLShared.getRef(refvol, "materialref")
     part = parent.newObject("App::Part", "Paramvol_" + refName)
     colour = None
@@ -2284,7 +2273,7 @@ def processReplica(importFlag, doc, vol, volDict, parent, phylvl, displayMode):
         print("Error - volume reference of replicavol not found")
         return None
 
-    baseVol = structure.find("volume[@name='%s']" % volRef)
+    baseVol = structureIndex.find(volRef, "volume")
     replicatedSolid = processVol(importFlag, doc, baseVol, volDict, part, phylvl, displayMode)
     alongAxis = replicavol.find("replicate_along_axis")
     if alongAxis is None:
@@ -2376,24 +2365,15 @@ def processReplica(importFlag, doc, vol, volDict, parent, phylvl, displayMode):
     # return array
 
 
-def processVol(importFlag, doc, vol, volDict, parent, phylvl, displayMode):
-    # GDMLShared.setTrace(True)
-    from .GDMLObjects import checkMaterial
-
-    # print(f"pathName {pathName}")
+def getVolColour(vol):
+    # colour from Color auxiliary or colorref of a volume
     colour = None
-    name = vol.get("name")
-    print(f"Process Volume : {name} importFlag{importFlag}")
     for aux in vol.findall("auxiliary"):  # could be more than one auxiliary
         if aux is not None:
             # print('auxiliary')
             aType = aux.get("auxtype")
             aValue = aux.get("auxvalue")
             if aValue is not None:
-                if aType == "SensDet":
-                    parent.addProperty(
-                        "App::PropertyString", "SensDet", "Base", "SensDet"
-                    ).SensDet = aValue
                 if aType == "Color":
                     # print('auxtype Color')
                     # print(aValue)
@@ -2447,59 +2427,86 @@ def processVol(importFlag, doc, vol, volDict, parent, phylvl, displayMode):
     coloref = GDMLShared.getRef(vol, "colorref")
     if coloref is not None:
         colour = getColour(coloref)
+    return colour
+
+
+def createVolSolid(vol, parent, colour, displayMode):
+    # create the solid of a volume in its App::Part
+    # returns created Object or None on error
+    from .GDMLObjects import checkMaterial
+
+    name = vol.get("name")
     solidref = GDMLShared.getRef(vol, "solidref")
     print(f"solidref : {solidref}")
-    global root
     retPart = None
     if solidref is not None:
         solidFound = False
-        for solids in root.findall("solids"):
-            # print(f"solids {solids}")
-            if solids is not None:
-                solid = solids.find("*[@name='%s']" % solidref)
-                if solid is not None:
-                    solidFound = True
-                    GDMLShared.trace(solid.tag)
-                    # Material is the materialref value
-                    # need to add default
-                    material = GDMLShared.getRef(vol, "materialref")
-                    if material is not None:
-                        if checkMaterial(material) is True:
-                            retPart = createSolid(
-                                parent,
-                                solid,
-                                material,
-                                colour,
-                                0,
-                                0,
-                                0,
-                                None,
-                                displayMode,
-                            )
-                        else:
-                            print(
-                                "ERROR - Material : "
-                                + material
-                                + " Not defined for solid : "
-                                + str(solid)
-                                + " Volume : "
-                                + name
-                            )
-                            return None
+        # one entry per <solids> section defining solidref
+        for solid in solidsIndex.findAll(solidref):
+            if solid is not None:
+                solidFound = True
+                GDMLShared.trace(solid.tag)
+                # Material is the materialref value
+                # need to add default
+                material = GDMLShared.getRef(vol, "materialref")
+                if material is not None:
+                    if checkMaterial(material) is True:
+                        retPart = createSolid(
+                            parent,
+                            solid,
+                            material,
+                            colour,
+                            0,
+                            0,
+                            0,
+                            None,
+                            displayMode,
+                        )
                     else:
                         print(
-                            "ERROR - Materialref Not defined for solid : "
+                            "ERROR - Material : "
+                            + material
+                            + " Not defined for solid : "
                             + str(solid)
                             + " Volume : "
                             + name
                         )
                         return None
+                else:
+                    print(
+                        "ERROR - Materialref Not defined for solid : "
+                        + str(solid)
+                        + " Volume : "
+                        + name
+                    )
+                    return None
         if solidFound == False:
             print("ERROR - Solid  : " + solidref + " Not defined")
             return None
     else:
         print("ERROR - solidref Not defined in Volume : " + name)
         return None
+    return retPart
+
+
+def processVol(importFlag, doc, vol, volDict, parent, phylvl, displayMode):
+    # GDMLShared.setTrace(True)
+
+    # print(f"pathName {pathName}")
+    name = vol.get("name")
+    print(f"Process Volume : {name} importFlag{importFlag}")
+    for aux in vol.findall("auxiliary"):  # could be more than one auxiliary
+        aType = aux.get("auxtype")
+        aValue = aux.get("auxvalue")
+        if aType == "SensDet" and aValue is not None:
+            parent.addProperty(
+                "App::PropertyString", "SensDet", "Base", "SensDet"
+            ).SensDet = aValue
+    colour = getVolColour(vol)
+    retPart = createVolSolid(vol, parent, colour, displayMode)
+    if retPart is None:
+        return None
+    updateGDML.setVolumeHashes(gdmlHasher, parent, vol, retPart)
     # check for replicavol
     replicavol = vol.find("replicavol")
     if replicavol is not None:
@@ -2525,6 +2532,10 @@ def processVol(importFlag, doc, vol, volDict, parent, phylvl, displayMode):
         else:  # Just Add to structure
             volRef = GDMLShared.getRef(pv, "volumeref")
             print("volRef : " + str(volRef))
+            if importRegion is not None and not importRegion.keep(
+                pv, volRef
+            ):
+                continue
             nx, ny, nz = GDMLShared.getPosition(pv)
             nrot = GDMLShared.getRotation(pv)
             cpyNum = pv.get("copynumber")
@@ -2607,14 +2618,15 @@ def expandVolume(importFlag, doc, volDict, parent, name, phylvl, displayMode):
             #if FreeCAD.GuiUp:
             #    ViewProvider(part.ViewObject)
             return
-    vol = structure.find("volume[@name='%s']" % name)
+    vol = structureIndex.find(name, "volume")
     if vol is not None:  # If not volume test for assembly
         processVol(importFlag, doc, vol, volDict, parent, phylvl, displayMode)
 
     else:
-        asm = structure.find("assembly[@name='%s']" % name)
+        asm = structureIndex.find(name, "assembly")
         if asm is not None:
             print("Assembly : " + name)
+            updateGDML.setVolumeHashes(gdmlHasher, parent, asm)
             for pv in asm.findall("physvol"):
                 # obj = parent.newObject("App::Part", name)
                 parsePhysVol(
@@ -2849,10 +2861,10 @@ def processMaterials(materialGrp, mats_xml, subGrp=None):
 
 def setupEtreeInclude(filename):
     print(f"setup Etree for includes")
-    import builtins
-    import lxml
     from lxml import etree
-    root = lxml.etree.fromstring('<xml>' + builtins.open(filename).read() +'</xml>')
+    from .includeCache import parsedFiles
+
+    root = parsedFiles.get(filename, "include")
     return etree, root
 
 
@@ -2890,6 +2902,97 @@ def setupEtree(filename):
     # end modifs
     return etree, root
 
+
+# define elements fully held by GDMLShared once evaluated
+evaluatedDefines = GDMLShared.scalarDefines + GDMLShared.vectorDefines
+
+
+def setupEtreeStream(doc, filename, lazyLoops=False):
+    # Streaming parse for very large (multi GB) GDML files
+    # Elements are handled as soon as their end tag is parsed
+    #   define children : positions & rotations evaluated into the
+    #               compact GDMLShared tables and dropped straight away,
+    #               scalars evaluated & kept until the section end for the
+    #               Constants etc. groups, defines using names not yet
+    #               defined are left for the section end
+    #   define    : what is left processed then constants, variables,
+    #               quantities, expressions, positions & rotations
+    #               cleared, the define index rebuilt from what is left
+    #               (matrices ...)
+    #   materials : processed into the document then cleared & dropped
+    #   tessellated : facets turned into vertex & index arrays, the
+    #               emptied element is kept for the solids index
+    #   solids, structure : loops expanded (or left for the section
+    #               index with lazyLoops), kept for volume traversal
+    # Whitespace & comments are never stored
+    from lxml import etree
+    from . import preProcessLoops
+
+    print("Stream Parse : " + filename)
+    FreeCAD.Console.PrintMessage("running with lxml.etree iterparse\n")
+    context = etree.iterparse(
+        filename,
+        events=("start", "end"),
+        resolve_entities=True,
+        remove_blank_text=True,
+        remove_comments=True,
+        huge_tree=True,
+    )
+    GDMLShared.streamedTessellated.clear()
+    # empty define tables, filled as the define section is parsed
+    GDMLShared.setDefine(None)
+    GDMLShared.evaluateDefines()
+    depth = 0
+    for event, elem in context:
+        if event == "start":
+            depth += 1
+            continue
+        depth -= 1
+        if depth == 2:
+            # child of a section
+            parent = elem.getparent()
+            if parent.tag == "define":
+                if elem.tag in GDMLShared.vectorDefines:
+                    if GDMLShared.streamDefine(elem):
+                        elem.clear()
+                        parent.remove(elem)
+                elif elem.tag in GDMLShared.scalarDefines:
+                    GDMLShared.streamDefine(elem)
+            elif parent.tag == "solids" and elem.tag == "tessellated":
+                GDMLShared.compactTessellated(elem)
+            continue
+        if depth != 1:  # Only interested in sections i.e. children of gdml
+            continue
+        FreeCAD.Console.PrintMessage(f"Section {elem.tag} parsed\n")
+        if elem.tag == "define":
+            # defines not evaluated during the parse
+            processDefine(elem, doc, merge=True)
+            for child in list(elem):
+                if child.tag in evaluatedDefines:
+                    child.clear()
+                    elem.remove(child)
+            # index must not keep the cleared elements alive
+            GDMLShared.setDefine(elem)
+            preProcessLoops.preprocessElementLoops(elem)
+
+        elif elem.tag == "materials":
+            processMaterialsElement(doc, elem)
+            elem.clear()
+            elem.getparent().remove(elem)
+
+        elif elem.tag == "solids":
+            preProcessLoops.preprocessElementLoops(elem, lazyLoops)
+
+        elif elem.tag == "structure":
+            preProcessLoops.preprocessElementLoops(
+                elem, lazyLoops, ["volume", "assembly"]
+            )
+
+    root = etree.ElementTree(context.root)
+    del context
+    return etree, root
+
+
 def findPart(doc, name):
     #for obj in doc.Objects:
     #    if obj.TypeId == "App::Part" and obj.Name == name:
@@ -2908,6 +3011,8 @@ def processXMLVolAsm(doc, root, parent, xmlSolids, importFlag):
     print(f"Struct Found {struct}")
     volAsm = struct.find("*[@name='%s']" % parent.Name)
     name = volAsm.get("name")
+    # processVol resolves solidrefs via the solids index
+    solidsIndex.add(xmlSolids)
     print(f"VolAsm Found {volAsm} Name {name} Parent {parent.Name}")
     volDict = physVolDict()
     if volAsm.tag == "volume":
@@ -2949,8 +3054,10 @@ def processXMLVolumes(doc, root, xmlSolids):
 
 def processXML(doc, filename):
     # Process an xml file with any type of definitions and add to current document
+    from .includeCache import parsedFiles
+
     print("process XML : " + filename)
-    etree, root = setupEtree(filename)
+    root = parsedFiles.get(filename)
     # etree.ElementTree(root).write("/tmp/test2", 'utf-8', True)
     processMaterialsDocSet(doc, root)
     xml_solids = root.find("solids")
@@ -2966,9 +3073,11 @@ def checkFileExists(path):
         print(f"Warning file {path} does not exist")    
 
 def processXMLMaterials(doc, filename):
+    from .includeCache import parsedFiles
+
     print(f"process XML Materials: {filename}")
     if checkFileExists(filename):
-        etree, root = setupEtree(filename)
+        root = parsedFiles.get(filename)
         # etree.ElementTree(root).write("/tmp/test2", 'utf-8', True)
         mat_xml = root.find("Materials")
         processMaterialsElement(doc, mat_xml)
@@ -2980,9 +3089,8 @@ def processXMLDefines(doc, filename):
         etree, root = setupEtreeInclude(filename)
         define = root.find("define")
         #print(str(define))
-        GDMLShared.setDefine(define)
         if define is not None:
-            processDefines(root, doc)
+            processDefines(root, doc, merge=True)
 
 
 def processXMLSolids(doc, filename):
@@ -3002,25 +3110,31 @@ def processXMLStruct(doc, obj, filename, xmlSolids, processType):
         return processXMLVolAsm(doc, root, obj, xmlSolids, processType)
 
 
-def processPhysVolFile(doc, volDict, parent, fname):
+def processPhysVolFile(importFlag, doc, volDict, parent, fname):
+    from .includeCache import parsedFiles
+
     global pathName
     print(f"Process physvol file import {fname} parent {parent.Name}")
     print(pathName)
     filename = os.path.join(pathName, fname)
     print("Full Path : " + filename)
-    etree, root = setupEtree(filename)
+    # parsed once, possibly in the background, see prefetchFiles
+    root = parsedFiles.get(filename)
     # etree.ElementTree(root).write("/tmp/test2", 'utf-8', True)
     processMaterialsDocSet(doc, root)
     print("Now process Volume")
     define = root.find("define")
     # print(str(define))
-    GDMLShared.setDefine(define)
+    # added to the main document defines, later siblings still use them
     if define is not None:
-        processDefines(root, doc)
+        processDefines(root, doc, merge=True)
     global solids
     solids = root.find("solids")
     # print(str(solids))
     structure = root.find("structure")
+    # add file solids to index, main document definitions take precedence
+    for fileSolids in root.findall("solids"):
+        solidsIndex.add(fileSolids)
     if structure is None:
         vol = root.find("volume")
     else:
@@ -3033,11 +3147,23 @@ def processPhysVolFile(doc, volDict, parent, fname):
             if hasattr(part, "Material"):
                 part.setEditorMode("Material", 2)
             # expandVolume(None,vName,-1,1)
-            processVol(doc, vol, volDict, part, -1, 1)
+            processVol(importFlag, doc, vol, volDict, part, -1, 1)
 
     processSurfaces(doc, volDict, structure)
 
 
+def prefetchFiles(root):
+    # parse the <file> physvol references while the main file is processed
+    from .includeCache import parsedFiles
+
+    names = set()
+    for filePtr in root.iter("file"):
+        name = filePtr.get("name")
+        if name is not None:
+            names.add(os.path.join(pathName, name))
+    parsedFiles.prefetch(sorted(names))
+
+
 def setSkinSurface(doc, vol, surface):
     print("set SkinSurface : {vol} : {surface}")
     volObj = doc.getObject(vol)
@@ -3070,8 +3196,8 @@ def processSurfaces(doc, volDict, structure):
                     # print(f"{i} : {pvRef}")
                     #volRef = volDict[pvRef]
                     volRef = volDict.lookUp(pvRef)
-                    print(f"Vol : {volRef.Label}")
                     if volRef is not None:
+                        print(f"Vol : {volRef.Label}")
                         volLst.append(volRef)
                     else:
                         print(f"Volume {pvRef} not found")
@@ -3085,9 +3211,9 @@ def processSurfaces(doc, volDict, structure):
 
 
 def processGEANT4(doc, filename):
+    from . import g4Materials
+
     print("process GEANT4 Materials : " + filename)
-    etree, root = setupEtree(filename)
-    # etree.ElementTree(root).write("/tmp/test2", 'utf-8', True)
     materials = doc.getObject("Materials")
     if materials is None:
         materials = doc.addObject(
@@ -3097,7 +3223,17 @@ def processGEANT4(doc, filename):
     geant4Grp = doc.getObject("Geant4")
     if geant4Grp is None:
         geant4Grp = newGroupPython(materials, "Geant4")
-        processMaterialsG4(geant4Grp, root)
+        # from the compiled index rather than parsing the XML
+        index = g4Materials.getIndex(filename)
+        if g4Materials.lazyMaterials():
+            # empty groups, materials are created when first used
+            from .GDMLObjects import MaterialsList
+
+            processMaterialsG4(geant4Grp, index.materialsXML([]))
+            g4Materials.addNames(MaterialsList)
+        else:
+            processMaterialsG4(geant4Grp, index.materialsXML())
+        g4Materials.forget(doc)
 
 
 def processMaterialsDocSet(doc, root):
@@ -3235,14 +3371,12 @@ def processOpticals(doc, opticalsGrp, define_xml, solids_xml, struct_xml):
 
 def processNewG4(materialsGrp, mats_xml):
     print("process new G4")
-    matTypes = ["NIST", "Element", "HEP", "Space", "BioChemical"]
-    for t in matTypes:
+    for t in G4MaterialTypes:
         newGroupPython(materialsGrp, t)
-    processMaterials(materialsGrp, mats_xml, matTypes)
+    processMaterials(materialsGrp, mats_xml, G4MaterialTypes)
 
 
-def processMaterialsG4(G4rp, root):
-    mats_xml = root.find("materials")
+def processMaterialsG4(G4rp, mats_xml):
     if mats_xml is not None:
         isotopesGrp = newGroupPython(G4rp, "G4Isotopes")
         processIsotopes(isotopesGrp, mats_xml)
@@ -3255,9 +3389,27 @@ def processMaterialsG4(G4rp, root):
         processNewG4(materialsGrp, mats_xml)
 
 
-def processDefines(root, doc):
-    GDMLShared.trace("Call set Define")
+def indexSections(root):
+    # Single pass name index of every section referenced by name,
+    # replaces per lookup find("*[@name='...']") scans
+    # Entity included sections are already resolved into the tree
+    global solidsIndex, structureIndex, extensionIndex
     GDMLShared.setDefine(root.find("define"))
+    # processVol searches every <solids> section
+    solidsIndex = GDMLShared.SectionIndex(root.findall("solids"))
+    structureIndex = GDMLShared.SectionIndex([root.find("structure")])
+    extensionIndex = GDMLShared.SectionIndex([root.find("extension")])
+
+
+def processDefines(root, doc, merge=False):
+    processDefine(root.find("define"), doc, merge)
+
+
+def processDefine(define, doc, merge=False):
+    # merge : defines of a sub file, added to those already evaluated
+    GDMLShared.trace("Call set Define")
+    GDMLShared.setDefine(define, merge)
+    GDMLShared.evaluateDefines(merge)
     GDMLShared.processConstants(doc)
     GDMLShared.processVariables(doc)
     GDMLShared.processQuantities(doc)
@@ -3274,8 +3426,11 @@ def findWorldVol():
     return None
 
 
-def processGDML(doc, flag, filename, prompt, processType, initFlg):
+def processGDML(
+    doc, flag, filename, prompt, processType, initFlg, region=None
+):
     # flag == True open, flag == False import
+    # region : importRegion.ImportRegion to only import part of the world
     from FreeCAD import Base
     from . import preProcessLoops
 
@@ -3313,9 +3468,6 @@ def processGDML(doc, flag, filename, prompt, processType, initFlg):
             if dialog.retStatus in [2, 3, 4]:
                 print("Look for processed Volumes")
 
-            params = FreeCAD.ParamGet(
-                "User parameter:BaseApp/Preferences/Mod/GDML"
-            )
             # GDMLShared.setTrace(printverbose = params.GetBool('printVerbose',False))
     else:
         # For Non Gui default Trace to on
@@ -3323,6 +3475,17 @@ def processGDML(doc, flag, filename, prompt, processType, initFlg):
 
     print("Print Verbose : " + str(GDMLShared.getTrace()))
 
+    params = FreeCAD.ParamGet("User parameter:BaseApp/Preferences/Mod/GDML")
+    streamImport = params.GetBool("streamImport", False)
+    lazyLoops = params.GetBool("lazyLoops", False)
+    lazyShapes = params.GetBool("lazyShapes", False)
+    # content hashes for Update from GDML, stream imports drop the
+    # defines the hashes need
+    updateHashes = params.GetBool("updateHashes", False)
+    if updateHashes and streamImport:
+        print("Streaming import : no hashes for Update from GDML")
+        updateHashes = False
+
     FreeCAD.Console.PrintMessage("Import GDML file : " + filename + "\n")
     FreeCAD.Console.PrintMessage("ImportGDML Version 1.9b\n")
     startTime = time.perf_counter()
@@ -3333,6 +3496,12 @@ def processGDML(doc, flag, filename, prompt, processType, initFlg):
     FilesEntity = False
 
     global root, setup, define, materials, solids, structure, extension, groupMaterials
+    global gdmlHasher, importRegion
+
+    from .GDMLObjects import shapeCache, deferredShapes
+
+    shapeCache.start()
+    deferredShapes.deferred = 0
 
     # reset parameters for tessellation dialog:
     TessSampleDialog.maxFaces = 2000
@@ -3349,21 +3518,74 @@ def processGDML(doc, flag, filename, prompt, processType, initFlg):
     # Reserve place for Colour Map at start of Document
     # FreeCAD.ActiveDocument.addObject("App::FeaturePython","ColourMap")
 
-    etree, root = setupEtree(filename)
-    setup = root.find("setup")
-    extension = root.find("extension")
-    define = root.find("define")
-    if define is not None:
-        processDefines(root, doc)
-        GDMLShared.trace(setup.attrib)
-        preProcessLoops.preprocessLoops(root)
+    from . import importCache
+    from .includeCache import parsedFiles
+
+    # nothing left from an import that failed
+    importCache.cachedShapes.stop()
+    # sub documents are shared within one import
+    parsedFiles.clear()
+    # objects created by this import
+    firstObj = len(doc.Objects)
+    cacheKey = cached = None
+    profiler.start(doc)
+    if streamImport:
+        # defines & materials are processed during the parse
+        with profiler.phase("stream parse"):
+            etree, root = setupEtreeStream(doc, filename, lazyLoops)
+        setup = root.find("setup")
+        extension = root.find("extension")
+        define = root.find("define")
+    else:
+        # partial imports are not cached
+        if importCache.useCache() and region is None:
+            cacheKey = importCache.contentKey(
+                filename, importCache.settingsKey(processType)
+            )
+            if cacheKey is not None:
+                cached = importCache.load(cacheKey)
+        if cached is not None:
+            # entities already resolved & loops expanded
+            print("Using import cache")
+            from lxml import etree
+
+            parser = etree.XMLParser(huge_tree=True)
+            with profiler.phase("parse"):
+                root = etree.ElementTree(
+                    etree.fromstring(cached["tree"], parser)
+                )
+        else:
+            with profiler.phase("parse"):
+                etree, root = setupEtree(filename)
+        setup = root.find("setup")
+        extension = root.find("extension")
+        define = root.find("define")
+        if define is not None:
+            with profiler.phase("defines"):
+                processDefines(root, doc)
+            GDMLShared.trace(setup.attrib)
+            if cached is None:
+                with profiler.phase("loops"):
+                    preProcessLoops.preprocessLoops(root, lazyLoops)
+        if cacheKey is not None and cached is None:
+            cacheTree = etree.tostring(root)
+    prefetchFiles(root)
+    # after loop expansion so expanded elements are indexed
+    with profiler.phase("index"):
+        indexSections(root)
+    gdmlHasher = None
+    if updateHashes:
+        with profiler.phase("hashes"):
+            gdmlHasher = updateGDML.GDMLHasher(root)
 
     from .GDMLMaterials import getGroupedMaterials
     from .GDMLMaterials import newGetGroupedMaterials
 
-    processMaterialsDocSet(doc, root)
-    processGEANT4(doc, joinDir("Resources/Geant4Materials.xml"))
-    groupMaterials = newGetGroupedMaterials()
+    with profiler.phase("materials"):
+        processMaterialsDocSet(doc, root)
+    with profiler.phase("geant4 materials"):
+        processGEANT4(doc, joinDir("Resources/Geant4Materials.xml"))
+        groupMaterials = newGetGroupedMaterials()
 
     solids = root.find("solids")
     structure = root.find("structure")
@@ -3376,13 +3598,67 @@ def processGDML(doc, flag, filename, prompt, processType, initFlg):
             part = doc.addObject("App::Part", world)
     if hasattr(part, "Material"):
         part.setEditorMode("Material", 2)
-    parseVolume(processType, doc, volDict, part, world, phylvl, 3)
-    processSurfaces(doc, volDict, structure)
+    importRegion = region
+    if region is not None:
+        region.prepare(structureIndex, solidsIndex, world)
+    if cached is not None:
+        # tessellated solids take their cached shape when created
+        importCache.cachedShapes.start(cached["shapes"])
+    try:
+        with profiler.phase("volumes"):
+            parseVolume(processType, doc, volDict, part, world, phylvl, 3)
+    finally:
+        importRegion = None
+    if region is not None:
+        region.report()
+    with profiler.phase("surfaces"):
+        processSurfaces(doc, volDict, structure)
+    workers = params.GetInt("importWorkers", 0)
+    if cached is not None:
+        with profiler.phase("cached shapes"):
+            built = importCache.applyShapes(doc.Objects[firstObj:])
+            importCache.cachedShapes.stop()
+        print(f"{built} solid shapes from import cache")
+    elif workers > 0 and not lazyShapes:
+        from . import parallelShapes
+
+        with profiler.phase("parallel shapes"):
+            built = parallelShapes.buildShapes(
+                doc.Objects[firstObj:], workers
+            )
+        print(f"{built} solid shapes built by {workers} workers")
     # If only single volume reset Display Mode
-    if len(part.OutList) == 2 and initFlg is False:
+    if len(part.OutList) == 2 and initFlg is False and FreeCAD.GuiUp:
         worldGDMLobj = part.OutList[1]
         worldGDMLobj.ViewObject.DisplayMode = "Shaded"
-    FreeCAD.ActiveDocument.recompute()
+    updateGDML.setWorldHashes(gdmlHasher, part, filename)
+    # lazyShapes : solids get placeholders, shapes built when needed
+    deferredShapes.enabled = lazyShapes
+    try:
+        with profiler.phase("recompute"):
+            FreeCAD.ActiveDocument.recompute()
+    finally:
+        deferredShapes.enabled = False
+        shapeCache.stop()
+    from .parallelShapes import clearPreShapes
+
+    unused = clearPreShapes(doc.Objects[firstObj:])
+    if unused > 0:
+        print(f"{unused} prebuilt solid shapes not used")
+    if lazyShapes:
+        deferredShapes.markPlaceholders(doc.Objects[firstObj:])
+        print(
+            f"{deferredShapes.deferred} solid shapes deferred, hidden "
+            f"until shown, selected or used"
+        )
+        deferredShapes.observe()
+    # placeholders are not cached
+    if cacheKey is not None and cached is None and not lazyShapes:
+        importCache.store(
+            cacheKey,
+            cacheTree,
+            importCache.collectShapes(doc.Objects[firstObj:]),
+        )
     if FreeCAD.GuiUp:
         FreeCADGui.SendMsgToActiveView("ViewFit")
     FreeCAD.Console.PrintMessage("End processing GDML file\n")
@@ -3391,3 +3667,12 @@ def processGDML(doc, flag, filename, prompt, processType, initFlg):
     FreeCAD.Console.PrintMessage(
         f"time : {endTime - startTime:0.4f} seconds\n"
     )
+    shapeCache.report()
+    parsedFiles.report()
+    parsedFiles.clear()
+    profiler.report(filename)
+    stats = GDMLShared.getEvalStats()
+    FreeCAD.Console.PrintMessage(
+        f"expressions : {stats['numeric']} numeric {stats['lookups']} "
+        f"defines {stats['hits']} cached {stats['misses']} compiled\n"
+    )
@@ -0,0 +1,162 @@
+# **************************************************************************
+# *                                                                        *
+# *   Copyright (c) 2024 Keith Sloan <keith@sloan-home.co.uk>              *
+# *                                                                        *
+# *   This program is free software; you can redistribute it and/or modify*
+# *   it under the terms of the GNU Lesser General Public License (LGPL)   *
+# *   as published by the Free Software Foundation; either version 2 of    *
+# *   the License, or (at your option) any later version.                  *
+# *   for detail see the LICENCE text file.                                *
+# *                                                                        *
+# *   This program is distributed in the hope that it will be useful,      *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of       *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the        *
+# *   GNU Library General Public License for more details.                 *
+# *                                                                        *
+# *   You should have received a copy of the GNU Library General Public    *
+# *   License along with this program; if not, write to the Free Software  *
+# *   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307 *
+# *   USA                                                                  *
+# *                                                                        *
+# *                                                                        *
+# **************************************************************************
+#
+# Opt in profiling of GDML import (preference importProfile)
+#
+# Records wall time, calls & objects created per phase of processGDML,
+# time & calls per solid tag when the solid objects are created and per
+# solid type when their shapes are built (execute), plus the slowest
+# individual solids. Solid times include nested solids e.g. the operands
+# of a boolean. Written as <file>_profile.json & printed as a table.
+
+import os
+import json
+import time
+import heapq
+from contextlib import contextmanager, nullcontext
+
+import FreeCAD
+
+
+class ImportProfiler:
+    def __init__(self):
+        self.enabled = False
+        self.doc = None
+        self.reset()
+
+    def reset(self):
+        self.phases = {}
+        self.solids = {}
+        self.shapes = {}
+        self.slowest = []
+        self.topN = 20
+        self.startTime = time.perf_counter()
+
+    def start(self, doc):
+        params = FreeCAD.ParamGet(
+            "User parameter:BaseApp/Preferences/Mod/GDML"
+        )
+        self.enabled = params.GetBool("importProfile", False)
+        self.doc = doc
+        self.reset()
+        self.topN = params.GetInt("importProfileTopN", 20)
+
+    def record(self, table, key, elapsed, objects=None):
+        entry = table.setdefault(key, {"time": 0.0, "calls": 0})
+        entry["time"] += elapsed
+        entry["calls"] += 1
+        if objects is not None:
+            entry["objects"] = entry.get("objects", 0) + objects
+
+    def keepSlowest(self, elapsed, kind, tag, name):
+        item = (elapsed, kind, tag, str(name))
+        if len(self.slowest) < self.topN:
+            heapq.heappush(self.slowest, item)
+        else:
+            heapq.heappushpop(self.slowest, item)
+
+    @contextmanager
+    def timePhase(self, name):
+        numObjs = len(self.doc.Objects)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            created = len(self.doc.Objects) - numObjs
+            self.record(self.phases, name, elapsed, created)
+
+    @contextmanager
+    def timeSolid(self, table, kind, tag, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.record(table, tag, elapsed)
+            self.keepSlowest(elapsed, kind, tag, name)
+
+    def phase(self, name):
+        if not self.enabled:
+            return nullcontext()
+        return self.timePhase(name)
+
+    def solid(self, tag, name):
+        # creation of a solid object from its GDML element
+        if not self.enabled:
+            return nullcontext()
+        return self.timeSolid(self.solids, "create", tag, name)
+
+    def shape(self, solidType, name):
+        # building the shape of a solid object
+        if not self.enabled:
+            return nullcontext()
+        return self.timeSolid(self.shapes, "shape", solidType, name)
+
+    def asDict(self, filename):
+        return {
+            "file": filename,
+            "total": time.perf_counter() - self.startTime,
+            "phases": self.phases,
+            "solids": self.solids,
+            "shapes": self.shapes,
+            "slowest": [
+                {"time": t, "kind": k, "tag": tag, "name": n}
+                for t, k, tag, n in sorted(self.slowest, reverse=True)
+            ],
+        }
+
+    def printTable(self, title, table):
+        print(f"\n{title:<24} {'time (s)':>10} {'calls':>8} {'objects':>8}")
+        print("-" * 53)
+        for key, e in sorted(
+            table.items(), key=lambda kv: kv[1]["time"], reverse=True
+        ):
+            objs = e.get("objects", "")
+            print(f"{key:<24} {e['time']:>10.3f} {e['calls']:>8} {objs:>8}")
+
+    def report(self, filename):
+        if not self.enabled:
+            return
+        data = self.asDict(filename)
+        jsonName = os.path.splitext(filename)[0] + "_profile.json"
+        try:
+            with open(jsonName, "w") as f:
+                json.dump(data, f, indent=2)
+            print(f"\nImport profile written to {jsonName}")
+        except OSError as e:
+            print(f"Unable to write import profile {jsonName} : {e}")
+        print(f"Import profile total {data['total']:.3f} seconds")
+        self.printTable("Phase", self.phases)
+        self.printTable("Solid (create)", self.solids)
+        self.printTable("Solid (shape)", self.shapes)
+        print(f"\nSlowest {len(self.slowest)} solids")
+        for s in data["slowest"]:
+            print(
+                f"{s['time']:>10.3f} {s['kind']:<7} {s['tag']:<16} "
+                f"{s['name']}"
+            )
+        self.enabled = False
+
+
+profiler = ImportProfiler()
@@ -0,0 +1,284 @@
+# **************************************************************************
+# *                                                                        *
+# *   Copyright (c) 2024 Keith Sloan <keith@sloan-home.co.uk>              *
+# *                                                                        *
+# *   This program is free software; you can redistribute it and/or modify*
+# *   it under the terms of the GNU Lesser General Public License (LGPL)   *
+# *   as published by the Free Software Foundation; either version 2 of    *
+# *   the License, or (at your option) any later version.                  *
+# *   for detail see the LICENCE text file.                                *
+# *                                                                        *
+# *   This program is distributed in the hope that it will be useful,      *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of       *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the        *
+# *   GNU Library General Public License for more details.                 *
+# *                                                                        *
+# *   You should have received a copy of the GNU Library General Public    *
+# *   License along with this program; if not, write to the Free Software  *
+# *   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307 *
+# *   USA                                                                  *
+# *                                                                        *
+# *                                                                        *
+# **************************************************************************
+#
+#
+# Region of interest import
+#
+# Prunes the structure traversal of processGDML to the physvols whose
+# volume
+#   box     : has bounds intersecting an axis aligned box (world mm)
+#   volumes : is one of the named volumes, inside one, or contains one
+# Bounds come from the solid parameters only, no shapes are built.
+# Solids without a cheap bound (e.g. unions) are never pruned.
+
+import math
+
+import FreeCAD
+
+from . import GDMLShared
+
+
+def extentsBox(solid):
+    mul = GDMLShared.getMult(solid)
+    x = mul * GDMLShared.getVal(solid, "x") / 2
+    y = mul * GDMLShared.getVal(solid, "y") / 2
+    z = mul * GDMLShared.getVal(solid, "z") / 2
+    return (-x, -y, -z), (x, y, z)
+
+
+def extentsTube(solid):
+    mul = GDMLShared.getMult(solid)
+    r = mul * GDMLShared.getVal(solid, "rmax")
+    z = mul * GDMLShared.getVal(solid, "z") / 2
+    return (-r, -r, -z), (r, r, z)
+
+
+def extentsCone(solid):
+    mul = GDMLShared.getMult(solid)
+    r = mul * max(
+        GDMLShared.getVal(solid, "rmax1"), GDMLShared.getVal(solid, "rmax2")
+    )
+    z = mul * GDMLShared.getVal(solid, "z") / 2
+    return (-r, -r, -z), (r, r, z)
+
+
+def extentsSphere(solid):
+    mul = GDMLShared.getMult(solid)
+    r = mul * GDMLShared.getVal(solid, "rmax")
+    return (-r, -r, -r), (r, r, r)
+
+
+def extentsOrb(solid):
+    mul = GDMLShared.getMult(solid)
+    r = mul * GDMLShared.getVal(solid, "r")
+    return (-r, -r, -r), (r, r, r)
+
+
+def extentsTorus(solid):
+    mul = GDMLShared.getMult(solid)
+    rmax = mul * GDMLShared.getVal(solid, "rmax")
+    r = mul * GDMLShared.getVal(solid, "rtor") + rmax
+    return (-r, -r, -rmax), (r, r, rmax)
+
+
+def extentsTrd(solid):
+    mul = GDMLShared.getMult(solid)
+    x = mul * max(
+        GDMLShared.getVal(solid, "x1"), GDMLShared.getVal(solid, "x2")
+    ) / 2
+    y = mul * max(
+        GDMLShared.getVal(solid, "y1"), GDMLShared.getVal(solid, "y2")
+    ) / 2
+    z = mul * GDMLShared.getVal(solid, "z") / 2
+    return (-x, -y, -z), (x, y, z)
+
+
+def extentsEllipsoid(solid):
+    mul = GDMLShared.getMult(solid)
+    x = mul * GDMLShared.getVal(solid, "ax")
+    y = mul * GDMLShared.getVal(solid, "by")
+    z = mul * GDMLShared.getVal(solid, "cz")
+    return (-x, -y, -z), (x, y, z)
+
+
+def extentsEltube(solid):
+    mul = GDMLShared.getMult(solid)
+    x = mul * GDMLShared.getVal(solid, "dx")
+    y = mul * GDMLShared.getVal(solid, "dy")
+    z = mul * GDMLShared.getVal(solid, "dz")
+    return (-x, -y, -z), (x, y, z)
+
+
+def extentsPolycone(solid):
+    mul = GDMLShared.getMult(solid)
+    zplanes = solid.findall("zplane")
+    if len(zplanes) == 0:
+        return None
+    r = mul * max(GDMLShared.getVal(zp, "rmax") for zp in zplanes)
+    if solid.tag == "polyhedra":
+        # rmax is to the flats
+        r /= math.cos(math.pi / max(3, GDMLShared.getVal(solid, "numsides")))
+    zs = [mul * GDMLShared.getVal(zp, "z") for zp in zplanes]
+    return (-r, -r, min(zs)), (r, r, max(zs))
+
+
+def extentsTessellated(solid):
+    mul = GDMLShared.getMult(solid)
+    coords = GDMLShared.tessellatedArrays(solid)[0]
+    if len(coords) == 0:
+        return None
+    if mul != 1:
+        coords = coords * mul
+    return tuple(coords.min(axis=0)), tuple(coords.max(axis=0))
+
+
+solidExtents = {
+    "box": extentsBox,
+    "tube": extentsTube,
+    "cutTube": extentsTube,
+    "cone": extentsCone,
+    "sphere": extentsSphere,
+    "orb": extentsOrb,
+    "torus": extentsTorus,
+    "trd": extentsTrd,
+    "ellipsoid": extentsEllipsoid,
+    "eltube": extentsEltube,
+    "polycone": extentsPolycone,
+    "polyhedra": extentsPolycone,
+    "tessellated": extentsTessellated,
+}
+
+
+class ImportRegion:
+    def __init__(self, box=None, volumes=None):
+        # box : (xmin, ymin, zmin, xmax, ymax, zmax) in mm
+        self.box = box
+        self.volumes = set(volumes) if volumes else set()
+        self.keepVolumes = set()
+        self.extents = {}
+        # world placement of the volume being expanded
+        self.stack = [FreeCAD.Placement()]
+        self.inside = 0
+        self.pruned = 0
+        self.partial = set()
+        self.marks = []
+
+    def prepare(self, structureIndex, solidsIndex, world):
+        self.structureIndex = structureIndex
+        self.solidsIndex = solidsIndex
+        if world in self.volumes:
+            self.inside = 1
+        if len(self.volumes) > 0:
+            self.keepVolumes = self.ancestors(self.volumes)
+
+    def children(self, vol):
+        for pv in vol.findall("physvol"):
+            ref = GDMLShared.getRef(pv, "volumeref")
+            if ref is not None:
+                yield ref
+
+    def ancestors(self, names):
+        # names & every volume / assembly that contains one of them
+        users = {}
+        for tag in ("volume", "assembly"):
+            for name, vol in self.structureIndex.byTag.get(tag, {}).items():
+                for ref in self.children(vol):
+                    users.setdefault(ref, set()).add(name)
+        ret = set()
+        todo = list(names)
+        while todo:
+            name = todo.pop()
+            if name in ret:
+                continue
+            ret.add(name)
+            todo.extend(users.get(name, ()))
+        return ret
+
+    def solidBounds(self, solid):
+        if solid.tag in ["subtraction", "intersection"]:
+            # inside the first solid
+            first = self.solidsIndex.find(GDMLShared.getRef(solid, "first"))
+            if first is None:
+                return None
+            return self.solidBounds(first)
+        func = solidExtents.get(solid.tag)
+        if func is None:
+            return None
+        return func(solid)
+
+    def volumeBounds(self, name):
+        # local bounds of volume, None if unknown (not pruned)
+        if name in self.extents:
+            return self.extents[name]
+        ret = None
+        vol = self.structureIndex.find(name, "volume")
+        if vol is not None:
+            solid = self.solidsIndex.find(GDMLShared.getRef(vol, "solidref"))
+            if solid is not None:
+                try:
+                    ret = self.solidBounds(solid)
+                except Exception as e:
+                    print(f"No bounds for volume {name} : {e}")
+        self.extents[name] = ret
+        return ret
+
+    def worldBounds(self, placement, bounds):
+        lo, hi = bounds
+        pts = [
+            placement.multVec(FreeCAD.Vector(x, y, z))
+            for x in (lo[0], hi[0])
+            for y in (lo[1], hi[1])
+            for z in (lo[2], hi[2])
+        ]
+        return (
+            (min(p.x for p in pts), min(p.y for p in pts),
+             min(p.z for p in pts)),
+            (max(p.x for p in pts), max(p.y for p in pts),
+             max(p.z for p in pts)),
+        )
+
+    def intersects(self, lo, hi):
+        b = self.box
+        return all(lo[i] <= b[i + 3] and hi[i] >= b[i] for i in range(3))
+
+    def keep(self, pv, volRef):
+        # True if physvol pv of volume volRef is to be created
+        if self.inside > 0:
+            return True
+        if len(self.volumes) > 0 and volRef not in self.keepVolumes:
+            self.pruned += 1
+            return False
+        if self.box is not None and pv.find("scale") is None:
+            bounds = self.volumeBounds(volRef)
+            if bounds is not None:
+                placement = self.stack[-1].multiply(
+                    GDMLShared.getPlacement(pv)
+                )
+                lo, hi = self.worldBounds(placement, bounds)
+                if not self.intersects(lo, hi):
+                    self.pruned += 1
+                    return False
+        return True
+
+    def enter(self, pv, volRef):
+        self.stack.append(
+            self.stack[-1].multiply(GDMLShared.getPlacement(pv))
+        )
+        if volRef in self.volumes:
+            self.inside += 1
+        self.marks.append(self.pruned)
+
+    def leave(self, volRef):
+        self.stack.pop()
+        if volRef in self.volumes:
+            self.inside -= 1
+        mark = self.marks.pop()
+        if self.box is not None and self.pruned > mark:
+            # contents depend on the placement, so no links to it
+            self.partial.add(volRef)
+
+    def canLink(self, volRef):
+        return volRef not in self.partial
+
+    def report(self):
+        print(f"Region import : {self.pruned} physvols pruned")
@@ -0,0 +1,134 @@
+# **************************************************************************
+# *                                                                        *
+# *   Copyright (c) 2024 Keith Sloan <keith@sloan-home.co.uk>              *
+# *                                                                        *
+# *   This program is free software; you can redistribute it and/or modify*
+# *   it under the terms of the GNU Lesser General Public License (LGPL)   *
+# *   as published by the Free Software Foundation; either version 2 of    *
+# *   the License, or (at your option) any later version.                  *
+# *   for detail see the LICENCE text file.                                *
+# *                                                                        *
+# *   This program is distributed in the hope that it will be useful,      *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of       *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the        *
+# *   GNU Library General Public License for more details.                 *
+# *                                                                        *
+# *   You should have received a copy of the GNU Library General Public    *
+# *   License along with this program; if not, write to the Free Software  *
+# *   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307 *
+# *   USA                                                                  *
+# *                                                                        *
+# *                                                                        *
+# **************************************************************************
+#
+#
+# Cache of parsed sub documents
+#
+# Files referenced by <file name=...> physvols and the XML fragments read
+# by the processXML* helpers are parsed once and shared, keyed by absolute
+# path, mtime & size so an edited file is parsed again. The <file>
+# references of a GDML file are parsed in a thread pool while the main
+# document is processed. Least recently used trees are dropped above
+# includeCacheSizeMB (size of the files, not of the parsed trees).
+
+import os
+from collections import OrderedDict
+
+import FreeCAD
+
+
+def parseFile(path, kind):
+    # kind "gdml" : ElementTree with entities resolved
+    # kind "include" : fragment wrapped in an <xml> element
+    from lxml import etree
+
+    if kind == "include":
+        with open(path) as f:
+            return etree.fromstring("<xml>" + f.read() + "</xml>")
+    parser = etree.XMLParser(resolve_entities=True)
+    return etree.parse(path, parser=parser)
+
+
+class IncludeCache:
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.size = 0
+        self.pending = {}
+        self.pool = None
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, path, kind):
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        return (path, st.st_mtime_ns, st.st_size, kind)
+
+    def limit(self):
+        params = FreeCAD.ParamGet(
+            "User parameter:BaseApp/Preferences/Mod/GDML"
+        )
+        return params.GetInt("includeCacheSizeMB", 256) * 1024 * 1024
+
+    def prefetch(self, paths, kind="gdml"):
+        # start parsing paths in the background
+        from concurrent.futures import ThreadPoolExecutor
+
+        for path in paths:
+            try:
+                key = self.key(path, kind)
+            except OSError:
+                continue
+            if key in self.entries or key in self.pending:
+                continue
+            if self.pool is None:
+                self.pool = ThreadPoolExecutor(
+                    max_workers=min(4, os.cpu_count() or 1)
+                )
+            self.pending[key] = self.pool.submit(parseFile, path, kind)
+
+    def get(self, path, kind="gdml"):
+        key = self.key(path, kind)
+        tree = self.entries.get(key)
+        if tree is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return tree
+        self.misses += 1
+        future = self.pending.pop(key, None)
+        if future is not None:
+            tree = future.result()
+        else:
+            tree = parseFile(path, kind)
+        self.entries[key] = tree
+        self.size += key[2]
+        self.evict()
+        return tree
+
+    def evict(self):
+        limit = self.limit()
+        # always keep the most recent tree
+        while self.size > limit and len(self.entries) > 1:
+            key, tree = self.entries.popitem(last=False)
+            self.size -= key[2]
+
+    def clear(self):
+        for future in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
+            self.pool = None
+        self.entries.clear()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def report(self):
+        if self.hits + self.misses > 0:
+            print(
+                f"Sub documents : {self.misses} parsed "
+                f"{self.hits} from cache"
+            )
+
+
+parsedFiles = IncludeCache()
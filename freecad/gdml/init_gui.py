@@ -79,6 +79,11 @@ class GDML_Workbench(FreeCADGui.Workbench):
                     True,
                 )
 
+        def slotFinishRestoreDocument(self, doc):
+            from .GDMLObjects import migrateMaterials
+
+            migrateMaterials(doc)
+
     "GDML workbench object"
 
     def __init__(self):
@@ -131,6 +136,8 @@ class GDML_Workbench(FreeCADGui.Workbench):
             "Tess2MeshCommand",
             "TetrahedronCommand",
             "AddCompound",
+            "UpdateFromGDMLCommand",
+            "PurgeImportCacheCommand",
         ]
 
         toolbarcommands = [
@@ -0,0 +1,165 @@
+# **************************************************************************
+# *                                                                        *
+# *   Copyright (c) 2024 Keith Sloan <keith@sloan-home.co.uk>              *
+# *                                                                        *
+# *   This program is free software; you can redistribute it and/or modify*
+# *   it under the terms of the GNU Lesser General Public License (LGPL)   *
+# *   as published by the Free Software Foundation; either version 2 of    *
+# *   the License, or (at your option) any later version.                  *
+# *   for detail see the LICENCE text file.                                *
+# *                                                                        *
+# *   This program is distributed in the hope that it will be useful,      *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of       *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the        *
+# *   GNU Library General Public License for more details.                 *
+# *                                                                        *
+# *   You should have received a copy of the GNU Library General Public    *
+# *   License along with this program; if not, write to the Free Software  *
+# *   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307 *
+# *   USA                                                                  *
+# *                                                                        *
+# *                                                                        *
+# **************************************************************************
+#
+#
+# Serialise tessellated solids for export in a pool of worker processes
+#
+# Each tessellated solid the exporter will export (found with the same
+# volume traversal, exportGDML.exportedSolids) is sent to a worker as
+# BREP. The worker takes the vertex & facet index arrays from the shape
+# and formats its <position> defines and <tessellated> element as XML
+# text. The exporter inserts the text where it would have built the
+# elements, so the output is the same as a serial export.
+
+from xml.sax.saxutils import quoteattr
+
+# solid types exported by GDMLTessellatedExporter
+tessellatedTypes = ["GDMLTessellated", "GDMLGmshTessellated"]
+
+
+def tessellatedXML(job):
+    # Runs in a worker, job is (tessName, points, facets)
+    # returns (define, solid) XML fragments, one element per line
+    tessName, points, facets = job
+    vName = tessName + "_"
+    define = [
+        '<position name=%s unit="mm" x="%s" y="%s" z="%s"/>'
+        % (quoteattr(vName + str(i)), p[0], p[1], p[2])
+        for i, p in enumerate(points)
+    ]
+    solid = ["<tessellated name=%s>" % quoteattr(tessName)]
+    for facet in facets:
+        tag = "triangular" if len(facet) == 3 else "quadrangular"
+        refs = " ".join(
+            "vertex%d=%s" % (k + 1, quoteattr(vName + str(i)))
+            for k, i in enumerate(facet)
+        )
+        solid.append('  <%s %s type="ABSOLUTE"/>' % (tag, refs))
+    solid.append("</tessellated>")
+    return "\n".join(define).encode(), "\n".join(solid).encode()
+
+
+def tessellatedWorker(job):
+    # Runs in a worker, job is (tessName, BREP, placement matrix)
+    import FreeCAD
+    import Part
+
+    tessName, brep, matrix = job
+    shape = Part.Shape()
+    shape.importBrepFromString(brep)
+    placement = FreeCAD.Placement(FreeCAD.Matrix(*matrix))
+    points, facets = shapeArrays(shape, placement)
+    return tessellatedXML((tessName, points, facets))
+
+
+def tessellatedArrays(obj):
+    # points relative to the solid & facets as vertex indexes
+    return shapeArrays(obj.Shape, obj.Placement)
+
+
+def shapeArrays(shape, placement):
+    placementCorrection = placement.inverse()
+    index = {}
+    points = []
+    for i, v in enumerate(shape.Vertexes):
+        index[v.hashCode()] = i
+        p = placementCorrection * v.Point
+        points.append((p.x, p.y, p.z))
+    facets = []
+    for f in shape.Faces:
+        n = len(f.Edges)
+        if n in (3, 4):
+            vertexes = f.OuterWire.OrderedVertexes
+            facets.append(
+                tuple(index[vertexes[k].hashCode()] for k in range(n))
+            )
+    return points, facets
+
+
+def sampledArrays(obj):
+    # GDMLSampledTessellated keeps its vertices & facets as properties
+    points = [(v.x, v.y, v.z) for v in obj.vertsList]
+    facets = []
+    i = 0
+    indexList = obj.indexList
+    for nVerts in obj.vertsPerFacet:
+        if nVerts in (3, 4):
+            facets.append(tuple(indexList[i:i + nVerts]))
+        i += nVerts
+    return points, facets
+
+
+def isTessellated(obj):
+    proxy = getattr(obj, "Proxy", None)
+    return getattr(proxy, "Type", None) in tessellatedTypes
+
+
+def buildTessellated(first, workers):
+    # obj.Name -> (define, solid) fragments of the tessellated solids
+    # under first, empty if there is nothing worth a pool
+    import FreeCAD
+    from concurrent.futures import ProcessPoolExecutor
+    from .parallelShapes import getContext, initWorker
+    from .exportGDML import GDMLTessellatedExporter, exportedSolids
+    from . import exportCache
+
+    useCache = exportCache.useCache()
+    objects = []
+    names = []
+    seen = set()
+    for obj in exportedSolids(first):
+        if not isTessellated(obj) or obj.Name in seen:
+            continue
+        seen.add(obj.Name)
+        name = GDMLTessellatedExporter(obj).name()
+        # unchanged solids come from the export cache
+        if useCache and exportCache.cached(obj, name):
+            continue
+        objects.append(obj)
+        names.append(name)
+    if len(objects) < 2:
+        return {}
+    jobs = [
+        (
+            name,
+            obj.Shape.exportBrepToString(),
+            tuple(obj.Placement.toMatrix().A),
+        )
+        for obj, name in zip(objects, names)
+    ]
+    print(f"Serialising {len(jobs)} tessellated solids with {workers} workers")
+    ctx, paths = getContext()
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=ctx,
+            initializer=initWorker,
+            initargs=(paths,),
+        ) as pool:
+            results = list(pool.map(tessellatedWorker, jobs))
+    except Exception as e:
+        FreeCAD.Console.PrintWarning(
+            f"Parallel tessellated export failed, exporting serially : {e}\n"
+        )
+        return {}
+    return {obj.Name: result for obj, result in zip(objects, results)}
@@ -0,0 +1,202 @@
+# **************************************************************************
+# *                                                                        *
+# *   Copyright (c) 2024 Keith Sloan <keith@sloan-home.co.uk>              *
+# *                                                                        *
+# *   This program is free software; you can redistribute it and/or modify*
+# *   it under the terms of the GNU Lesser General Public License (LGPL)   *
+# *   as published by the Free Software Foundation; either version 2 of    *
+# *   the License, or (at your option) any later version.                  *
+# *   for detail see the LICENCE text file.                                *
+# *                                                                        *
+# *   This program is distributed in the hope that it will be useful,      *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of       *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the        *
+# *   GNU Library General Public License for more details.                 *
+# *                                                                        *
+# *   You should have received a copy of the GNU Library General Public    *
+# *   License along with this program; if not, write to the Free Software  *
+# *   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307 *
+# *   USA                                                                  *
+# *                                                                        *
+# *                                                                        *
+# **************************************************************************
+#
+# Build the shapes of GDML solids in a pool of worker processes.
+#
+# The document objects are created as normal on the main thread, then
+# the unique solid definitions are sent to the workers which run the
+# usual createGeometry of the solid class against a plain holder of the
+# property values. Shapes come back as BREP strings and are handed to the
+# objects, GDMLsolid.execute then uses them instead of building again.
+
+import os
+import sys
+
+import FreeCAD
+import Part
+
+
+class ShapeParams:
+    # Stands in for the document object in a worker
+    def __init__(self, props, vectors):
+        for name, value in props:
+            if name in vectors:
+                value = FreeCAD.Vector(*value)
+            setattr(self, name, value)
+        self.Label = "worker"
+        self.State = []
+        self.Placement = FreeCAD.Placement()
+        self.Shape = None
+
+
+def solidJob(obj):
+    # picklable (class name, properties, vector names, proxy state)
+    # or None if the object has to be built on the main thread
+    from .GDMLObjects import GDMLsolid, ownPropertySolids, nonShapeProperties
+
+    proxy = getattr(obj, "Proxy", None)
+    className = proxy.__class__.__name__
+    if className not in ownPropertySolids:
+        return None
+    # only GDMLsolid.execute picks up preShape
+    if type(proxy).execute is not GDMLsolid.execute:
+        return None
+    props = []
+    vectors = []
+    for name in obj.PropertiesList:
+        if name in nonShapeProperties:
+            continue
+        value = getattr(obj, name)
+        if isinstance(value, FreeCAD.Vector):
+            vectors.append(name)
+            value = (value.x, value.y, value.z)
+        elif isinstance(value, list):
+            value = tuple(value)
+        elif not isinstance(value, (str, int, float, bool, tuple)):
+            return None
+        props.append((name, value))
+    state = tuple(
+        (k, v)
+        for k, v in sorted(proxy.__dict__.items())
+        if isinstance(v, (str, int, float, bool, tuple, type(None)))
+    )
+    return (className, tuple(props), tuple(vectors), state)
+
+
+def initWorker(paths):
+    for p in paths:
+        if p not in sys.path:
+            sys.path.append(p)
+
+
+def buildShape(job):
+    # Runs in a worker, returns BREP string or None on failure
+    className, props, vectors, state = job
+    try:
+        from . import GDMLObjects
+
+        cls = getattr(GDMLObjects, className)
+        proxy = cls.__new__(cls)
+        proxy.__dict__.update(dict(state))
+        fp = ShapeParams(props, vectors)
+        proxy.createGeometry(fp)
+        if fp.Shape is None:
+            return None
+        return fp.Shape.exportBrepToString()
+    except Exception as e:
+        print(f"Worker failed to build {className} : {e}")
+        return None
+
+
+def pythonExecutable():
+    # workers must run FreeCAD's python, not the FreeCAD executable
+    import shutil
+
+    home = FreeCAD.getHomePath()
+    for exe in ["python.exe", "python", "python3"]:
+        pythonExe = os.path.join(home, "bin", exe)
+        if os.path.exists(pythonExe):
+            return pythonExe
+    if os.path.basename(sys.executable).lower().startswith("python"):
+        return sys.executable
+    version = f"python{sys.version_info.major}.{sys.version_info.minor}"
+    return shutil.which(version)
+
+
+def getContext():
+    # Never fork the FreeCAD process itself, Qt, OCC & helper threads
+    # (include prefetch ...) may hold locks a forked child would wait on
+    # forever. forkserver forks workers from a fresh single threaded
+    # server process, elsewhere spawn
+    import multiprocessing
+
+    if sys.platform.startswith("linux"):
+        ctx = multiprocessing.get_context("forkserver")
+    else:
+        ctx = multiprocessing.get_context("spawn")
+    pythonExe = pythonExecutable()
+    if pythonExe is not None:
+        ctx.set_executable(pythonExe)
+    home = FreeCAD.getHomePath()
+    modPath = os.path.dirname(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    )
+    paths = [os.path.join(home, "lib"), os.path.join(home, "bin"), modPath]
+    return ctx, paths
+
+
+def buildShapes(objects, workers):
+    # Build shapes of eligible solids in objects, i.e. those created by
+    # this import, returns number built
+    from concurrent.futures import ProcessPoolExecutor
+
+    jobs = {}
+    for obj in objects:
+        if not hasattr(obj, "Proxy"):
+            continue
+        job = solidJob(obj)
+        if job is not None:
+            jobs.setdefault(job, []).append(obj)
+    if len(jobs) == 0:
+        return 0
+
+    print(f"Building {len(jobs)} unique solids with {workers} workers")
+    keys = list(jobs)
+    ctx, paths = getContext()
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=ctx,
+            initializer=initWorker,
+            initargs=(paths,),
+        ) as pool:
+            chunk = max(1, len(keys) // (4 * workers))
+            results = list(pool.map(buildShape, keys, chunksize=chunk))
+    except Exception as e:
+        FreeCAD.Console.PrintWarning(
+            f"Parallel shape build failed, building serially : {e}\n"
+        )
+        return 0
+
+    built = 0
+    for key, brep in zip(keys, results):
+        if brep is None:
+            continue
+        shape = Part.Shape()
+        shape.importBrepFromString(brep)
+        for obj in jobs[key]:
+            obj.Proxy.preShape = shape
+            built += 1
+    return built
+
+
+def clearPreShapes(objects):
+    # drop shapes not used by the recompute, so a later execute of the
+    # object does not pick up a stale shape
+    cleared = 0
+    for obj in objects:
+        proxy = getattr(obj, "Proxy", None)
+        if getattr(proxy, "preShape", None) is not None:
+            del proxy.preShape
+            cleared += 1
+    return cleared
@@ -3,6 +3,8 @@ import FreeCAD
 import copy
 import re
 
+from . import GDMLShared
+
 try:
     import lxml.etree as ET
 
@@ -18,89 +20,213 @@ except ImportError:
         FreeCAD.Console.PrintMessage("pb xml lib not found\n")
         sys.exit()
 
+# Loops are expanded from a template compiled once per loop element:
+# the attributes that reference the loop variable are found & split
+# once, each iteration then only deep copies the children and fills
+# in those attributes. Nested loops are expanded with each copy, so
+# their from / to / step may use the outer loop variables.
+# With lazy expansion top level loops of <solids> (and of <structure>
+# for volumes & assemblies) are left in the tree and expanded by the
+# section index when a generated name is first looked up.
+
+# loop variable -> compiled pattern
+varPatterns = {}
+# (loop variable, attribute value) -> template or None
+templateCache = {}
+
+
+def varPattern(var):
+    # matches name[var] style indices (group 1) or var as a word
+    pattern = varPatterns.get(var)
+    if pattern is None:
+        v = re.escape(var)
+        pattern = re.compile(r"(\[ *" + v + r" *\])|\b" + v + r"\b")
+        varPatterns[var] = pattern
+    return pattern
+
+
+def attribTemplate(var, value):
+    # (literals, isIndex) of value split on references to var
+    # None if value does not reference var
+    key = (var, value)
+    if key in templateCache:
+        return templateCache[key]
+    literals = []
+    isIndex = []
+    pos = 0
+    for m in varPattern(var).finditer(value):
+        literals.append(value[pos:m.start()])
+        isIndex.append(m.group(1) is not None)
+        pos = m.end()
+    if len(isIndex) == 0:
+        ret = None
+    else:
+        literals.append(value[pos:])
+        ret = (tuple(literals), tuple(isIndex))
+    templateCache[key] = ret
+    return ret
+
+
+def fillTemplate(template, text):
+    literals, isIndex = template
+    parts = [literals[0]]
+    for index, literal in zip(isIndex, literals[1:]):
+        # box[i] -> box_1
+        parts.append(f"_{text}_" if index else text)
+        parts.append(literal)
+    value = "".join(parts)
+    if True in isIndex:
+        value = value.replace("__", "_")
+        if value[-1] == "_":
+            value = value[:-1]
+    return value
+
+
+def loopValue(loopElement, attrib, default=None):
+    expr = loopElement.get(attrib, default)
+    if expr is None:
+        raise ValueError(f"loop {loopElement.get('for')} has no {attrib}")
+    return GDMLShared.evaluate(expr)
+
+
+def loopText(value):
+    value = float(value)
+    if value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class LoopTemplate:
+    def __init__(self, loopElement):
+        self.var = loopElement.get("for")
+        self.start = loopValue(loopElement, "from")
+        self.to = loopValue(loopElement, "to")
+        self.step = loopValue(loopElement, "step", "1")
+        if self.step == 0:
+            raise ValueError(f"loop {self.var} has step 0")
+        # (child, [(position in child.iter(), attribute, template)])
+        self.children = []
+        for child in loopElement:
+            if not isinstance(child.tag, str):
+                continue
+            subs = []
+            for n, elem in enumerate(child.iter()):
+                for key, value in elem.items():
+                    template = attribTemplate(self.var, value)
+                    if template is not None:
+                        subs.append((n, key, template))
+            self.children.append((child, subs))
+
+    def values(self):
+        # loop values as text, to is inclusive
+        eps = 1e-9 * abs(self.step)
+        n = 0
+        value = self.start
+        while (self.step > 0 and value <= self.to + eps) or (
+            self.step < 0 and value >= self.to - eps
+        ):
+            yield loopText(value)
+            n += 1
+            value = self.start + n * self.step
+
+    def buildChild(self, child, subs, text):
+        new = copy.deepcopy(child)
+        if len(subs) > 0:
+            nodes = list(new.iter())
+            for n, key, template in subs:
+                nodes[n].set(key, fillTemplate(template, text))
+        return new
+
+    def expand(self):
+        # generator of the expanded elements, nested loops expanded
+        for text in self.values():
+            for child, subs in self.children:
+                new = self.buildChild(child, subs, text)
+                if new.tag == "loop":
+                    yield from LoopTemplate(new).expand()
+                else:
+                    preprocessElementLoops(new)
+                    yield new
+
+    def instances(self):
+        # generator of (tag, name, build) for each element of the loop
+        # without building them, only for loops of named elements
+        for text in self.values():
+            for child, subs in self.children:
+                name = child.get("name")
+                for n, key, template in subs:
+                    if n == 0 and key == "name":
+                        name = fillTemplate(template, text)
+                yield child.tag, name, self.builder(child, subs, text)
+
+    def builder(self, child, subs, text):
+        def build():
+            new = self.buildChild(child, subs, text)
+            preprocessElementLoops(new)
+            return new
+
+        return build
+
+
+def expandLoop(loopElement):
+    # generator of the elements loopElement expands to, tree unchanged
+    return LoopTemplate(loopElement).expand()
+
 
 def processLoop(loopElement):
     """
-    Expand loop element in situ:
-    - first get the loop variable and the from, to, step 
-    - for each value of the loop:
-        copy all the child elements
-        add the copy to the parent of the loop element
-        replace the variable in the element with the current loop value
-        for each descendant of the copied child element, replace
-        the variable with its loop value
-    - remove the loop element from its parent
+    Expand loop element in situ, the expanded elements replace the loop
+    element in its parent
     """
-    doc = FreeCAD.ActiveDocument
-    constantsGrp = doc.getObject('Constants')
-    constants = {}
-    for obj in constantsGrp.OutList:
-        constants[obj.name] = obj.value
-
-    var = loopElement.get("for")
-    start = loopElement.get("from")
-    if start in constants:
-        start = int(constants[start])
-    else:
-        start = int(start)
+    for elem in expandLoop(loopElement):
+        loopElement.addprevious(elem)
+    loopElement.getparent().remove(loopElement)
 
-    to = loopElement.get("to")
-    if to in constants:
-        to = int(constants[to])
-    else:
-        to = int(to)
 
-    step = loopElement.get("step")
-    if step in constants:
-        step = int(constants[step])
-    else:
-        step = int(step)
-
-    # print(f'var {var} from {start} to {to} step {step}')
-
-    def substitueVar(element, var, value):
-        if element.attrib is None:
-            # print(f'{element.tag} has no attributes - no substituions')
-            return
-        pattern = "\[ *"+var+" *\]"
-        for key, value in element.items():
-            if len(re.findall(pattern, value)):
-                value = re.sub(pattern, f'_{str(i)}_', value)
-                value = value.replace('__', '_')
-                if value[-1] == '_':
-                    s = list(value)
-                    s[-1] = ""
-                    value = "".join(s)
-            elif var in value:
-                value = value.replace(var, f'{i}')
-            element.set(key, value)
-
-    parent = loopElement.getparent()
-    for i in range(start, to+1, step):
-        for child in loopElement.iterchildren():
-            newchild = copy.copy(child)
-            # print(newchild, newchild.getparent())
-            substitueVar(newchild, var, i)
-            for desc in newchild.iterdescendants():
-                # print(desc, desc.tag, desc.attrib)
-                substitueVar(desc, var, i)
-            parent.append(newchild)
-
-    parent.remove(loopElement)
-
-
-def preprocessLoops(root):
-    stack = []
-    #
-    # get all loop elements
-    #
-    for loop in root.getroot().iterdescendants(tag="loop"):
-        # print(loop.getparent(), loop.tag, loop.attrib)
-        stack.append(loop)
-    #
-    # process them one at a time
-    #
-    while len(stack) > 0:
-        loop = stack.pop()
+def canDefer(loopElement, tags=None):
+    # Lazy expansion needs the names of the generated elements
+    for child in loopElement:
+        if not isinstance(child.tag, str):
+            continue
+        if child.tag == "loop" or child.get("name") is None:
+            return False
+        if tags is not None and child.tag not in tags:
+            return False
+    return True
+
+
+def loopInstances(loopElement):
+    # used by GDMLShared.SectionIndex for loops left unexpanded
+    return LoopTemplate(loopElement).instances()
+
+
+def preprocessLoops(root, lazy=False):
+    templateCache.clear()
+    gdml = root.getroot()
+    if not lazy:
+        preprocessElementLoops(gdml)
+        return
+    for section in gdml:
+        if section.tag == "solids":
+            preprocessElementLoops(section, True)
+        elif section.tag == "structure":
+            preprocessElementLoops(section, True, ["volume", "assembly"])
+        elif isinstance(section.tag, str):
+            preprocessElementLoops(section)
+
+
+def preprocessElementLoops(element, lazy=False, lazyTags=None):
+    # outermost loops only, nested loops are expanded with their copies
+    loops = [
+        loop
+        for loop in element.iter("loop")
+        if next(loop.iterancestors("loop"), None) is None
+    ]
+    for loop in loops:
+        if (
+            lazy
+            and loop.getparent() is element
+            and canDefer(loop, lazyTags)
+        ):
+            continue
         processLoop(loop)
-    # print(ET.tostring(root, pretty_print=True))
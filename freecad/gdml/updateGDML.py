@@ -0,0 +1,400 @@
+# **************************************************************************
+# *                                                                        *
+# *   Copyright (c) 2024 Keith Sloan <keith@sloan-home.co.uk>              *
+# *                                                                        *
+# *   This program is free software; you can redistribute it and/or modify*
+# *   it under the terms of the GNU Lesser General Public License (LGPL)   *
+# *   as published by the Free Software Foundation; either version 2 of    *
+# *   the License, or (at your option) any later version.                  *
+# *   for detail see the LICENCE text file.                                *
+# *                                                                        *
+# *   This program is distributed in the hope that it will be useful,      *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of       *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the        *
+# *   GNU Library General Public License for more details.                 *
+# *                                                                        *
+# *   You should have received a copy of the GNU Library General Public    *
+# *   License along with this program; if not, write to the Free Software  *
+# *   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307 *
+# *   USA                                                                  *
+# *                                                                        *
+# *                                                                        *
+# **************************************************************************
+#
+# Update a document from a regenerated GDML file
+#
+# With the updateHashes preference set, on import every volume App::Part
+# is given two content hashes
+#   GDMLSolidHash  : solid, material & colour of the volume, with
+#                    everything they reference (defines, other solids ...)
+#   GDMLVolumeHash : the physvols, replicas etc. of the volume
+# and the world volume the hashes of all materials & the source file.
+# An update parses the new file, compares the hashes and only recreates
+# the solids, physvols and materials that changed. Unchanged objects,
+# and their view state, are left alone. The Constants, Variables and
+# Quantities groups are refreshed from the new <define> section.
+
+import os
+import re
+import hashlib
+
+identPattern = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+# children of a volume that make up its solid
+solidTags = ["solidref", "materialref", "colorref"]
+
+# define group, define tag & the properties set from its attributes
+defineGroups = [
+    ("Constants", "constant", ["value"]),
+    ("Variables", "variable", ["value"]),
+    ("Quantities", "quantity", ["type", "unit", "value"]),
+]
+
+
+class GDMLHasher:
+    # content hashes of GDML elements including what they reference
+    def __init__(self, root):
+        self.memo = {}
+        self.materials = {}
+        for section in root.findall("materials"):
+            for elem in section:
+                if isinstance(elem.tag, str):
+                    self.materials.setdefault(elem.get("name"), elem)
+
+    def lookup(self, name):
+        from . import GDMLShared
+        from .importGDML import solidsIndex, extensionIndex
+
+        elem = GDMLShared.defineIndex.find(name)
+        if elem is None:
+            elem = solidsIndex.find(name)
+        if elem is None:
+            elem = self.materials.get(name)
+        if elem is None:
+            elem = extensionIndex.find(name)
+        return elem
+
+    def refNames(self, elem):
+        names = set()
+        for e in elem.iter():
+            for attName, value in e.attrib.items():
+                if e is elem and attName == "name":
+                    continue
+                names.update(identPattern.findall(value))
+        return names
+
+    def elementHash(self, elem):
+        from lxml import etree
+
+        name = elem.get("name")
+        key = (elem.tag, name)
+        if name is not None:
+            if key in self.memo:
+                return self.memo[key]
+            # guard against reference cycles
+            self.memo[key] = ""
+        h = hashlib.sha1(etree.tostring(elem, with_tail=False))
+        for ref in sorted(self.refNames(elem)):
+            dep = self.lookup(ref)
+            if dep is not None and dep is not elem:
+                h.update(ref.encode())
+                h.update(self.elementHash(dep).encode())
+        ret = h.hexdigest()
+        if name is not None:
+            self.memo[key] = ret
+        return ret
+
+    def isSolidPart(self, child):
+        if child.tag in solidTags:
+            return True
+        return child.tag == "auxiliary" and child.get("auxtype") == "Color"
+
+    def solidHash(self, vol):
+        h = hashlib.sha1()
+        for child in vol:
+            if isinstance(child.tag, str) and self.isSolidPart(child):
+                h.update(self.elementHash(child).encode())
+        return h.hexdigest()
+
+    def volumeHash(self, vol):
+        h = hashlib.sha1(vol.tag.encode())
+        for child in vol:
+            if isinstance(child.tag, str) and not self.isSolidPart(child):
+                h.update(self.elementHash(child).encode())
+        return h.hexdigest()
+
+
+def setStringProperty(obj, prop, value):
+    if not hasattr(obj, prop):
+        obj.addProperty("App::PropertyString", prop, "GDML", prop)
+        obj.setEditorMode(prop, 2)
+    setattr(obj, prop, value)
+
+
+def setVolumeHashes(hasher, part, vol, solidObj=None):
+    # vol is the <volume> or <assembly> element of part
+    if hasher is None:
+        return
+    setStringProperty(part, "GDMLVolName", vol.get("name"))
+    setStringProperty(part, "GDMLVolumeHash", hasher.volumeHash(vol))
+    if vol.tag == "volume":
+        solidHash = hasher.solidHash(vol)
+        setStringProperty(part, "GDMLSolidHash", solidHash)
+        if solidObj is not None:
+            setStringProperty(solidObj, "GDMLHash", solidHash)
+
+
+def materialHashes(hasher):
+    return {
+        name: hasher.elementHash(elem)
+        for name, elem in hasher.materials.items()
+        if name is not None
+    }
+
+
+def setWorldHashes(hasher, world, filename):
+    if hasher is None:
+        return
+    setStringProperty(world, "GDMLSource", filename)
+    if not hasattr(world, "GDMLMaterialHashes"):
+        world.addProperty(
+            "App::PropertyMap", "GDMLMaterialHashes", "GDML", "Materials"
+        )
+        world.setEditorMode("GDMLMaterialHashes", 2)
+    world.GDMLMaterialHashes = materialHashes(hasher)
+
+
+class GDMLUpdater:
+    def __init__(self, doc, hasher):
+        from .PhysVolDict import physVolDict
+
+        self.doc = doc
+        self.hasher = hasher
+        self.volDict = physVolDict()
+        self.visited = set()
+        self.solids = 0
+        self.volumes = 0
+        self.materials = 0
+        self.defines = 0
+
+    def removeTree(self, obj):
+        # remove obj and everything it groups, unless linked elsewhere
+        for user in obj.InList:
+            if user.TypeId == "App::Link" and user.LinkedObject == obj:
+                print(f"{obj.Label} still linked from {user.Label} - kept")
+                return
+        if hasattr(obj, "Group"):
+            for child in list(obj.Group):
+                self.removeTree(child)
+        self.doc.removeObject(obj.Name)
+
+    def updateDefines(self, define):
+        # refresh the define groups, changed values are set in place
+        from .GDMLObjects import GDMLconstant, GDMLvariable, GDMLquantity
+
+        classes = {
+            "constant": GDMLconstant,
+            "variable": GDMLvariable,
+            "quantity": GDMLquantity,
+        }
+        for grpName, tag, props in defineGroups:
+            grp = self.doc.getObject(grpName)
+            existing = {}
+            if grp is not None:
+                for obj in grp.Group:
+                    if hasattr(obj, "name"):
+                        existing[obj.name] = obj
+            for elem in define.findall(tag):
+                name = str(elem.attrib.get("name"))
+                values = [elem.attrib.get(p) for p in props]
+                obj = existing.pop(name, None)
+                if obj is None:
+                    if grp is None:
+                        grp = self.doc.addObject(
+                            "App::DocumentObjectGroupPython", grpName
+                        )
+                    obj = grp.newObject(
+                        "App::DocumentObjectGroupPython", name
+                    )
+                    classes[tag](obj, name, *values)
+                    self.defines += 1
+                    continue
+                changed = False
+                for prop, value in zip(props, values):
+                    if value is not None and getattr(obj, prop) != value:
+                        setattr(obj, prop, value)
+                        changed = True
+                if changed:
+                    self.defines += 1
+            # defines no longer in the file
+            for obj in existing.values():
+                self.doc.removeObject(obj.Name)
+                self.defines += 1
+
+    def isVolPart(self, obj):
+        return obj.TypeId in ["App::Part", "App::Link"]
+
+    def updateMaterials(self, world):
+        from lxml import etree
+        from .importGDML import processMaterialsElement
+
+        old = dict(getattr(world, "GDMLMaterialHashes", {}))
+        new = materialHashes(self.hasher)
+        changed = [n for n, h in new.items() if old.get(n) != h]
+        if len(changed) == 0:
+            return
+        mats = etree.Element("materials")
+        for name in changed:
+            for obj in self.doc.getObjectsByLabel(name):
+                if obj.TypeId == "App::DocumentObjectGroupPython":
+                    self.removeTree(obj)
+            mats.append(etree.fromstring(
+                etree.tostring(self.hasher.materials[name], with_tail=False)
+            ))
+        processMaterialsElement(self.doc, mats)
+        self.materials = len(changed)
+
+    def replaceSolid(self, part, vol):
+        from .importGDML import getVolColour, createVolSolid
+
+        print(f"Update solid of volume {vol.get('name')}")
+        for obj in list(part.Group):
+            if not self.isVolPart(obj):
+                self.removeTree(obj)
+        kept = list(part.Group)
+        solidObj = createVolSolid(vol, part, getVolColour(vol), 1)
+        # solid back to Group[0] as on import, export looks for it there
+        # (isContainer, assemblyHeads)
+        added = [obj for obj in part.Group if obj not in kept]
+        if len(added) > 0 and len(kept) > 0:
+            part.Group = added + kept
+        if solidObj is not None:
+            setStringProperty(
+                solidObj, "GDMLHash", self.hasher.solidHash(vol)
+            )
+        self.solids += 1
+
+    def rebuildVolume(self, part, elem):
+        # recreate the physvols etc. reusing unchanged child volumes
+        from . import GDMLShared
+        from .importGDML import parsePhysVol, processReplica, processParamvol
+        from .GDMLObjects import GDMLsolid
+
+        print(f"Update structure of volume {elem.get('name')}")
+        oldParts = {}
+        for obj in list(part.Group):
+            if obj.TypeId == "App::Part" and hasattr(obj, "GDMLVolName"):
+                part.removeObject(obj)
+                oldParts.setdefault(obj.GDMLVolName, obj)
+            elif obj.TypeId in ["App::Part", "App::Link"]:
+                # links, not expanded & replica parts
+                self.removeTree(obj)
+            elif obj.TypeId == "Part::FeaturePython" and not isinstance(
+                getattr(obj, "Proxy", None), GDMLsolid
+            ):
+                # replica arrays
+                self.removeTree(obj)
+        for pv in elem.findall("physvol"):
+            volRef = GDMLShared.getRef(pv, "volumeref")
+            child = oldParts.pop(volRef, None)
+            if child is not None:
+                part.addObject(child)
+                child.Placement = GDMLShared.getPlacement(pv)
+                self.volDict.addEntry(pv.get("name"), child)
+                self.updateVolume(child, volRef)
+            else:
+                parsePhysVol(
+                    1, self.doc, self.volDict, elem.tag == "volume",
+                    part, pv, -1, 1
+                )
+        if elem.find("replicavol") is not None:
+            processReplica(1, self.doc, elem, self.volDict, part, -1, 1)
+        paramvol = elem.find("paramvol")
+        if paramvol is not None:
+            processParamvol(elem, part, paramvol)
+        for obj in oldParts.values():
+            self.removeTree(obj)
+        setStringProperty(
+            part, "GDMLVolumeHash", self.hasher.volumeHash(elem)
+        )
+        self.volumes += 1
+
+    def updateVolume(self, part, name):
+        from .importGDML import structureIndex
+
+        if name in self.visited:
+            return
+        self.visited.add(name)
+        elem = structureIndex.find(name, "volume")
+        if elem is None:
+            elem = structureIndex.find(name, "assembly")
+        if elem is None:
+            print(f"Volume {name} no longer defined - left unchanged")
+            return
+        if elem.tag == "volume":
+            solidHash = self.hasher.solidHash(elem)
+            if getattr(part, "GDMLSolidHash", None) != solidHash:
+                self.replaceSolid(part, elem)
+                setStringProperty(part, "GDMLSolidHash", solidHash)
+        if getattr(part, "GDMLVolumeHash", None) != self.hasher.volumeHash(
+            elem
+        ):
+            self.rebuildVolume(part, elem)
+        else:
+            for child in part.Group:
+                if child.TypeId == "App::Part" and hasattr(
+                    child, "GDMLVolName"
+                ):
+                    self.updateVolume(child, child.GDMLVolName)
+
+
+def updateFromGDML(doc, filename, world=None):
+    # Update document previously imported from GDML with file filename
+    import time
+    from . import importGDML, GDMLShared, preProcessLoops
+
+    startTime = time.perf_counter()
+    if world is None:
+        for obj in doc.Objects:
+            if obj.TypeId == "App::Part" and hasattr(obj, "GDMLVolumeHash"):
+                world = obj
+                break
+    if world is None:
+        print("No volume imported from GDML with content hashes found")
+        print("Set the preference for Update from GDML before importing")
+        return
+    print(f"Update {world.Label} from {filename}")
+    importGDML.doc = doc
+    # <file> physvols are relative to the file being read now
+    importGDML.pathName = os.path.dirname(os.path.normpath(filename))
+    etree, root = importGDML.setupEtree(filename)
+    importGDML.root = root
+    importGDML.setup = root.find("setup")
+    importGDML.extension = root.find("extension")
+    define = root.find("define")
+    importGDML.define = define
+    if define is not None:
+        # evaluate the defines without adding them to the document
+        GDMLShared.setDefine(define)
+        GDMLShared.evaluateDefines()
+        preProcessLoops.preprocessLoops(root)
+    importGDML.indexSections(root)
+    importGDML.materials = root.find("materials")
+    importGDML.solids = root.find("solids")
+    importGDML.structure = root.find("structure")
+
+    hasher = GDMLHasher(root)
+    importGDML.gdmlHasher = hasher
+    updater = GDMLUpdater(doc, hasher)
+    if define is not None:
+        updater.updateDefines(define)
+    updater.updateMaterials(world)
+    updater.updateVolume(world, getattr(world, "GDMLVolName", world.Name))
+    setWorldHashes(hasher, world, filename)
+    importGDML.gdmlHasher = None
+    doc.recompute()
+    print(
+        f"Updated {updater.solids} solids, {updater.volumes} volume "
+        f"structures, {updater.materials} materials, {updater.defines} "
+        f"defines in {time.perf_counter() - startTime:0.4f} seconds"
+    )
@@ -2,18 +2,16 @@ from setuptools import setup
 #from pygears import __version__
 __version__ = '0.1'
 
-import os
-
 def mysetup(requires) :
    setup(name='FreeCad_GDML_Workbench',
       version=str(__version__),
-      packages=['freecad','lxml']
+      packages=['freecad','freecad.gdml','lxml'],
       maintainer="keithsloan52",
       maintainer_email="keith@sloan-home.co.uk",
       url="https://github.com/KeithSloan/FreeCAD_GDML_Workbench",
       description="GDML Workbench for FreeCAD",
       install_requires=[requires],
-      include_package_data=True
+      scripts=['CommandLine/gdmlBatch.py'],
       include_package_data=True)
 
 # Still not clear if under linux one can just install lxml with pip